@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+按读数稳定性调整设备上报间隔
+=====================================
+设备按固定频率上报，读数平稳时也一样；每条读数都要经过解析、状态查询、写库和 Redis 发布。
+网关根据已经收到的读数为每台设备计算稳定性，用 set_interval 指令 ({"command": "set_interval", "interval": 秒, ...}，
+主题 stm32/command/{client_id}) 调整上报间隔:
+
+- 接近阈值 (自动模式下温度距风扇开/关阈值 temp_margin 以内、光照距补光阈值 light_margin 以内)，
+  或按当前温度变化趋势在两个上报间隔内会越过风扇阈值: 改为 min_interval，保证自动控制的响应速度
+- 读数波动大 (相邻读数变化的指数滑动平均超过 VOLATILE_SCORE): 恢复 base_interval (设备固件的默认间隔)
+- 连续 WARMUP_READINGS 条以上读数平稳 (低于 STABLE_SCORE): 间隔加倍，最长 max_interval
+- 放慢间隔至少相隔 min_gap 秒，加快 (包括接近阈值时) 立即下发
+- 设备实际上报明显快于下发的间隔 (重启后恢复了固件默认值，或指令丢失) 时，每 min_gap 秒重新下发一次
+
+变化量按 CHANGE_STEPS 归一化 (温度 0.5°C、湿度 2%、光照 30 lux 记为 1)，三项取最大值。
+网关在 gateway/stages.py 的 AdaptiveRateStage 中使用，并相应延长设备在线判定的超时 (见 liveness.py)。
+"""
+import time
+
+DEFAULT_BASE_INTERVAL = 10.0
+DEFAULT_MIN_INTERVAL = 2.0
+DEFAULT_MAX_INTERVAL = 60.0
+CHANGE_STEPS = (0.5, 2.0, 30.0)  # 温度、湿度、光照
+STABLE_SCORE = 0.2
+VOLATILE_SCORE = 1.0
+WARMUP_READINGS = 5
+# 变化量和温度趋势的指数滑动平均系数
+SMOOTHING = 0.3
+
+
+class DeviceRate:
+    """一台设备的上报间隔和最近读数的变化情况"""
+    __slots__ = ('interval', 'last_values', 'last_ts', 'score', 'slope', 'gap', 'readings', 'last_command')
+
+    def __init__(self, interval):
+        self.interval = interval      # 当前 (已下发或固件默认) 的上报间隔
+        self.last_values = None
+        self.last_ts = None
+        self.score = 0.0              # 归一化变化量的滑动平均
+        self.slope = 0.0              # 温度变化趋势 (°C/秒) 的滑动平均
+        self.gap = None               # 实际上报间隔的滑动平均
+        self.readings = 0             # 上次调整以来的读数条数
+        self.last_command = None
+
+
+class RateController:
+    """
+    observe() 处理一条读数，需要调整间隔时返回新的间隔 (秒)，否则返回 None。
+    同一设备的读数需要按顺序调用 (网关中同一设备总在同一个站点工作线程中处理)。
+    """
+
+    def __init__(self, base_interval=DEFAULT_BASE_INTERVAL, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 temp_margin=1.0, light_margin=20.0, min_gap=60.0, clock=time.time):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.temp_margin = temp_margin
+        self.light_margin = light_margin
+        self.min_gap = min_gap
+        self.clock = clock
+        self.devices = {}
+
+    def near_threshold(self, state, temperature, light_intensity, thresholds):
+        fan_on, fan_off = thresholds['fan_on_temp'], thresholds['fan_off_temp']
+        if abs(light_intensity - thresholds['light_on_lux']) <= self.light_margin:
+            return True
+        if min(abs(temperature - fan_on), abs(temperature - fan_off)) <= self.temp_margin:
+            return True
+        # 按当前趋势，两个上报间隔内会越过风扇阈值
+        horizon = 2 * state.interval
+        for threshold in (fan_on, fan_off):
+            gap = threshold - temperature
+            if gap * state.slope > 0 and gap / state.slope < horizon:
+                return True
+        return False
+
+    def target(self, state, temperature, light_intensity, thresholds, auto):
+        if auto and self.near_threshold(state, temperature, light_intensity, thresholds):
+            return self.min_interval
+        if state.score >= VOLATILE_SCORE or state.interval < self.base_interval:
+            # 波动大，或已经离开阈值附近: 回到默认间隔
+            return self.base_interval
+        if state.score < STABLE_SCORE and state.readings >= WARMUP_READINGS:
+            return min(self.max_interval, state.interval * 2)
+        return state.interval
+
+    def observe(self, client_id, temperature, humidity, light_intensity, thresholds, auto=True, now=None):
+        now = self.clock() if now is None else now
+        state = self.devices.get(client_id)
+        if state is None:
+            state = self.devices[client_id] = DeviceRate(self.base_interval)
+        values = (temperature, humidity, light_intensity)
+        if state.last_values is not None:
+            change = max(abs(v - old) / step for v, old, step in zip(values, state.last_values, CHANGE_STEPS))
+            state.score += SMOOTHING * (change - state.score)
+            elapsed = now - state.last_ts
+            # 间隔过短 (积压后连续到达、设备重发) 时算出的变化速率和上报间隔都不可信
+            if elapsed >= self.min_interval / 2:
+                state.slope += SMOOTHING * ((temperature - state.last_values[0]) / elapsed - state.slope)
+                state.gap = elapsed if state.gap is None else state.gap + SMOOTHING * (elapsed - state.gap)
+        state.last_values, state.last_ts = values, now
+        state.readings += 1
+
+        target = self.target(state, temperature, light_intensity, thresholds, auto)
+        recent = state.last_command is not None and now - state.last_command < self.min_gap
+        if target == state.interval:
+            # 已下发过的间隔没有生效: 重新下发
+            if state.last_command is None or recent or state.readings < WARMUP_READINGS \
+                    or state.gap is None or state.gap >= state.interval / 2:
+                return None
+        elif target > state.interval and recent:
+            return None
+        state.interval, state.last_command, state.readings = target, now, 0
+        return target
+
+    def restore(self, intervals, now=None):
+        """网关重启时恢复之前下发的间隔 {client_id: 秒}"""
+        now = self.clock() if now is None else now
+        for client_id, interval in intervals.items():
+            state = self.devices[client_id] = DeviceRate(interval)
+            state.last_command = now
+
+    def interval(self, client_id):
+        state = self.devices.get(client_id)
+        return state.interval if state is not None else self.base_interval
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+历史读数归档为列式数据块
+=====================================
+把 sensor_readings 中采集时间早于保留期的读数按 id 顺序分批读出，按设备分组编码为压缩的列式数据块
+(codec.encode_block: 量化 + 增量 + zigzag 变长整数 + zlib)，写入 reading_blocks 表，并在同一事务中删除原始行。
+一条读数在 sensor_readings 中约占 40~60 字节 (不含索引)，编码后通常只需几个字节。
+
+- 按采集时间而不是 id 选择读数: 批量导入 (bulk_import.py)、暂存回放、边缘同步补传的旧读数 id 较大，
+  排在较新的读数之后，同样会被归档
+- 归档即移出 sensor_readings，中断后重新运行只会处理剩下的读数；每个数据块写入前先解码校验
+- read_archived() 按设备和时间范围读回归档数据，Web 端的 /api/chart_data/range 合并归档和 sensor_readings 中的读数
+
+用法:
+    python archive_blocks.py --older-than-days 30            # 归档30天前的读数
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import codec
+import config
+import iot_log
+from backends import READING_BLOCKS_DDL
+
+log = iot_log.get_logger('archive')
+
+# 每批从 sensor_readings 读取的行数，以及一个数据块最多包含的读数
+CHUNK_ROWS = 50000
+BLOCK_ROWS = 4096
+# 每条 DELETE 语句删除的读数条数
+DELETE_IDS = 1000
+
+UPSERT_BLOCK_SQL = """INSERT INTO reading_blocks (client_id, first_id, last_id, start_time, end_time, row_count, data)
+                      VALUES (%s, %s, %s, %s, %s, %s, %s)
+                      ON DUPLICATE KEY UPDATE last_id = VALUES(last_id), start_time = VALUES(start_time), end_time = VALUES(end_time),
+                                              row_count = VALUES(row_count), data = VALUES(data)"""
+
+
+def archive_once(conn, cutoff, after=0, chunk_rows=CHUNK_ROWS):
+    """
+    归档 id 大于 after、采集时间早于 cutoff 的一批读数 (按 id 顺序)，写入数据块并删除原始行。
+    返回 (归档的读数条数, 数据块数, 数据块字节数, 本批最大 id)，下一批从该 id 之后继续。
+    """
+    with conn.cursor(dictionary=True) as cursor:
+        cursor.execute("SELECT * FROM sensor_readings WHERE id > %s AND timestamp < %s ORDER BY id LIMIT %s", (after, cutoff, chunk_rows))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0, 0, 0, after
+        by_device = {}
+        for row in rows:
+            by_device.setdefault(row['client_id'], []).append(row)
+        blocks = []
+        for client_id, device_rows in by_device.items():
+            for i in range(0, len(device_rows), BLOCK_ROWS):
+                part = device_rows[i:i + BLOCK_ROWS]
+                data = codec.encode_block(part)
+                if [r['id'] for r in codec.decode_block(client_id, data)] != [r['id'] for r in part]:
+                    raise ValueError(f"设备 {client_id} 的数据块校验失败 (id {part[0]['id']}~{part[-1]['id']})")
+                blocks.append((client_id, part[0]['id'], part[-1]['id'], min(r['timestamp'] for r in part),
+                               max(r['timestamp'] for r in part), len(part), data))
+        cursor.executemany(UPSERT_BLOCK_SQL, blocks)
+        # 按 id 删除: 选出后才提交的读数 (例如同时进行的批量导入) 不会在没有归档的情况下被删掉
+        for i in range(0, len(rows), DELETE_IDS):
+            ids = [row['id'] for row in rows[i:i + DELETE_IDS]]
+            cursor.execute(f"DELETE FROM sensor_readings WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+    conn.commit()
+    return len(rows), len(blocks), sum(len(block[-1]) for block in blocks), rows[-1]['id']
+
+
+def read_archived(cursor, client_id, start, end):
+    """读回某设备在 [start, end) 内的归档读数 (字典游标)，按 id 排序"""
+    cursor.execute("SELECT data FROM reading_blocks WHERE client_id = %s AND start_time < %s AND end_time >= %s ORDER BY first_id",
+                   (client_id, end, start))
+    records = []
+    for row in cursor.fetchall():
+        records.extend(r for r in codec.decode_block(client_id, row['data']) if start <= r['timestamp'] < end)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把历史读数归档为列式数据块')
+    parser.add_argument('--older-than-days', type=float, default=30.0, help='归档多少天以前的读数')
+    args = parser.parse_args()
+    iot_log.setup_logging()
+    tenant_config, _ = config.load_tenant()
+    conn = mysql.connector.connect(**tenant_config['mysql'])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(READING_BLOCKS_DDL)
+        conn.commit()
+        cutoff = datetime.now() - timedelta(days=args.older_than_days)
+        total_rows = total_blocks = total_bytes = after = 0
+        while True:
+            rows, blocks, size, after = archive_once(conn, cutoff, after)
+            if not rows:
+                break
+            total_rows, total_blocks, total_bytes = total_rows + rows, total_blocks + blocks, total_bytes + size
+            log.info("📦 已归档 %d 条读数 (%d 个数据块, %.1f 字节/条)", total_rows, total_blocks, total_bytes / total_rows)
+        log.info("✅ 归档完成: %d 条读数 -> %d 个数据块, 共 %d 字节", total_rows, total_blocks, total_bytes)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
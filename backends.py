@@ -0,0 +1,884 @@
+# -*- coding: utf-8 -*-
+"""
+网关可插拔后端
+=====================================
+MqttGateway 通过三类后端与外部服务交互，便于替换实现:
+- 存储 (Storage):       查询设备最新状态、写入读数        -> MySQLStorage / SQLiteStorage (边缘网关) / MemoryStorage
+- 发布订阅 (PubSub):    把新记录推送给 Web 端 (SSE)       -> RedisPubSub / MemoryPubSub
+- MQTT 传输 (Transport): 订阅设备数据、下发控制指令         -> PahoTransport / MemoryTransport (配合 MemoryBroker)
+
+Memory* 实现全部在进程内完成，不需要 MySQL/Redis/MQTT 代理，
+用于在笔记本上对解析、平滑度检查、规则和批量写入做可重复的微基准测试。
+mysql-connector / redis / paho-mqtt 只在对应的生产后端被创建时才导入。
+"""
+import itertools
+import random
+import threading
+import time
+from datetime import datetime
+
+import iot_log
+import metrics
+
+log = iot_log.get_logger('backends')
+
+
+class StorageError(Exception):
+    """存储后端不可用或写入失败"""
+
+
+class CircuitBreaker:
+    """
+    熔断器: 连续失败 failure_threshold 次后断开，在退避时间内直接拒绝请求 (不再尝试连接)，
+    退避时间按指数增长 (base_delay * 2^n，上限 max_delay) 并带随机抖动；
+    退避结束后放行一次试探请求，成功则恢复，失败则继续加倍退避。
+    """
+
+    def __init__(self, failure_threshold=3, base_delay=1.0, max_delay=60.0, jitter=0.2):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.failures >= self.failure_threshold
+
+    def allow(self):
+        """当前是否允许访问后端"""
+        return not self.is_open or time.monotonic() >= self.open_until
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                exponent = self.failures - self.failure_threshold
+                delay = min(self.max_delay, self.base_delay * (2 ** exponent))
+                delay *= 1 + random.uniform(-self.jitter, self.jitter)
+                self.open_until = time.monotonic() + delay
+                return delay
+        return 0.0
+
+
+# =============================================================================
+# 存储后端
+# =============================================================================
+class Storage:
+    """存储后端接口"""
+
+    def setup(self):
+        """创建所需的数据表 (如果不存在)"""
+
+    def latest_status(self, client_id):
+        """返回 {'fan_status', 'light_status', 'control_mode'}，设备不存在时返回 None"""
+        raise NotImplementedError
+
+    def insert_reading(self, client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode):
+        """写入一条读数，返回完整记录 (包含 id 和 timestamp)"""
+        raise NotImplementedError
+
+    def insert_many(self, rows):
+        """
+        批量写入读数 (用于回放本地暂存文件)，rows 中每项为包含 READING_COLUMNS 各字段的字典，
+        timestamp 使用原始采集时间。整批在一个事务中完成。
+        """
+        raise NotImplementedError
+
+    def insert_readings(self, rows):
+        """
+        批量写入实时读数 (网关批量写库)，rows 同 insert_many，整批在一个事务中完成并同步更新 device_latest；
+        返回带 id 的完整记录列表，顺序与 rows 相同
+        """
+        raise NotImplementedError
+
+    def register_device(self, client_id, site):
+        """记录设备所属站点 (来自上报主题 site/{site}/data)，温室分配保持不变"""
+
+    def close(self):
+        pass
+
+
+READING_COLUMNS = ('client_id', 'temperature', 'humidity', 'light_intensity', 'fan_status', 'light_status', 'control_mode', 'timestamp')
+
+# 指定采集时间的写入 (回放、批量控制)，配合 executemany 使用
+INSERT_READINGS_SQL = f"INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)}) VALUES ({', '.join(['%s'] * len(READING_COLUMNS))})"
+
+# executemany 被改写为一条多行 INSERT，lastrowid 为第一行的ID，之后各行依次加 auto_increment_increment
+# (通常为 1，Galera/多主复制时大于 1)
+AUTO_INCREMENT_STEP_SQL = "SELECT @@auto_increment_increment AS step"
+
+
+def auto_increment_step(cursor):
+    """读取多行 INSERT 中相邻两行的自增ID间隔 (普通游标或字典游标)"""
+    cursor.execute(AUTO_INCREMENT_STEP_SQL)
+    row = cursor.fetchone()
+    return int(row['step'] if isinstance(row, dict) else row[0])
+
+
+SENSOR_READINGS_DDL = '''
+    CREATE TABLE IF NOT EXISTS sensor_readings (
+        id INT AUTO_INCREMENT PRIMARY KEY, client_id VARCHAR(255) NOT NULL,
+        temperature DECIMAL(5,2) NOT NULL, humidity DECIMAL(4,1) NOT NULL,
+        light_intensity DECIMAL(7,1) NOT NULL, fan_status TINYINT(1) DEFAULT 0,
+        light_status TINYINT(1) DEFAULT 0, control_mode VARCHAR(10) DEFAULT 'auto',
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+INSERT_READING_SQL = """INSERT INTO sensor_readings (client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+
+# 每个设备一行的"最新读数"表，随每次写入同步更新 (网关写入读数、Web端切换控制状态)。
+# 查询设备最新状态和 /api/devices/latest 都走主键查找，不再对 sensor_readings 做
+# ORDER BY timestamp DESC LIMIT 1 / GROUP BY client_id / ROW_NUMBER() 全表查询。
+DEVICE_LATEST_DDL = '''
+    CREATE TABLE IF NOT EXISTS device_latest (
+        client_id VARCHAR(255) NOT NULL PRIMARY KEY, reading_id INT NOT NULL,
+        temperature DECIMAL(5,2) NOT NULL, humidity DECIMAL(4,1) NOT NULL,
+        light_intensity DECIMAL(7,1) NOT NULL, fan_status TINYINT(1) DEFAULT 0,
+        light_status TINYINT(1) DEFAULT 0, control_mode VARCHAR(10) DEFAULT 'auto',
+        timestamp DATETIME NOT NULL
+    )
+'''
+
+DEVICE_LATEST_COLUMNS = ('client_id', 'reading_id', 'temperature', 'humidity', 'light_intensity', 'fan_status', 'light_status', 'control_mode', 'timestamp')
+
+UPSERT_DEVICE_LATEST_SQL = (
+    f"INSERT INTO device_latest ({', '.join(DEVICE_LATEST_COLUMNS)}) VALUES ({', '.join(['%s'] * len(DEVICE_LATEST_COLUMNS))}) "
+    "ON DUPLICATE KEY UPDATE " + ', '.join(f"{c} = VALUES({c})" for c in DEVICE_LATEST_COLUMNS[1:])
+)
+
+# 从 sensor_readings 重建 device_latest (首次建表回填、批量回放/导入之后)，按采集时间取每个设备最新的一行
+REFRESH_DEVICE_LATEST_SQL = f'''
+    REPLACE INTO device_latest ({', '.join(DEVICE_LATEST_COLUMNS)})
+    SELECT client_id, id, temperature, humidity, light_intensity, fan_status, light_status, control_mode, timestamp FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY timestamp DESC, id DESC) AS rn
+        FROM sensor_readings {{where}}
+    ) ranked WHERE rn = 1
+'''
+
+
+# 设备分组 (站点/温室)，见 device_groups.py
+DEVICE_GROUPS_DDL = '''
+    CREATE TABLE IF NOT EXISTS device_groups (
+        client_id VARCHAR(255) NOT NULL PRIMARY KEY,
+        site VARCHAR(64) NOT NULL DEFAULT 'default',
+        greenhouse VARCHAR(64) NOT NULL DEFAULT 'default',
+        INDEX idx_site_greenhouse (site, greenhouse)
+    )
+'''
+
+REGISTER_DEVICE_SQL = "INSERT INTO device_groups (client_id, site) VALUES (%s, %s) ON DUPLICATE KEY UPDATE site = VALUES(site)"
+ASSIGN_GROUP_SQL = "INSERT INTO device_groups (client_id, site, greenhouse) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE site = VALUES(site), greenhouse = VALUES(greenhouse)"
+
+# 归档的列式数据块 (codec.encode_block)，同一设备按 id 排序的一段读数一行，见 archive_blocks.py
+READING_BLOCKS_DDL = '''
+    CREATE TABLE IF NOT EXISTS reading_blocks (
+        client_id VARCHAR(255) NOT NULL, first_id INT NOT NULL, last_id INT NOT NULL,
+        start_time DATETIME NOT NULL, end_time DATETIME NOT NULL, row_count INT NOT NULL,
+        data MEDIUMBLOB NOT NULL,
+        PRIMARY KEY (client_id, first_id),
+        INDEX idx_blocks_time (client_id, start_time)
+    )
+'''
+
+
+def device_latest_values(record):
+    """完整记录 (含 id) -> UPSERT_DEVICE_LATEST_SQL 的参数"""
+    return (record['client_id'], record['id']) + tuple(record[c] for c in DEVICE_LATEST_COLUMNS[2:])
+
+
+def upsert_device_latest(cursor, record):
+    """用一条刚写入的完整记录 (含 id) 更新 device_latest，需与写入在同一事务中执行"""
+    cursor.execute(UPSERT_DEVICE_LATEST_SQL, device_latest_values(record))
+
+
+def refresh_device_latest(cursor, client_ids=None):
+    """按 sensor_readings 重建指定设备 (默认全部设备) 的 device_latest 行"""
+    if client_ids is None:
+        cursor.execute(REFRESH_DEVICE_LATEST_SQL.format(where=''))
+    elif client_ids:
+        client_ids = list(client_ids)
+        where = f"WHERE client_id IN ({', '.join(['%s'] * len(client_ids))})"
+        cursor.execute(REFRESH_DEVICE_LATEST_SQL.format(where=where), client_ids)
+
+
+class MySQLStorage(Storage):
+    """
+    MySQL 存储，复用一条长连接 (不再每条消息新建连接)。
+    出错时关闭连接并抛出 StorageError；重连受熔断器控制，MySQL 故障期间
+    不会每条消息都发起一次连接，而是按指数退避间隔试探。
+    """
+
+    def __init__(self, config, breaker=None):
+        import mysql.connector
+        self._mysql = mysql.connector
+        self.config = dict(config)
+        self.conn = None
+        self.id_step = 1
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self.conn is None or not self.conn.is_connected():
+            if not self.breaker.allow():
+                raise StorageError("数据库熔断中，暂不重连")
+            try:
+                self.conn = self._mysql.connect(**{'connection_timeout': 5, **self.config})
+                self.conn.autocommit = False
+                with self.conn.cursor() as cursor:
+                    self.id_step = auto_increment_step(cursor)
+            except self._mysql.Error as e:
+                self.conn = None
+                delay = self.breaker.record_failure()
+                raise StorageError(f"数据库连接失败 (下次重试间隔 {delay:.1f}s): {e}") from e
+            self.breaker.record_success()
+        return self.conn
+
+    def _fail(self, message, error):
+        # 查询/写入失败: 关闭连接并计入熔断器，然后抛出 StorageError
+        self._reset()
+        self.breaker.record_failure()
+        return StorageError(f"{message}: {error}")
+
+    def _reset(self):
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+    def setup(self):
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(SENSOR_READINGS_DDL)
+                    cursor.execute(DEVICE_LATEST_DDL)
+                    cursor.execute(DEVICE_GROUPS_DDL)
+                    cursor.execute("SELECT EXISTS(SELECT 1 FROM device_latest)")
+                    if not cursor.fetchone()[0]:
+                        # 新建的 device_latest 为空，从已有历史数据回填
+                        refresh_device_latest(cursor)
+                conn.commit()
+            except self._mysql.Error as e:
+                raise self._fail("创建数据表失败", e) from e
+
+    def insert_readings(self, rows):
+        if not rows:
+            return []
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.executemany(INSERT_READINGS_SQL, [tuple(row[c] for c in READING_COLUMNS) for row in rows])
+                    records = [dict(row, id=cursor.lastrowid + i * self.id_step) for i, row in enumerate(rows)]
+                    # 多行 upsert 按顺序执行，同一设备以批内最后一条为准
+                    cursor.executemany(UPSERT_DEVICE_LATEST_SQL, [device_latest_values(r) for r in records])
+                conn.commit()
+                return records
+            except self._mysql.Error as e:
+                raise self._fail("批量写入失败", e) from e
+
+    def register_device(self, client_id, site):
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(REGISTER_DEVICE_SQL, (client_id, site))
+                conn.commit()
+            except self._mysql.Error as e:
+                raise self._fail("登记设备站点失败", e) from e
+
+    def latest_status(self, client_id):
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn.cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT fan_status, light_status, control_mode FROM device_latest WHERE client_id = %s", (client_id,))
+                    row = cursor.fetchone()
+                # 结束只读事务，保证下一次查询能看到其他进程 (Web端) 提交的新状态
+                conn.rollback()
+                return row
+            except self._mysql.Error as e:
+                raise self._fail("查询设备状态失败", e) from e
+
+    def insert_reading(self, client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode):
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn.cursor(dictionary=True) as cursor:
+                    cursor.execute(INSERT_READING_SQL, (client_id, temperature, humidity, light_intensity,
+                                                        1 if fan_status else 0, 1 if light_status else 0, control_mode))
+                    new_id = cursor.lastrowid
+                    cursor.execute("SELECT * FROM sensor_readings WHERE id = %s", (new_id,))
+                    record = cursor.fetchone()
+                    upsert_device_latest(cursor, record)
+                conn.commit()
+                return record
+            except self._mysql.Error as e:
+                raise self._fail("数据库插入操作失败", e) from e
+
+    def insert_many(self, rows):
+        if not rows:
+            return
+        values = [tuple(row[c] for c in READING_COLUMNS) for row in rows]
+        with self._lock:
+            conn = self._connection()
+            try:
+                # mysql-connector 会把 INSERT 的 executemany 改写为一条多行 INSERT
+                with conn.cursor() as cursor:
+                    cursor.executemany(INSERT_READINGS_SQL, values)
+                    refresh_device_latest(cursor, {row['client_id'] for row in rows})
+                conn.commit()
+            except self._mysql.Error as e:
+                raise self._fail("批量写入失败", e) from e
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+
+# =============================================================================
+# SQLite 存储 (边缘网关)
+# =============================================================================
+# 与 MySQL 表结构一致，时间戳以 'YYYY-MM-DD HH:MM:SS' 文本保存 (按字符串排序即按时间排序)。
+# AUTOINCREMENT 保证清理已同步的旧数据后ID不会被重复使用，同步进度按ID记录。
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sensor_readings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, client_id TEXT NOT NULL,
+        temperature REAL NOT NULL, humidity REAL NOT NULL, light_intensity REAL NOT NULL,
+        fan_status INTEGER DEFAULT 0, light_status INTEGER DEFAULT 0, control_mode TEXT DEFAULT 'auto',
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_readings_client_ts ON sensor_readings (client_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_readings_ts ON sensor_readings (timestamp);
+    CREATE TABLE IF NOT EXISTS device_latest (
+        client_id TEXT NOT NULL PRIMARY KEY, reading_id INTEGER NOT NULL,
+        temperature REAL NOT NULL, humidity REAL NOT NULL, light_intensity REAL NOT NULL,
+        fan_status INTEGER DEFAULT 0, light_status INTEGER DEFAULT 0, control_mode TEXT DEFAULT 'auto',
+        timestamp TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS device_groups (
+        client_id TEXT NOT NULL PRIMARY KEY, site TEXT NOT NULL DEFAULT 'default',
+        greenhouse TEXT NOT NULL DEFAULT 'default', synced INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS sync_state (name TEXT NOT NULL PRIMARY KEY, last_id INTEGER NOT NULL);
+"""
+
+SQLITE_INSERT_READING_SQL = f"INSERT INTO sensor_readings ({', '.join(READING_COLUMNS)}) VALUES ({', '.join(['?'] * len(READING_COLUMNS))})"
+SQLITE_UPSERT_DEVICE_LATEST_SQL = (
+    f"INSERT INTO device_latest ({', '.join(DEVICE_LATEST_COLUMNS)}) VALUES ({', '.join(['?'] * len(DEVICE_LATEST_COLUMNS))}) "
+    "ON CONFLICT (client_id) DO UPDATE SET " + ', '.join(f"{c} = excluded.{c}" for c in DEVICE_LATEST_COLUMNS[1:])
+)
+SQLITE_REFRESH_DEVICE_LATEST_SQL = REFRESH_DEVICE_LATEST_SQL.replace('REPLACE INTO', 'INSERT OR REPLACE INTO')
+SQLITE_REGISTER_DEVICE_SQL = ("INSERT INTO device_groups (client_id, site, synced) VALUES (?, ?, 0) "
+                              "ON CONFLICT (client_id) DO UPDATE SET site = excluded.site, synced = 0")
+
+
+def _sqlite_timestamp(value):
+    """datetime / ISO 字符串 -> 'YYYY-MM-DD HH:MM:SS'"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value).replace('T', ' ')[:19]
+
+
+class SQLiteStorage(Storage):
+    """
+    SQLite 存储 (WAL 模式)，用于在边缘盒子上代替 MySQL 服务器。
+    - WAL + synchronous=NORMAL: 读写互不阻塞，每次提交不强制刷盘 (进程崩溃不丢数据，断电可能丢失最后几个事务)
+    - 批量写入在一个事务中完成；(client_id, timestamp) 和 timestamp 索引支撑按设备/按时间的查询和清理
+    - 记录同步进度 (sync_state)，由 edge_sync.EdgeSync 把新数据按批转发到中心 MySQL
+    """
+
+    def __init__(self, path):
+        import sqlite3
+        self._sqlite = sqlite3
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            raise StorageError(f"打开SQLite数据库 {path} 失败: {e}") from e
+
+    def _transaction(self, work):
+        """在一个事务中执行 work(conn)，出错时回滚并抛出 StorageError"""
+        with self._lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = work(self.conn)
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                self.conn.execute("COMMIT")
+                return result
+            except self._sqlite.Error as e:
+                raise StorageError(f"SQLite操作失败: {e}") from e
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            try:
+                return [dict(row) for row in self.conn.execute(sql, params)]
+            except self._sqlite.Error as e:
+                raise StorageError(f"SQLite查询失败: {e}") from e
+
+    @staticmethod
+    def _record(row):
+        record = dict(row)
+        record['timestamp'] = datetime.strptime(record['timestamp'], '%Y-%m-%d %H:%M:%S')
+        return record
+
+    def setup(self):
+        def work(conn):
+            for statement in SQLITE_SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            if conn.execute("SELECT NOT EXISTS(SELECT 1 FROM device_latest)").fetchone()[0]:
+                conn.execute(SQLITE_REFRESH_DEVICE_LATEST_SQL.format(where=''))
+        self._transaction(work)
+
+    def latest_status(self, client_id):
+        rows = self._query("SELECT fan_status, light_status, control_mode FROM device_latest WHERE client_id = ?", (client_id,))
+        return rows[0] if rows else None
+
+    def _insert(self, conn, rows):
+        records = []
+        for row in rows:
+            values = tuple(_sqlite_timestamp(row[c]) if c == 'timestamp' else row[c] for c in READING_COLUMNS)
+            record = dict(zip(READING_COLUMNS, values), id=conn.execute(SQLITE_INSERT_READING_SQL, values).lastrowid)
+            records.append(record)
+        # 同一设备以批内最后一条为准
+        conn.executemany(SQLITE_UPSERT_DEVICE_LATEST_SQL, [device_latest_values(r) for r in records])
+        return records
+
+    def insert_reading(self, client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode):
+        row = {'client_id': client_id, 'temperature': temperature, 'humidity': humidity, 'light_intensity': light_intensity,
+               'fan_status': 1 if fan_status else 0, 'light_status': 1 if light_status else 0,
+               'control_mode': control_mode, 'timestamp': datetime.now()}
+        return self._record(self._transaction(lambda conn: self._insert(conn, [row]))[0])
+
+    def insert_readings(self, rows):
+        if not rows:
+            return []
+        return [self._record(r) for r in self._transaction(lambda conn: self._insert(conn, rows))]
+
+    def insert_many(self, rows):
+        # 回放的数据可能早于已有的最新读数，按采集时间重建受影响设备的 device_latest
+        def work(conn):
+            conn.executemany(SQLITE_INSERT_READING_SQL, [tuple(_sqlite_timestamp(row[c]) if c == 'timestamp' else row[c]
+                                                              for c in READING_COLUMNS) for row in rows])
+            client_ids = list({row['client_id'] for row in rows})
+            conn.execute(SQLITE_REFRESH_DEVICE_LATEST_SQL.format(where=f"WHERE client_id IN ({', '.join(['?'] * len(client_ids))})"), client_ids)
+        if rows:
+            self._transaction(work)
+
+    def register_device(self, client_id, site):
+        self._transaction(lambda conn: conn.execute(SQLITE_REGISTER_DEVICE_SQL, (client_id, site)))
+
+    # --- 同步到中心数据库 (edge_sync.py) ---
+    def sync_position(self, name='central'):
+        rows = self._query("SELECT last_id FROM sync_state WHERE name = ?", (name,))
+        return rows[0]['last_id'] if rows else 0
+
+    def unsynced_readings(self, limit, name='central'):
+        """同步进度之后的一批读数 (按 id 排序，timestamp 为 datetime)"""
+        after = self.sync_position(name)
+        return [self._record(row) for row in self._query("SELECT * FROM sensor_readings WHERE id > ? ORDER BY id LIMIT ?", (after, limit))]
+
+    def mark_synced(self, last_id, name='central'):
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO sync_state (name, last_id) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id", (name, last_id)))
+
+    def sync_backlog(self, name='central'):
+        """尚未同步的读数条数 (按ID估算，已清理的数据不影响)"""
+        rows = self._query("SELECT COALESCE(MAX(id), 0) AS max_id FROM sensor_readings")
+        return max(0, rows[0]['max_id'] - self.sync_position(name))
+
+    def unsynced_devices(self):
+        return self._query("SELECT client_id, site FROM device_groups WHERE synced = 0")
+
+    def mark_devices_synced(self, devices):
+        # 同步期间站点又变化的设备 (site 不同) 保持未同步
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE device_groups SET synced = 1 WHERE client_id = ? AND site = ?", [(d['client_id'], d['site']) for d in devices]))
+
+    def prune(self, before, batch_size=5000, name='central'):
+        """删除已同步且采集时间早于 before 的读数，分批删除避免长事务；返回删除的条数"""
+        synced_id, before, deleted = self.sync_position(name), _sqlite_timestamp(before), 0
+        while True:
+            count = self._transaction(lambda conn: conn.execute(
+                "DELETE FROM sensor_readings WHERE id IN (SELECT id FROM sensor_readings WHERE id <= ? AND timestamp < ? LIMIT ?)",
+                (synced_id, before, batch_size)).rowcount)
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+    def close(self):
+        with self._lock:
+            try:
+                self.conn.close()
+            except self._sqlite.Error:
+                pass
+
+
+class MemoryStorage(Storage):
+    """进程内存储，记录保存在列表中，并统计读写次数以便计算写放大"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.rows = []
+        self.latest = {}
+        self.sites = {}
+        self.reads = 0
+        self.writes = 0
+
+    def latest_status(self, client_id):
+        with self._lock:
+            self.reads += 1
+            row = self.latest.get(client_id)
+            if row is None:
+                return None
+            return {'fan_status': row['fan_status'], 'light_status': row['light_status'], 'control_mode': row['control_mode']}
+
+    def insert_reading(self, client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode):
+        with self._lock:
+            self.writes += 1
+            record = {'id': next(self._ids), 'client_id': client_id, 'temperature': temperature, 'humidity': humidity,
+                      'light_intensity': light_intensity, 'fan_status': 1 if fan_status else 0,
+                      'light_status': 1 if light_status else 0, 'control_mode': control_mode,
+                      'timestamp': datetime.now().replace(microsecond=0)}
+            self.rows.append(record)
+            self.latest[client_id] = record
+            return dict(record)
+
+    def insert_many(self, rows):
+        with self._lock:
+            self.writes += 1
+            for row in rows:
+                record = dict(row, id=next(self._ids))
+                self.rows.append(record)
+                self.latest[record['client_id']] = record
+
+    def insert_readings(self, rows):
+        with self._lock:
+            self.writes += 1
+            records = []
+            for row in rows:
+                record = dict(row, id=next(self._ids))
+                self.rows.append(record)
+                self.latest[record['client_id']] = record
+                records.append(dict(record))
+            return records
+
+    def register_device(self, client_id, site):
+        with self._lock:
+            self.sites[client_id] = site
+
+
+# =============================================================================
+# 发布订阅后端
+# =============================================================================
+class PubSub:
+    """发布订阅接口"""
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        """订阅频道，收到消息时在后台线程中调用 callback(channel, message)"""
+        raise NotImplementedError
+
+    def set_values(self, mapping, ttl=None):
+        """写入一组键值 (ttl 秒后过期)，供其他进程读取 (如滑动窗口统计)"""
+        raise NotImplementedError
+
+    def set_fields(self, key, mapping):
+        """写入哈希 key 的一组字段 (如设备在线状态)"""
+        raise NotImplementedError
+
+    def get_fields(self, key):
+        """读取哈希 key 的全部字段，不存在时返回空字典"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RedisPubSub(PubSub):
+    def __init__(self, host, port, db=0):
+        import redis
+        self.client = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+        # 构造时检查一次连接，失败时抛出 redis.exceptions.ConnectionError
+        self.client.ping()
+        self._listeners = []
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    def set_values(self, mapping, ttl=None):
+        # 一次往返写入全部键
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ttl)
+        pipe.execute()
+
+    def set_fields(self, key, mapping):
+        self.client.hset(key, mapping=mapping)
+
+    def get_fields(self, key):
+        return self.client.hgetall(key)
+
+    def subscribe(self, channel, callback):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda message: callback(channel, message['data'])})
+        def on_error(error, pubsub, thread):
+            # 连接断开时稍后重试，下一次 get_message() 会自动重连并重新订阅
+            log.warning("⚠️ Redis订阅连接异常，1秒后重试: %s", error)
+            time.sleep(1.0)
+
+        self._listeners.append(pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=on_error))
+
+    def close(self):
+        for listener in self._listeners:
+            listener.stop()
+        self.client.close()
+
+
+class MemoryPubSub(PubSub):
+    """进程内发布订阅，subscribe() 注册回调 callback(channel, message)"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self.published = 0
+        self.values = {}
+
+    def subscribe(self, channel, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel, message):
+        self.published += 1
+        for callback in self._subscribers.get(channel, ()):
+            callback(channel, message)
+
+    def set_values(self, mapping, ttl=None):
+        self.values.update(mapping)
+
+    def set_fields(self, key, mapping):
+        self.values.setdefault(key, {}).update(mapping)
+
+    def get_fields(self, key):
+        return dict(self.values.get(key, {}))
+
+
+# =============================================================================
+# MQTT 传输后端
+# =============================================================================
+class MqttTransport:
+    """
+    MQTT 传输接口。回调签名与 paho-mqtt 保持一致，网关代码不需要区分实现:
+        on_connect(client, userdata, flags, rc, properties=None)
+        on_message(client, userdata, msg)   # msg 具有 topic / payload / qos / retain 属性
+    """
+
+    def start(self, on_connect, on_message):
+        raise NotImplementedError
+
+    def subscribe(self, topic, qos=0):
+        raise NotImplementedError
+
+    def publish(self, topic, payload, qos=0):
+        """发布消息，成功交给底层发送队列时返回 True"""
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class PahoTransport(MqttTransport):
+    """
+    paho-mqtt 传输 + 连接监督线程。
+
+    - 固定的 client_id + clean_session=False: 代理为网关保留会话，网关离线/重启期间
+      发往 QoS 1 订阅的消息由代理暂存，重连后补发，不再丢失
+    - 单个监督线程独占网络循环: 首次连接失败、运行中断线都会按带抖动的指数退避自动重连，
+      其他线程只读取 state 等属性，不需要加锁
+    - 每次连上后都会触发 on_connect，由网关在其中重新订阅
+    """
+
+    def __init__(self, broker_ip, port, timeout, client_id, clean_session=False,
+                 min_delay=1.0, max_delay=60.0, jitter=0.5, tenant='default'):
+        import paho.mqtt.client as mqtt
+        self._mqtt = mqtt
+        self.broker_ip = broker_ip
+        self.port = port
+        self.timeout = timeout
+        self.client_id = client_id
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id, clean_session=clean_session)
+        self.state = 'init'          # init / connecting / connected / backoff / stopped
+        self.attempts = 0            # 当前连续失败次数
+        # 多租户时每个租户的网关各有一个连接
+        self._connected = metrics.MQTT_CONNECTED.labels(tenant)
+        self._user_on_connect = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, on_connect, on_message):
+        self._user_on_connect = on_connect
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = on_message
+        self._thread = threading.Thread(target=self._supervise, name='mqtt-supervisor', daemon=True)
+        self._thread.start()
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            self.state = 'connected'
+            self.attempts = 0
+            self._connected.set(1)
+        self._user_on_connect(client, userdata, flags, rc, properties)
+
+    def _on_disconnect(self, client, userdata, flags, rc, properties=None):
+        self._connected.set(0)
+        if not self._stop_event.is_set():
+            metrics.MQTT_DISCONNECTS.inc()
+            log.warning("⚠️  与MQTT代理服务器断开连接: %s", rc)
+
+    def _backoff(self):
+        self.attempts += 1
+        delay = min(self.max_delay, self.min_delay * (2 ** (self.attempts - 1)))
+        # 全抖动: 多个网关同时断线时错开重连时间
+        delay = delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+        self.state = 'backoff'
+        return delay
+
+    def _supervise(self):
+        first = True
+        while not self._stop_event.is_set():
+            self.state = 'connecting'
+            try:
+                if first:
+                    log.info("🔄 正在连接MQTT代理服务器 %s:%s (client_id=%s)", self.broker_ip, self.port, self.client_id)
+                    self.client.connect(self.broker_ip, self.port, self.timeout)
+                else:
+                    metrics.MQTT_RECONNECTS.inc()
+                    self.client.reconnect()
+            except (OSError, ValueError) as e:
+                metrics.MQTT_CONNECT_FAILURES.inc()
+                delay = self._backoff()
+                log.error("❌ 连接MQTT代理服务器失败: %s，%.1f 秒后重试", e, delay)
+                self._stop_event.wait(delay)
+                continue
+            first = False
+            rc = self._mqtt.MQTT_ERR_SUCCESS
+            while not self._stop_event.is_set() and rc == self._mqtt.MQTT_ERR_SUCCESS:
+                rc = self.client.loop(timeout=1.0)
+            if self._stop_event.is_set():
+                break
+            delay = self._backoff()
+            log.warning("🔄 MQTT连接中断 (rc=%s)，%.1f 秒后重连", rc, delay)
+            self._stop_event.wait(delay)
+        self.state = 'stopped'
+
+    def subscribe(self, topic, qos=0):
+        self.client.subscribe(topic, qos)
+
+    def publish(self, topic, payload, qos=0):
+        return self.client.publish(topic, payload, qos=qos).rc == self._mqtt.MQTT_ERR_SUCCESS
+
+    def stop(self):
+        self._stop_event.set()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class MemoryMessage:
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'timestamp')
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload if isinstance(payload, bytes) else str(payload).encode('utf-8')
+        self.qos = qos
+        self.retain = retain
+        self.timestamp = time.monotonic()
+
+
+def topic_matches(pattern, topic):
+    """MQTT 主题通配符匹配，支持 + (单层) 和 # (多层)"""
+    pattern_parts, topic_parts = pattern.split('/'), topic.split('/')
+    for i, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class MemoryBroker:
+    """进程内 MQTT 代理: publish 时在调用线程里同步投递给所有匹配的订阅者"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []    # (pattern, transport)
+        self.published = 0
+
+    def subscribe(self, pattern, transport):
+        with self._lock:
+            self._subscriptions.append((pattern, transport))
+
+    def unsubscribe_all(self, transport):
+        with self._lock:
+            self._subscriptions = [(p, t) for p, t in self._subscriptions if t is not transport]
+
+    def publish(self, topic, payload, qos=0):
+        self.published += 1
+        message = MemoryMessage(topic, payload, qos)
+        with self._lock:
+            targets = [t for p, t in self._subscriptions if topic_matches(p, topic)]
+        for transport in targets:
+            transport.deliver(message)
+
+
+class MemoryTransport(MqttTransport):
+    def __init__(self, broker):
+        self.broker = broker
+        self.on_message = None
+        self.sent = []     # 记录发出的 (topic, payload)，便于检查下发的指令
+
+    def start(self, on_connect, on_message):
+        self.on_message = on_message
+        on_connect(self, None, None, 0)
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(topic, self)
+
+    def publish(self, topic, payload, qos=0):
+        self.sent.append((topic, payload))
+        self.broker.publish(topic, payload, qos)
+        return True
+
+    def deliver(self, message):
+        if self.on_message is not None:
+            self.on_message(self, None, message)
+
+    def stop(self):
+        self.broker.unsubscribe_all(self)
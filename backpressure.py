@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+过载策略: 按设备限额的合并队列
+=====================================
+站点工作线程处理不过来时，原来的站点队列只能排队 (最终阻塞 MQTT 网络线程)，所有设备的读数一起变旧。
+CoalescingQueue 替代站点队列:
+- 每台设备一个有界 FIFO (budget 条)。设备超出限额时新读数与该设备最后一条待处理读数合并，而不是随机丢弃:
+    latest   保留最新的值 (控制规则看到的总是最新读数)
+    summary  合并为平均值，并记录被合并读数的最小/最大值 (reading.summary，随通知记录发布)
+  被合并的读数计入 iot_readings_coalesced_total，并定期在日志中列出合并最多的设备
+- 取出时各设备轮询，一台设备的突发不会拖慢同站点的其他设备
+- 优先通道: Web端的手动控制在处理积压读数之前执行 (见 Gateway.run_priority)
+- 所有设备的待处理总数达到 max_pending 时 put() 阻塞，由 MQTT 代理缓冲 (与原来的站点队列相同)
+"""
+import threading
+import time
+from collections import deque
+
+import iot_log
+import metrics
+
+log = iot_log.get_logger('backpressure')
+
+POLICIES = ('latest', 'summary')
+DEFAULT_BUDGET = 50
+# 合并情况的日志间隔 (秒)
+SHED_REPORT_INTERVAL = 10.0
+SUMMARY_FIELDS = ('temperature', 'humidity', 'light_intensity')
+
+
+def coalesce_latest(pending, new):
+    """保留最新读数，记录它代表的读数条数"""
+    new.coalesced = pending.coalesced + new.coalesced
+    return new
+
+
+def coalesce_summary(pending, new):
+    """合并为平均值；summary 记录各字段的最小/最大值"""
+    count = pending.coalesced + new.coalesced
+    summary = pending.summary or {field: [getattr(pending, field)] * 2 for field in SUMMARY_FIELDS}
+    for field in SUMMARY_FIELDS:
+        value = getattr(new, field)
+        low, high = summary[field]
+        summary[field] = [min(low, value), max(high, value)]
+        # 加权平均: pending 已经是 pending.coalesced 条读数的平均值
+        setattr(new, field, round((getattr(pending, field) * pending.coalesced + value * new.coalesced) / count, 2))
+    new.coalesced = count
+    new.summary = summary
+    return new
+
+
+COALESCERS = {'latest': coalesce_latest, 'summary': coalesce_summary}
+
+
+class CoalescingQueue:
+    """
+    put(key, item, merge) 放入设备 key 的 FIFO，超出 budget 时 merge(最后一条, 新的) 替换最后一条；
+    put_priority(item) 放入优先通道；get() 优先通道优先，其余按设备轮询；close() 后取完剩余项返回 None。
+    task_done() / join() 语义同 queue.Queue。
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, max_pending=10000, name='', policy='latest'):
+        self.budget = budget
+        self.max_pending = max_pending
+        self.name = name
+        self.policy = policy
+        self._devices = {}
+        self._ready = deque()
+        self._priority = deque()
+        self._pending = 0
+        self._unfinished = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._shed = {}
+        self._last_report = time.monotonic()
+
+    def put(self, key, item, merge):
+        with self._cond:
+            fifo = self._devices.get(key)
+            if fifo is not None and len(fifo) >= self.budget:
+                fifo[-1] = merge(fifo[-1], item)
+                self._shed[key] = self._shed.get(key, 0) + 1
+                metrics.READINGS_COALESCED.labels(self.policy).inc()
+                self._maybe_report()
+                return
+            while self._pending >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if fifo is None:
+                fifo = self._devices[key] = deque()
+                self._ready.append(key)
+            fifo.append(item)
+            self._pending += 1
+            self._unfinished += 1
+            self._cond.notify_all()
+
+    def put_priority(self, item):
+        with self._cond:
+            self._priority.append(item)
+            self._unfinished += 1
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while not self._priority and not self._ready:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            if self._priority:
+                return self._priority.popleft()
+            key = self._ready.popleft()
+            fifo = self._devices[key]
+            item = fifo.popleft()
+            if fifo:
+                self._ready.append(key)
+            else:
+                del self._devices[key]
+            self._pending -= 1
+            self._cond.notify_all()
+            return item
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self._cond.notify_all()
+
+    def join(self):
+        with self._cond:
+            while self._unfinished:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self):
+        return self._pending + len(self._priority)
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if now - self._last_report < SHED_REPORT_INTERVAL:
+            return
+        shed, self._shed, self._last_report = self._shed, {}, now
+        top = sorted(shed.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        log.warning("⚠️ 队列 %s 过载，最近 %.0f 秒合并了 %d 条读数 (策略 %s)，最多的设备: %s", self.name, SHED_REPORT_INTERVAL,
+                    sum(shed.values()), self.policy, ', '.join(f'{key}={count}' for key, count in top))
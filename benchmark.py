@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测工具 (设备模拟器 + 基准报告)
+=====================================
+- 模拟 N 台虚拟 STM32 设备，以指定频率向 stm32/data 发布数据
+  - fuwu.py 使用 JSON 格式:          {"client_id": "...", "temperature": .., "humidity": .., "Light intensity": ..}
+  - fuwu_nojson.py / fuwu_new.py 使用: {id;t;h;l}
+- 连接本地 MQTT 代理、MySQL、Redis，对正在运行 (或由 --spawn 启动) 的网关进行压测
+- --inprocess: 使用 backends.py 中的进程内后端 (MemoryBroker/MemoryStorage/MemoryPubSub) 直接驱动
+  统一网关 (gateway 包，--variant 作为流水线预设)，不需要任何外部服务，结果可重复，适合在笔记本上对比解析/平滑/规则等阶段的改动
+- 报告:
+  - 持续吞吐量 (msgs/sec): 发送速率、网关接收速率 (读取网关 /metrics)、入库速率
+  - 网关有意丢弃的读数 (过载时合并、平滑度检查丢弃、格式错误) 单独列出，丢失率只计算其余未入库的读数
+  - 端到端延迟百分位: 设备发出读数 -> 记录出现在 Redis 频道 (即 SSE 推送给浏览器的那一刻)
+  - 数据库写放大: 每条消息对应的 InnoDB 插入行数、SQL 语句数、写入字节数 (SHOW GLOBAL STATUS 差值)
+
+用法:
+    python benchmark.py --variant fuwu_new --devices 200 --rate 1 --duration 60
+    python benchmark.py --variant fuwu_nojson --spawn --devices 50 --rate 5 --output report.json
+    python benchmark.py --inprocess --devices 1000 --rate 0 --duration 10 --profile
+"""
+import argparse
+import importlib
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+# 各网关版本使用的数据格式
+VARIANT_FORMATS = {
+    'fuwu': 'json',
+    'fuwu_nojson': 'semicolon',
+    'fuwu_new': 'semicolon',
+}
+
+# 网关有意不入库的读数: 报告字段 -> 网关计数器 (各标签求和)
+DROP_METRICS = (
+    ('coalesced', 'iot_readings_coalesced_total'),
+    ('rejected_smoothing', 'iot_messages_rejected_total'),
+    ('invalid', 'iot_messages_invalid_total'),
+)
+
+# 写放大统计关注的 MySQL 全局状态变量
+DB_STATUS_KEYS = ('Innodb_rows_inserted', 'Innodb_rows_read', 'Com_insert', 'Com_select', 'Com_commit', 'Innodb_data_written')
+
+
+class VirtualDevice:
+    """一台虚拟设备：读数做有界随机游走，单次变化远小于 fuwu_new.py 的平滑度阈值"""
+
+    def __init__(self, client_id, rng):
+        self.client_id = client_id
+        self.rng = rng
+        self.temperature = rng.uniform(20.0, 32.0)
+        self.humidity = rng.uniform(40.0, 70.0)
+        self.light = rng.uniform(20.0, 400.0)
+
+    def next_reading(self):
+        self.temperature = min(45.0, max(-10.0, self.temperature + self.rng.uniform(-0.5, 0.5)))
+        self.humidity = min(99.0, max(1.0, self.humidity + self.rng.uniform(-1.0, 1.0)))
+        self.light = min(99999.0, max(0.0, self.light + self.rng.uniform(-15.0, 15.0)))
+        # 按数据库列精度取整，便于在 Redis 消息里按数值匹配回发送时间
+        return self.client_id, round(self.temperature, 2), round(self.humidity, 1), round(self.light, 1)
+
+
+def encode_reading(fmt, client_id, temperature, humidity, light):
+    if fmt == 'json':
+        return json.dumps({'client_id': client_id, 'temperature': temperature, 'humidity': humidity, 'Light intensity': light})
+    return f"{{{client_id};{temperature:.2f};{humidity:.1f};{light:.1f}}}"
+
+
+def reading_key(client_id, temperature, humidity, light):
+    return (client_id, round(float(temperature), 2), round(float(humidity), 1), round(float(light), 1))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class LatencyTracker:
+    """记录每条读数的发送时间，并在 Redis 频道收到对应记录时计算延迟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.samples = []
+
+    def sent(self, key, ts):
+        with self._lock:
+            self._pending.setdefault(key, []).append(ts)
+
+    def received(self, key, ts):
+        with self._lock:
+            queue = self._pending.get(key)
+            if not queue:
+                return
+            sent_ts = queue.pop(0)
+            if not queue:
+                del self._pending[key]
+            self.samples.append(ts - sent_ts)
+
+    def summary(self):
+        values = sorted(self.samples)
+        if not values:
+            return None
+        ms = lambda v: round(v * 1000, 2)
+        return {'count': len(values), 'p50_ms': ms(percentile(values, 50)), 'p90_ms': ms(percentile(values, 90)),
+                'p99_ms': ms(percentile(values, 99)), 'max_ms': ms(values[-1])}
+
+
+class LoadGenerator:
+    """用一个 MQTT 客户端代表全部虚拟设备，按固定节拍轮流发布"""
+
+    def __init__(self, fmt, devices, rate, topic, seed, latency):
+        self.fmt = fmt
+        self.rate = rate
+        self.topic = topic
+        self.latency = latency
+        rng = random.Random(seed)
+        self.devices = [VirtualDevice(f"bench_dev_{i:05d}", rng) for i in range(devices)]
+        self.sent = 0
+
+    def run(self, client, duration):
+        """client 只需提供 publish(topic, payload, qos)；rate <= 0 时不限速，尽可能快地发送"""
+        interval = 1.0 / (self.rate * len(self.devices)) if self.rate > 0 else 0.0
+        started = time.perf_counter()
+        next_send = started
+        index = 0
+        while time.perf_counter() - started < duration:
+            device = self.devices[index % len(self.devices)]
+            index += 1
+            reading = device.next_reading()
+            payload = encode_reading(self.fmt, *reading)
+            self.latency.sent(reading_key(*reading), time.time())
+            client.publish(self.topic, payload, qos=0)
+            self.sent += 1
+            next_send += interval
+            if interval:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        return time.perf_counter() - started
+
+
+def read_db_status(mysql_config):
+    import mysql.connector
+    conn = mysql.connector.connect(**mysql_config)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW GLOBAL STATUS")
+            status = {name: value for name, value in cursor.fetchall() if name in DB_STATUS_KEYS}
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_readings")
+            status['max_id'] = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM sensor_readings WHERE client_id LIKE 'bench\\_dev\\_%'")
+            status['bench_rows'] = cursor.fetchone()[0]
+        return {k: int(v) for k, v in status.items()}
+    finally:
+        conn.close()
+
+
+def metric_total(text, name):
+    """Prometheus 文本中一个计数器所有标签的值之和，没有该指标时为 0"""
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith((name + ' ', name + '{')))
+
+
+def scrape_metrics(metrics_url):
+    """读取网关 /metrics 的文本，读取失败返回 None"""
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=2) as resp:
+            return resp.read().decode('utf-8')
+    except OSError:
+        return None
+
+
+def scrape_metric(metrics_url, name):
+    """从网关 /metrics 读取一个计数器的值 (各标签求和)，读取失败返回 None"""
+    text = scrape_metrics(metrics_url)
+    return None if text is None else metric_total(text, name)
+
+
+def dropped_counts(before, after):
+    """两次 /metrics 文本之间网关有意丢弃的读数 {报告字段: 条数}，任一次读取失败时为 None"""
+    if before is None or after is None:
+        return None
+    return {field: int(metric_total(after, name) - metric_total(before, name)) for field, name in DROP_METRICS}
+
+
+def loss_ratio(sent, inserted, dropped):
+    """发送了但既没有入库、也不是网关有意丢弃的读数比例"""
+    if not sent:
+        return None
+    return round(1 - (inserted + sum((dropped or {}).values())) / sent, 4)
+
+
+def listen_redis(redis_host, redis_port, channel, latency, stop_event):
+    import redis
+    r = redis.Redis(host=redis_host, port=redis_port, decode_responses=True)
+    pubsub = r.pubsub()
+    pubsub.subscribe(channel)
+    try:
+        while not stop_event.is_set():
+            message = pubsub.get_message(timeout=0.2)
+            if not message or message['type'] != 'message':
+                continue
+            now = time.time()
+            payload = json.loads(message['data'])
+            # 批量写库时一条消息是一批记录 (JSON 数组)
+            for record in payload if isinstance(payload, list) else [payload]:
+                if str(record.get('client_id', '')).startswith('bench_dev_'):
+                    latency.received(reading_key(record['client_id'], record['temperature'], record['humidity'], record['light_intensity']), now)
+    finally:
+        pubsub.close()
+        r.close()
+
+
+def run_benchmark(args):
+    import paho.mqtt.client as mqtt
+
+    module = importlib.import_module(args.variant)
+    fmt = VARIANT_FORMATS[args.variant]
+    mysql_config = module.MYSQL_CONFIG
+    redis_channel = getattr(module, 'REDIS_CHANNEL', None)
+    metrics_url = args.metrics_url or f"http://localhost:{getattr(module, 'METRICS_PORT', 9100)}/metrics"
+
+    gateway_proc = None
+    if args.spawn:
+        gateway_proc = subprocess.Popen([sys.executable, f"{args.variant}.py"])
+        time.sleep(args.warmup)
+
+    latency = LatencyTracker()
+    stop_event = threading.Event()
+    listener = None
+    if redis_channel:
+        listener = threading.Thread(target=listen_redis, args=(args.redis_host, args.redis_port, redis_channel, latency, stop_event), daemon=True)
+        listener.start()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"bench_loadgen_{random.randint(1000, 9999)}")
+    client.max_queued_messages_set(0)
+    client.connect(args.broker, args.port)
+    client.loop_start()
+
+    db_before = read_db_status(mysql_config)
+    metrics_before = scrape_metrics(metrics_url)
+    received_before = None if metrics_before is None else metric_total(metrics_before, 'iot_messages_received_total')
+    generator = LoadGenerator(fmt, args.devices, args.rate, module.DATA_TOPIC, args.seed, latency)
+    try:
+        elapsed = generator.run(client, args.duration)
+        # 等待网关把积压的消息处理完
+        time.sleep(args.drain)
+    finally:
+        stop_event.set()
+        client.loop_stop()
+        client.disconnect()
+        if listener:
+            listener.join(timeout=2)
+        if gateway_proc:
+            gateway_proc.terminate()
+            gateway_proc.wait(timeout=10)
+    db_after = read_db_status(mysql_config)
+    metrics_after = scrape_metrics(metrics_url)
+    received_after = None if metrics_after is None else metric_total(metrics_after, 'iot_messages_received_total')
+    dropped = dropped_counts(metrics_before, metrics_after)
+
+    inserted = db_after['bench_rows'] - db_before['bench_rows']
+    delta = {k: db_after[k] - db_before[k] for k in DB_STATUS_KEYS if k in db_after and k in db_before}
+    per_msg = lambda v: round(v / inserted, 2) if inserted else None
+    report = {
+        'variant': args.variant,
+        'format': fmt,
+        'devices': args.devices,
+        'rate_per_device': args.rate,
+        'duration_s': round(elapsed, 2),
+        'sent': generator.sent,
+        'sent_per_sec': round(generator.sent / elapsed, 1),
+        'gateway_received': None if received_before is None or received_after is None else int(received_after - received_before),
+        'inserted': inserted,
+        'inserted_per_sec': round(inserted / (elapsed + args.drain), 1),
+        'dropped': dropped,
+        'loss_ratio': loss_ratio(generator.sent, inserted, dropped),
+        'latency_to_sse': latency.summary() if redis_channel else 'n/a (该版本不发布到Redis)',
+        'db_write_amplification': {
+            'rows_inserted_per_msg': per_msg(delta.get('Innodb_rows_inserted', 0)),
+            'rows_read_per_msg': per_msg(delta.get('Innodb_rows_read', 0)),
+            'statements_per_msg': per_msg(delta.get('Com_insert', 0) + delta.get('Com_select', 0)),
+            'commits_per_msg': per_msg(delta.get('Com_commit', 0)),
+            'bytes_written_per_msg': per_msg(delta.get('Innodb_data_written', 0)),
+        },
+    }
+    return report
+
+
+def run_inprocess(args):
+    """用进程内后端驱动统一网关 (--variant 作为流水线预设)，消息经站点队列交给工作线程处理，结束时等待队列和批量写入排空"""
+    import config
+    from gateway import Gateway, DATA_TOPIC
+    from backends import MemoryBroker, MemoryTransport, MemoryStorage, MemoryPubSub
+
+    import metrics
+    broker, storage, pubsub = MemoryBroker(), MemoryStorage(), MemoryPubSub()
+    latency = LatencyTracker()
+    tenant_config = config.load(overrides={'pipeline': {'preset': args.variant}, 'gateway': {'spool_path': None}}).tenant()
+
+    def on_record(channel, message):
+        now = time.time()
+        payload = json.loads(message)
+        for record in payload if isinstance(payload, list) else [payload]:
+            latency.received(reading_key(record['client_id'], record['temperature'], record['humidity'], record['light_intensity']), now)
+
+    pubsub.subscribe(tenant_config['redis']['channel'], on_record)
+    gateway = Gateway(tenant_config, storage=storage, pubsub=pubsub, transport=MemoryTransport(broker))
+    if args.profile:
+        gateway.profiler.start()
+
+    generator = LoadGenerator(VARIANT_FORMATS[args.variant], args.devices, args.rate, DATA_TOPIC, args.seed, latency)
+    metrics_before = metrics.render_metrics()
+    started = time.perf_counter()
+    generator.run(broker, args.duration)
+    # 吞吐按发送开始到全部处理完的时间计算
+    gateway.join()
+    elapsed = time.perf_counter() - started
+    gateway.stop()
+    dropped = dropped_counts(metrics_before, metrics.render_metrics())
+
+    accepted = len(storage.rows)
+    per_msg = lambda v: round(v / accepted, 2) if accepted else None
+    report = {
+        'variant': f'{args.variant} (inprocess)',
+        'format': VARIANT_FORMATS[args.variant],
+        'devices': args.devices,
+        'rate_per_device': args.rate,
+        'duration_s': round(elapsed, 2),
+        'sent': generator.sent,
+        'sent_per_sec': round(generator.sent / elapsed, 1),
+        'gateway_received': generator.sent,
+        'inserted': accepted,
+        'inserted_per_sec': round(accepted / elapsed, 1),
+        'dropped': dropped,
+        'loss_ratio': loss_ratio(generator.sent, accepted, dropped),
+        'latency_to_sse': latency.summary(),
+        'db_write_amplification': {
+            'writes_per_msg': per_msg(storage.writes),
+            'reads_per_msg': per_msg(storage.reads),
+            'pubsub_per_msg': per_msg(pubsub.published),
+        },
+    }
+    if args.profile:
+        report['profile'] = gateway.profiler.snapshot()
+        print(gateway.profiler.report())
+    return report
+
+
+def print_report(report):
+    print(f"\n===== 压测报告: {report['variant']} ({report['format']}) =====")
+    print(f"设备数: {report['devices']}  每台频率: {report['rate_per_device']} msg/s  时长: {report['duration_s']} s")
+    print(f"发送: {report['sent']} 条 ({report['sent_per_sec']} msg/s)  网关接收: {report['gateway_received']}")
+    dropped = report['dropped']
+    if dropped is not None:
+        print(f"网关有意丢弃: 过载合并 {dropped['coalesced']} 条  平滑度检查 {dropped['rejected_smoothing']} 条  格式错误 {dropped['invalid']} 条")
+    else:
+        print("网关有意丢弃: 未知 (读取网关 /metrics 失败，丢失率包含这部分)")
+    print(f"入库: {report['inserted']} 条 ({report['inserted_per_sec']} msg/s)  丢失率 (除去有意丢弃): {report['loss_ratio']}")
+    print(f"端到端延迟 (读数 -> Redis/SSE): {report['latency_to_sse']}")
+    print(f"数据库写放大: {report['db_write_amplification']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MQTT网关端到端压测')
+    parser.add_argument('--variant', choices=sorted(VARIANT_FORMATS), default='fuwu_new', help='要压测的网关版本')
+    parser.add_argument('--devices', type=int, default=100, help='虚拟设备数量')
+    parser.add_argument('--rate', type=float, default=1.0, help='每台设备每秒发送的消息数')
+    parser.add_argument('--duration', type=float, default=30.0, help='发送持续时间 (秒)')
+    parser.add_argument('--drain', type=float, default=5.0, help='发送结束后等待网关处理积压的时间 (秒)')
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--metrics-url', default=None, help='网关指标地址，默认 http://localhost:<METRICS_PORT>/metrics')
+    parser.add_argument('--spawn', action='store_true', help='由压测工具启动网关子进程')
+    parser.add_argument('--warmup', type=float, default=3.0, help='--spawn 时等待网关就绪的时间 (秒)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='把报告写入JSON文件')
+    parser.add_argument('--inprocess', action='store_true', help='使用进程内后端压测 (--variant 选择流水线预设)，不需要MQTT代理/MySQL/Redis')
+    parser.add_argument('--profile', action='store_true', help='--inprocess 时同时输出 on_message 分阶段耗时')
+    args = parser.parse_args(argv)
+
+    report = run_inprocess(args) if args.inprocess else run_benchmark(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+前端静态资源构建 (部署时运行一次)
+=====================================
+- 把 Bootstrap / ECharts 下载到 static/vendor/，页面不再依赖外部CDN (未下载时模板自动回退到CDN地址)
+- 为 static/ 下的文本资源生成预压缩文件: .gz (gzip -9) 和 .br (需要安装 brotli 包，可选)
+- web_display.py 根据请求的 Accept-Encoding 直接返回预压缩文件，不在请求时压缩；预压缩文件比源文件旧时返回源文件
+
+用法:
+    python build_assets.py            # 下载缺失的第三方资源并压缩
+    python build_assets.py --no-fetch # 只压缩 (离线环境)
+"""
+import argparse
+import gzip
+import os
+import urllib.request
+
+import iot_log
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = iot_log.get_logger('assets')
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# static/ 下的相对路径 -> 固定版本的CDN地址
+VENDOR_ASSETS = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/echarts.min.js': 'https://cdn.jsdelivr.net/npm/echarts@5.5.0/dist/echarts.min.js',
+}
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.html', '.txt')
+# 太小的文件压缩后收益不大
+MIN_SIZE = 256
+
+
+def precompressed(path, suffix):
+    """path + suffix 存在且不早于源文件时返回该路径；源文件修改后还没有重新运行本脚本时返回 None，由调用方返回源文件"""
+    compressed = path + suffix
+    try:
+        if os.path.getmtime(compressed) >= os.path.getmtime(path):
+            return compressed
+    except OSError:
+        pass
+    return None
+
+
+def fetch_vendor_assets(timeout=30):
+    for name, url in VENDOR_ASSETS.items():
+        path = os.path.join(STATIC_DIR, name)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        log.info("⬇️ 下载 %s", url)
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            data = resp.read()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+
+def _write_if_changed(path, data):
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def compress_assets():
+    """为所有文本资源生成 .gz / .br，返回生成的文件数"""
+    written = 0
+    for root, _, files in os.walk(STATIC_DIR):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            # mtime=0 保证内容不变时输出完全相同
+            written += _write_if_changed(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                written += _write_if_changed(path + '.br', brotli.compress(data, quality=11))
+    if brotli is None:
+        log.warning("⚠️ 未安装 brotli，只生成 .gz 文件 (pip install -r requirements-optional.txt)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建前端静态资源')
+    parser.add_argument('--no-fetch', action='store_true', help='不下载第三方资源')
+    args = parser.parse_args()
+    iot_log.setup_logging()
+    if not args.no_fetch:
+        fetch_vendor_assets()
+    log.info("✅ 已生成 %d 个预压缩文件", compress_assets())
+
+
+if __name__ == '__main__':
+    main()
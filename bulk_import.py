@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+历史读数批量导入
+=====================================
+新站点接入时需要补录设备 SD 卡中导出的几个月读数。经 MQTT 回放、网关逐条写库需要几天，这里直接批量写入 MySQL:
+
+- 流式读取文件 (不整体载入内存，.gz 文件自动解压)，两种格式:
+    CSV   表头包含 client_id, timestamp, temperature, humidity, light_intensity，
+          可选 fan_status, light_status, control_mode (缺省为 0 / 0 / auto)
+    行格式 "<时间> {client_id;temperature;humidity;light_intensity}"，时间与载荷之间为空白或逗号
+  时间为 ISO 格式 ("2024-05-01 08:00:00") 或 Unix 时间戳 (秒)
+- 与网关 (fuwu_new 预设) 相同的平滑度检查 (gateway.stages.smoothing_violation，阈值取自配置)，另外丢弃超出列精度范围的读数
+- 按 client_id 哈希分给 --workers 个写入进程: 同一设备的读数由同一进程按文件中的顺序检查，平滑度检查结果与逐条处理相同
+- 写入进程每攒够 --batch-rows 条写一次: 默认 LOAD DATA LOCAL INFILE (临时文件)，服务器未开启 local_infile 时
+  自动改用多行 INSERT (mysql-connector 把 executemany 改写为一条多行语句)，每批一个事务
+- 全部写完后统一更新派生数据，而不是每条读数更新一次: device_latest 按导入的设备重建一次，
+  --site 时一次登记设备站点，最后 ANALYZE TABLE 更新索引统计
+
+文件中读数的时间顺序决定平滑度检查的顺序，同一设备的读数应按时间排列 (可以分在多个文件中，按命令行顺序读取)。
+重复导入同一文件会产生重复数据；可以先用 --dry-run 只做解析和检查。
+
+用法:
+    python bulk_import.py sd_card/*.csv --site farm_b --workers 4
+    python bulk_import.py dev1.log.gz dev2.log.gz --format line --dry-run
+"""
+import argparse
+import csv
+import gzip
+import io
+import multiprocessing
+import os
+import queue
+import re
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+import config
+import iot_log
+from backends import INSERT_READINGS_SQL, READING_COLUMNS, REGISTER_DEVICE_SQL, SENSOR_READINGS_DDL, DEVICE_LATEST_DDL, DEVICE_GROUPS_DDL, refresh_device_latest
+from gateway.stages import smoothing_violation
+
+log = iot_log.get_logger('bulk_import')
+
+DEFAULT_BATCH_ROWS = 50000
+# 主进程按设备分好的读数攒够这么多条发给写入进程一次，减少进程间通信次数
+CHUNK_ROWS = 2000
+PROGRESS_INTERVAL = 5.0
+# 主进程等待写入进程 (发送读数、取回结果) 时每隔这么多秒检查一次进程是否还在运行
+POLL_INTERVAL = 1.0
+# 各列的取值范围 (与 sensor_readings 的 DECIMAL 精度一致)，超出的读数在严格模式下会让整批写入失败
+LIMITS = {'temperature': 999.99, 'humidity': 999.9, 'light_intensity': 999999.9}
+LINE_PATTERN = re.compile(r'^\s*(?P<time>[^{]*?)[\s,]*\{(?P<payload>[^}]*)\}\s*$')
+# 写入临时文件和 LOAD DATA 时使用制表符分隔，client_id 中不能出现的字符
+UNSAFE_ID_CHARS = frozenset('\t\n\r\\')
+LOAD_DATA_SQL = (f"LOAD DATA LOCAL INFILE %s INTO TABLE sensor_readings CHARACTER SET utf8mb4 "
+                 f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(READING_COLUMNS)})")
+
+
+def parse_timestamp(value):
+    value = value.strip()
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+
+def make_row(client_id, timestamp, temperature, humidity, light_intensity, fan_status=0, light_status=0, control_mode='auto'):
+    """-> 按 READING_COLUMNS 排列的元组，格式不符时抛出 ValueError"""
+    if not client_id or any(c in UNSAFE_ID_CHARS for c in client_id):
+        raise ValueError(f'invalid client_id {client_id!r}')
+    control_mode = control_mode or 'auto'
+    if control_mode not in ('auto', 'manual'):
+        raise ValueError(f'invalid control_mode {control_mode!r}')
+    return (client_id, float(temperature), float(humidity), float(light_intensity),
+            int(fan_status or 0), int(light_status or 0), control_mode, parse_timestamp(timestamp))
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def iter_csv(f):
+    reader = csv.DictReader(f)
+    for fields in reader:
+        try:
+            yield make_row(fields['client_id'], fields['timestamp'], fields['temperature'], fields['humidity'], fields['light_intensity'],
+                           fields.get('fan_status'), fields.get('light_status'), fields.get('control_mode'))
+        except (KeyError, TypeError, ValueError) as e:
+            yield e, reader.line_num
+
+
+def iter_lines(f):
+    for line_num, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        match = LINE_PATTERN.match(line)
+        parts = match.group('payload').split(';') if match else ()
+        try:
+            if len(parts) != 4:
+                raise ValueError('expected "<time> {id;t;h;l}"')
+            yield make_row(parts[0], match.group('time'), parts[1], parts[2], parts[3])
+        except ValueError as e:
+            yield e, line_num
+
+
+def iter_file(path, file_format='auto'):
+    """逐条产生读数元组；无法解析的行产生 (异常, 行号)"""
+    if file_format == 'auto':
+        file_format = 'csv' if path.removesuffix('.gz').endswith('.csv') else 'line'
+    with open_text(path) as f:
+        yield from (iter_csv(f) if file_format == 'csv' else iter_lines(f))
+
+
+def worker_for(client_id, workers):
+    # 稳定的哈希 (不受 PYTHONHASHSEED 影响)，同一设备总是分给同一进程
+    return zlib.crc32(client_id.encode('utf-8')) % workers
+
+
+class Loader:
+    """一个写入进程: 平滑度检查 + 按批写入"""
+
+    def __init__(self, mysql_config, thresholds, batch_rows=DEFAULT_BATCH_ROWS, method='load', dry_run=False):
+        self.thresholds = thresholds
+        self.batch_rows = batch_rows
+        self.method = method
+        self.dry_run = dry_run
+        self.last_valid = {}
+        self.batch = []
+        self.stats = {'loaded': 0, 'rejected_temperature': 0, 'rejected_humidity': 0, 'rejected_range': 0, 'failed': 0}
+        self.devices = set()
+        self.conn = None
+        if not dry_run:
+            import mysql.connector
+            self._mysql = mysql.connector
+            self.conn = mysql.connector.connect(allow_local_infile=(method == 'load'), **mysql_config)
+
+    def add(self, rows):
+        smoothing = self.thresholds['smoothing_enabled']
+        for row in rows:
+            client_id, temperature, humidity, light_intensity = row[:4]
+            if abs(temperature) > LIMITS['temperature'] or abs(humidity) > LIMITS['humidity'] or abs(light_intensity) > LIMITS['light_intensity']:
+                self.stats['rejected_range'] += 1
+                continue
+            if smoothing:
+                violation = smoothing_violation(self.last_valid.get(client_id), temperature, humidity, self.thresholds)
+                if violation is not None:
+                    self.stats[f'rejected_{violation[0]}'] += 1
+                    continue
+                self.last_valid[client_id] = (temperature, humidity)
+            self.batch.append(row)
+            self.devices.add(client_id)
+        if len(self.batch) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        if self.dry_run:
+            self.stats['loaded'] += len(batch)
+            return
+        try:
+            if self.method == 'load':
+                try:
+                    self._load_data(batch)
+                except self._mysql.Error as e:
+                    # 服务器或客户端未开启 local_infile (错误 1148 / 3948 / 2068)
+                    if e.errno not in (1148, 3948, 2068):
+                        raise
+                    log.warning("⚠️ 服务器不允许 LOAD DATA LOCAL INFILE，改用多行 INSERT: %s", e)
+                    self.conn.rollback()
+                    self.method = 'insert'
+                    self._insert(batch)
+            else:
+                self._insert(batch)
+            self.conn.commit()
+            self.stats['loaded'] += len(batch)
+        except self._mysql.Error as e:
+            self.stats['failed'] += len(batch)
+            log.error("❌ 写入 %d 条读数失败: %s", len(batch), e)
+            try:
+                self.conn.rollback()
+            except self._mysql.Error:
+                # 连接已断开 (服务器重启、超时)，重连后继续写入之后的批次
+                try:
+                    self.conn.reconnect(attempts=3, delay=1)
+                except self._mysql.Error as e:
+                    log.error("❌ 重新连接数据库失败: %s", e)
+
+    def _load_data(self, batch):
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False) as f:
+            for client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode, timestamp in batch:
+                f.write(f"{client_id}\t{temperature:.2f}\t{humidity:.1f}\t{light_intensity:.1f}\t{fan_status}\t{light_status}\t{control_mode}\t"
+                        f"{timestamp:%Y-%m-%d %H:%M:%S}\n")
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(LOAD_DATA_SQL, (f.name,))
+        finally:
+            os.unlink(f.name)
+
+    def _insert(self, batch):
+        with self.conn.cursor() as cursor:
+            cursor.executemany(INSERT_READINGS_SQL, batch)
+
+    def close(self):
+        self.flush()
+        if self.conn is not None:
+            self.conn.close()
+
+
+def run_worker(inbox, results, mysql_config, thresholds, batch_rows, method, dry_run):
+    iot_log.setup_logging()
+    loader, failed = None, 0
+    try:
+        try:
+            loader = Loader(mysql_config, thresholds, batch_rows, method, dry_run)
+        except Exception as e:
+            log.error("❌ 写入进程无法连接数据库: %s", e)
+        # 连接失败时仍然取完分给本进程的读数 (计为失败)，主进程不会因队列满而阻塞
+        for rows in iter(inbox.get, None):
+            if loader is None:
+                failed += len(rows)
+            else:
+                loader.add(rows)
+        if loader is not None:
+            loader.close()
+    finally:
+        # 出错退出时也送回已有的统计，尚未写入的读数计为失败
+        stats, devices = ({}, []) if loader is None else (dict(loader.stats), sorted(loader.devices))
+        stats['failed'] = stats.get('failed', 0) + failed + (len(loader.batch) if loader is not None else 0)
+        results.put((multiprocessing.current_process().name, stats, devices))
+
+
+def send(inbox, process, item):
+    """发给写入进程；进程已退出时返回 False，不会因队列满而一直阻塞"""
+    while process.is_alive():
+        try:
+            inbox.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def finalize(mysql_config, devices, site=None):
+    """全部写入后统一更新派生数据: device_latest、设备站点和索引统计"""
+    import mysql.connector
+    conn = mysql.connector.connect(**mysql_config)
+    try:
+        with conn.cursor() as cursor:
+            devices = list(devices)
+            for i in range(0, len(devices), 1000):
+                refresh_device_latest(cursor, devices[i:i + 1000])
+            if site:
+                cursor.executemany(REGISTER_DEVICE_SQL, [(client_id, site) for client_id in devices])
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE TABLE sensor_readings")
+            cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量导入历史读数 (CSV 或 {id;t;h;l} 行格式)')
+    parser.add_argument('files', nargs='+', help='要导入的文件 (.gz 自动解压)，按顺序读取')
+    parser.add_argument('--format', choices=('auto', 'csv', 'line'), default='auto', help='auto: .csv 为 CSV，其余为行格式')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)), help='写入进程数')
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS, help='每个写入进程每批写入的条数 (一个事务)')
+    parser.add_argument('--method', choices=('load', 'insert'), default='load', help='load: LOAD DATA LOCAL INFILE；insert: 多行 INSERT')
+    parser.add_argument('--site', help='把导入的设备登记到该站点 (device_groups)')
+    parser.add_argument('--no-smoothing', action='store_true', help='不做平滑度检查')
+    parser.add_argument('--dry-run', action='store_true', help='只解析和检查，不写入数据库')
+    args = parser.parse_args(argv)
+    iot_log.setup_logging()
+
+    tenant_config, _ = config.load_tenant()
+    mysql_config = tenant_config['mysql']
+    thresholds = dict(config.DEFAULTS['thresholds'], **tenant_config['thresholds'])
+    if args.no_smoothing:
+        thresholds['smoothing_enabled'] = False
+    if not args.dry_run:
+        import mysql.connector
+        conn = mysql.connector.connect(**mysql_config)
+        try:
+            with conn.cursor() as cursor:
+                for ddl in (SENSOR_READINGS_DDL, DEVICE_LATEST_DDL, DEVICE_GROUPS_DDL):
+                    cursor.execute(ddl)
+            conn.commit()
+        finally:
+            conn.close()
+
+    results = multiprocessing.Queue()
+    inboxes, processes = [], []
+    for i in range(args.workers):
+        inbox = multiprocessing.Queue(maxsize=64)
+        process = multiprocessing.Process(target=run_worker, name=f'loader-{i}', daemon=True,
+                                          args=(inbox, results, mysql_config, thresholds, args.batch_rows, args.method, args.dry_run))
+        process.start()
+        inboxes.append(inbox)
+        processes.append(process)
+
+    started = last_report = time.perf_counter()
+    parsed = invalid = lost = 0
+    chunks = [[] for _ in range(args.workers)]
+    try:
+        for path in args.files:
+            for item in iter_file(path, args.format):
+                if isinstance(item[0], Exception):
+                    invalid += 1
+                    if invalid <= 20:
+                        log.warning("❌ %s 第 %s 行格式错误: %s", path, item[1], item[0])
+                    continue
+                parsed += 1
+                worker = worker_for(item[0], args.workers)
+                chunks[worker].append(item)
+                if len(chunks[worker]) >= CHUNK_ROWS:
+                    if not send(inboxes[worker], processes[worker], chunks[worker]):
+                        lost += len(chunks[worker])
+                    chunks[worker] = []
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    log.info("📥 已读取 %d 条 (%.0f 条/秒)", parsed, parsed / (now - started))
+            log.info("📄 %s 读取完成", path)
+    finally:
+        for inbox, process, chunk in zip(inboxes, processes, chunks):
+            if chunk and not send(inbox, process, chunk):
+                lost += len(chunk)
+            send(inbox, process, None)
+        totals, devices = {'failed': lost}, set()
+        reported, crashed = set(), set()
+        while len(reported) + len(crashed) < len(processes):
+            exited = [p for p in processes if p.name not in reported and p.name not in crashed and not p.is_alive()]
+            try:
+                name, stats, worker_devices = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # 等待之前已经退出、又没有送回结果: 写入进程被异常终止 (如 OOM)
+                for process in exited:
+                    log.error("❌ 写入进程 %s 异常退出 (退出码 %s)，分给它的读数可能没有全部写入", process.name, process.exitcode)
+                    crashed.add(process.name)
+                continue
+            reported.add(name)
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+            devices.update(worker_devices)
+        for process in processes:
+            process.join()
+
+    load_seconds = time.perf_counter() - started
+    if devices and not args.dry_run:
+        log.info("🔄 更新 %d 台设备的 device_latest%s", len(devices), f" 并登记到站点 {args.site}" if args.site else '')
+        finalize(mysql_config, devices, args.site)
+    elapsed = time.perf_counter() - started
+    log.info("✅ 导入完成: 读取 %d 条，格式错误 %d 条，写入 %d 条 (%.0f 条/秒)，平滑度检查丢弃 温度 %d / 湿度 %d，超出范围 %d，写入失败 %d，"
+             "设备 %d 台，用时 %.1f 秒%s", parsed, invalid, totals.get('loaded', 0), totals.get('loaded', 0) / max(load_seconds, 1e-9),
+             totals.get('rejected_temperature', 0), totals.get('rejected_humidity', 0), totals.get('rejected_range', 0),
+             totals.get('failed', 0), len(devices), elapsed, ' (--dry-run，未写入数据库)' if args.dry_run else '')
+    return 1 if totals.get('failed') or crashed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+读数的紧凑编码 (量化 + 增量)
+=====================================
+量化: 按数据库列的精度把读数转换为整数，不损失任何已存储的精度
+    温度  DECIMAL(5,2) -> 0.01°C (centi-degree)
+    湿度  DECIMAL(4,1) -> 0.1%
+    光照  DECIMAL(7,1) -> 0.1 lux (deci-lux)
+    风扇/补光灯/手动模式 -> 一个标志位整数
+
+传输 (SSE /stream?encoding=delta，见 DeltaEncoder):
+    每个连接维护一份设备表，某设备第一次出现时发送完整帧，之后只发送与该设备上一条读数的差值:
+        完整帧 [0, 设备序号, client_id, id, 时间戳(秒), 温度, 湿度, 光照, 标志]
+        增量帧 [1, 设备序号, Δid, Δ时间戳, Δ温度, Δ湿度, Δ光照, 标志]
+    Δid 相对于本连接上一条记录 (ID 全局递增，通常为 1)；id 为 null 表示暂存中尚未入库的记录。
+    SSE 基于 TCP 按序可靠传输，连接断开重连时新连接从完整帧开始，不需要周期性完整帧。
+    encode_binary() 输出同样内容的二进制帧 (zigzag 变长整数)，供二进制通道使用。
+
+归档 (reading_blocks 表，见 archive_blocks.py):
+    同一设备的一段连续读数按列存储 (id/时间戳/温度/湿度/光照/标志 各一列)，每列为增量 + zigzag 变长整数，
+    整块再用 zlib 压缩 (encode_block / decode_block)。
+"""
+import zlib
+from datetime import datetime
+
+SCALES = (('temperature', 100), ('humidity', 10), ('light_intensity', 10))
+
+FLAG_FAN = 1
+FLAG_LIGHT = 2
+FLAG_MANUAL = 4
+
+KEY_FRAME = 0
+DELTA_FRAME = 1
+
+
+def quantize(value, scale):
+    return int(round(float(value) * scale))
+
+
+def flags_of(record):
+    return ((FLAG_FAN if record['fan_status'] else 0) | (FLAG_LIGHT if record['light_status'] else 0)
+            | (FLAG_MANUAL if record['control_mode'] == 'manual' else 0))
+
+
+def apply_flags(record, flags):
+    record['fan_status'] = 1 if flags & FLAG_FAN else 0
+    record['light_status'] = 1 if flags & FLAG_LIGHT else 0
+    record['control_mode'] = 'manual' if flags & FLAG_MANUAL else 'auto'
+    return record
+
+
+def epoch_seconds(timestamp):
+    """datetime / ISO 字符串 -> Unix 时间戳 (秒，按本地时间解释无时区的时间)"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return int(timestamp.timestamp())
+
+
+# =============================================================================
+# 变长整数
+# =============================================================================
+def zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def write_varint(out, n):
+    """无符号变长整数 (每字节7位，最高位表示后面还有字节)"""
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+# =============================================================================
+# 传输: 增量帧
+# =============================================================================
+class DeltaEncoder:
+    """一个连接 (一个订阅者) 的增量编码状态"""
+
+    def __init__(self):
+        # client_id -> [设备序号, 时间戳, 温度, 湿度, 光照]
+        self.devices = {}
+        self.last_id = 0
+
+    def _values(self, record):
+        return [epoch_seconds(record['timestamp'])] + [quantize(record[field], scale) for field, scale in SCALES]
+
+    def _id_delta(self, record_id):
+        if record_id is None:
+            return None
+        delta, self.last_id = record_id - self.last_id, record_id
+        return delta
+
+    def encode(self, record):
+        """一条记录 -> 紧凑数组 (完整帧或增量帧)"""
+        values = self._values(record)
+        state = self.devices.get(record['client_id'])
+        if state is None:
+            index = len(self.devices)
+            self.devices[record['client_id']] = [index] + values
+            if record.get('id') is not None:
+                self.last_id = record['id']
+            return [KEY_FRAME, index, record['client_id'], record.get('id')] + values + [flags_of(record)]
+        frame = [DELTA_FRAME, state[0], self._id_delta(record.get('id'))] + [v - old for v, old in zip(values, state[1:])] + [flags_of(record)]
+        state[1:] = values
+        return frame
+
+    def encode_binary(self, record):
+        """同 encode()，输出二进制帧: 帧类型 | 设备序号 | [client_id 长度 + UTF-8] | id | 时间戳 温度 湿度 光照 | 标志"""
+        frame = self.encode(record)
+        out = bytearray([frame[0]])
+        write_varint(out, frame[1])
+        if frame[0] == KEY_FRAME:
+            name = frame[2].encode('utf-8')
+            write_varint(out, len(name))
+            out += name
+            rest = frame[3:]
+        else:
+            rest = frame[2:]
+        # id 为 None 时写 0 并在标志位中标记 (id 差值不可能为 0)
+        flags = rest[-1] | (8 if rest[0] is None else 0)
+        for value in [rest[0] or 0] + rest[1:-1]:
+            write_varint(out, zigzag(value))
+        out.append(flags)
+        return bytes(out)
+
+
+class DeltaDecoder:
+    """DeltaEncoder 的逆过程 (Python 客户端和测试使用；浏览器端见 static/js/dashboard.js)"""
+
+    def __init__(self):
+        self.devices = []
+        self.last_id = 0
+
+    def decode(self, frame):
+        if frame[0] == KEY_FRAME:
+            _, index, client_id, record_id, *values, flags = frame
+            state = [client_id] + values
+            if index == len(self.devices):
+                self.devices.append(state)
+            else:
+                self.devices[index] = state
+            if record_id is not None:
+                self.last_id = record_id
+        else:
+            _, index, id_delta, *deltas, flags = frame
+            state = self.devices[index]
+            state[1:] = [old + d for old, d in zip(state[1:], deltas)]
+            record_id = None
+            if id_delta is not None:
+                record_id = self.last_id = self.last_id + id_delta
+        client_id, ts, *ints = state
+        record = {'client_id': client_id, 'id': record_id, 'timestamp': datetime.fromtimestamp(ts)}
+        for (field, scale), value in zip(SCALES, ints):
+            record[field] = value / scale
+        return apply_flags(record, flags)
+
+    def decode_binary(self, data):
+        kind, pos = data[0], 1
+        index, pos = read_varint(data, pos)
+        frame = [kind, index]
+        if kind == KEY_FRAME:
+            length, pos = read_varint(data, pos)
+            frame.append(data[pos:pos + length].decode('utf-8'))
+            pos += length
+        values = []
+        for _ in range(5):
+            value, pos = read_varint(data, pos)
+            values.append(unzigzag(value))
+        flags = data[pos]
+        if flags & 8:
+            values[0] = None
+        return self.decode(frame + values + [flags & 7])
+
+
+# =============================================================================
+# 归档: 列式数据块
+# =============================================================================
+BLOCK_VERSION = 1
+BLOCK_COLUMNS = 6  # id, 时间戳, 温度, 湿度, 光照, 标志
+
+
+def encode_block(records):
+    """同一设备按 id 排序的一组记录 -> 压缩的列式数据块"""
+    columns = [[r['id'] for r in records], [epoch_seconds(r['timestamp']) for r in records]]
+    columns += [[quantize(r[field], scale) for r in records] for field, scale in SCALES]
+    columns.append([flags_of(r) for r in records])
+    out = bytearray([BLOCK_VERSION])
+    write_varint(out, len(records))
+    for column in columns:
+        previous = 0
+        for value in column:
+            write_varint(out, zigzag(value - previous))
+            previous = value
+    return zlib.compress(bytes(out), 6)
+
+
+def decode_block(client_id, data):
+    data = zlib.decompress(data)
+    if data[0] != BLOCK_VERSION:
+        raise ValueError(f"不支持的数据块版本: {data[0]}")
+    count, pos = read_varint(data, 1)
+    columns = []
+    for _ in range(BLOCK_COLUMNS):
+        column, previous = [], 0
+        for _ in range(count):
+            value, pos = read_varint(data, pos)
+            previous += unzigzag(value)
+            column.append(previous)
+        columns.append(column)
+    ids, stamps, temps, hums, lights, flags = columns
+    records = []
+    for i in range(count):
+        record = {'id': ids[i], 'client_id': client_id, 'temperature': temps[i] / 100, 'humidity': hums[i] / 10,
+                  'light_intensity': lights[i] / 10, 'timestamp': datetime.fromtimestamp(stamps[i])}
+        records.append(apply_flags(record, flags[i]))
+    return records
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Web 端下发设备指令
+=====================================
+web_display.py 原来在导入时创建MQTT客户端、同步 connect() 并启动网络线程:
+gunicorn 预加载时连接和线程建在 master 进程中 (fork 后子进程里的网络线程不存在)，MQTT 代理不可用时导入直接失败，
+整个面板无法启动。这里提供两种下发方式 (配置 web.command_transport):
+
+- mqtt (默认)  MqttCommandPublisher: 每个 worker 进程第一次下发指令时 (或 gunicorn post_fork 钩子中，见 gunicorn.conf.py)
+               才创建客户端，connect_async + loop_start 不阻塞；代理不可用时 QoS 1 指令在 paho 的发送队列中等待，
+               连上后发出。按进程ID判断，fork 前创建的客户端不会被子进程使用
+- redis        RedisCommandRelay: Web 进程不连接MQTT代理，指令发布到 Redis 频道 "<频道名>:commands"，
+               由网关 (已经维护着MQTT长连接) 订阅后转发 (Gateway.on_relayed_commands)
+
+两种方式都按批下发: publish_many() 一次调用提交一组 (主题, 载荷)，批量控制只产生一次 Redis 发布或一次加锁。
+"""
+import json
+import os
+import threading
+import time
+
+import iot_log
+import metrics
+from device_groups import valid_name
+
+log = iot_log.get_logger('commands')
+
+COMMAND_TOPIC_FORMAT = "stm32/command/{client_id}"
+TRANSPORTS = ('mqtt', 'redis')
+# 代理不可用期间每个进程最多排队的指令数，超出后 publish 返回失败
+MAX_QUEUED_COMMANDS = 10000
+
+
+def command_payload(command):
+    return json.dumps({"command": command, "timestamp": time.time()})
+
+
+def command_channel(redis_channel):
+    """指令转发使用的 Redis 频道"""
+    return f'{redis_channel}:commands'
+
+
+def is_command_topic(topic):
+    """只转发设备指令和分组指令主题 (见 device_groups.py 的主题约定)"""
+    parts = topic.split('/') if isinstance(topic, str) else []
+    if len(parts) == 3 and parts[:2] == ['stm32', 'command']:
+        return bool(parts[2]) and not any(c in parts[2] for c in '+#')
+    if parts[:1] == ['site'] and parts[-1:] == ['command'] and valid_name(parts[1]):
+        return len(parts) == 3 or (len(parts) == 5 and parts[2] == 'gh' and valid_name(parts[3]))
+    return False
+
+
+def decode_relayed(message):
+    """Redis 频道消息 -> [(主题, 载荷), ...]，忽略格式不符和非指令主题的项"""
+    try:
+        items = json.loads(message)
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(items, list):
+        return []
+    return [(item[0], item[1]) for item in items
+            if isinstance(item, list) and len(item) == 2 and is_command_topic(item[0]) and isinstance(item[1], str)]
+
+
+class MqttCommandPublisher:
+    """每个进程一个MQTT客户端，第一次使用时创建并异步连接"""
+
+    def __init__(self, broker_ip, port, client_prefix='web_control', tenant='default'):
+        self.broker_ip = broker_ip
+        self.port = port
+        self.client_prefix = client_prefix
+        self._connected = metrics.MQTT_CONNECTED.labels(tenant)
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            self._connected.set(1)
+            log.info("✅ 指令发布连接已连接到MQTT代理 (进程 %d)", os.getpid())
+        else:
+            log.error("❌ 指令发布连接失败，错误代码: %s", rc)
+
+    def _on_disconnect(self, client, userdata, flags, rc, properties=None):
+        self._connected.set(0)
+        log.warning("⚠️ 指令发布连接断开: %s，paho 网络线程会自动重连", rc)
+
+    def client(self):
+        """当前进程的客户端；fork 后的子进程中会重新创建"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._client
+        with self._lock:
+            if self._pid != pid:
+                import paho.mqtt.client as mqtt
+                client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"{self.client_prefix}_{pid}_{int(time.time())}")
+                client.on_connect, client.on_disconnect = self._on_connect, self._on_disconnect
+                client.max_queued_messages_set(MAX_QUEUED_COMMANDS)
+                client.reconnect_delay_set(min_delay=1, max_delay=60)
+                # 只记录目标地址，连接在网络线程中进行，代理不可用也不会阻塞调用方
+                client.connect_async(self.broker_ip, self.port)
+                client.loop_start()
+                self._client, self._pid = client, pid
+        return self._client
+
+    def post_fork(self):
+        """gunicorn post_fork 钩子调用: worker 启动时就开始连接，第一条指令不需要等待连接建立"""
+        self._client, self._pid = None, None
+        self.client()
+
+    def publish_many(self, messages):
+        """messages: [(主题, 载荷), ...]；全部放入发送队列时返回 True"""
+        import paho.mqtt.client as mqtt
+        client = self.client()
+        ok = True
+        with self._lock:
+            for topic, payload in messages:
+                rc = client.publish(topic, payload, qos=1).rc
+                # 未连接时 QoS 1 消息留在发送队列中 (rc 为 NO_CONN)，连上后发出
+                if rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                    ok = False
+        if not ok:
+            log.error("❌ 指令发送队列已满，部分指令未下发")
+        return ok
+
+    def close(self):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.loop_stop()
+            self._client.disconnect()
+        self._client, self._pid = None, None
+
+
+class RedisCommandRelay:
+    """指令发布到 Redis 频道，由网关转发到MQTT代理；redis_client 为 redis.Redis 实例"""
+
+    def __init__(self, redis_client, redis_channel):
+        self.redis = redis_client
+        self.channel = command_channel(redis_channel)
+
+    def post_fork(self):
+        pass
+
+    def publish_many(self, messages):
+        try:
+            receivers = self.redis.publish(self.channel, json.dumps([list(m) for m in messages]))
+        except Exception as e:
+            log.error("❌ 指令发布到Redis失败: %s", e)
+            return False
+        if not receivers:
+            log.warning("⚠️ 没有网关订阅指令频道 %s，指令未下发", self.channel)
+            return False
+        return True
+
+    def close(self):
+        pass
+
+
+def from_config(tenant_config, redis_client=None, tenant='default'):
+    """按 web.command_transport 创建指令发布器；redis 方式需要传入 redis_client，tenant 为指标标签"""
+    transport = tenant_config['web']['command_transport']
+    if transport == 'redis':
+        return RedisCommandRelay(redis_client, tenant_config['redis']['channel'])
+    mqtt = tenant_config['mqtt']
+    return MqttCommandPublisher(mqtt['broker_ip'], mqtt['port'], tenant=tenant)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+配置子系统 (配置文件 + 环境变量覆盖 + 热加载 + 多租户)
+=====================================
+配置来源，优先级从低到高:
+1. 本模块的 DEFAULTS (与原来各服务文件中的常量一致，不提供配置文件时行为不变)
+2. JSON 配置文件，路径由环境变量 IOT_CONFIG 指定，默认 iot_config.json (不存在时跳过)
+3. 环境变量 IOT__<段>__<键>，例如 IOT__MYSQL__HOST=10.0.0.5、IOT__THRESHOLDS__FAN_ON_TEMP=28
+   (值按 JSON 解析，解析失败时作为字符串)，作用于所有租户的公共配置
+
+配置文件示例 (见 iot_config.example.json):
+    {
+      "mysql": {"host": "localhost", ...},          公共配置，各租户继承
+      "thresholds": {"fan_on_temp": 30.0, ...},
+      "tenants": {
+        "default": {},
+        "farm_b": {"mqtt": {"broker_ip": "10.0.1.2"}, "mysql": {"database": "farm_b"}}
+      }
+    }
+没有 tenants 段时只有一个名为 default 的租户。每个租户使用自己的 MQTT 连接、数据库连接、
+Redis 连接、暂存文件和站点工作线程，互不影响；非默认租户没有单独指定时，MQTT 客户端ID、
+Redis 频道、暂存文件名和 SQLite 文件名自动追加 _<租户名>。Web端和旧版网关通过环境变量 IOT_TENANT 选择租户。
+
+网关消息处理流水线由 pipeline 段选择 (见 gateway/pipeline.py)，命令行 --pipeline 可以覆盖预设。
+
+热加载: ConfigManager.watch() 定期检查文件修改时间，或收到 SIGHUP 时 reload()；
+阈值类配置 (thresholds) 直接生效，连接类配置变化时由使用方重建对应租户。
+"""
+import copy
+import json
+import os
+import signal
+import socket
+import threading
+
+import iot_log
+
+log = iot_log.get_logger('config')
+
+DEFAULT_TENANT = 'default'
+DEFAULT_PATH = 'iot_config.json'
+ENV_PREFIX = 'IOT__'
+
+DEFAULTS = {
+    'mqtt': {
+        'broker_ip': 'localhost',
+        'port': 1883,
+        'timeout': 60,
+        # 固定的客户端ID + 持久会话
+        'client_id': f"mqtt_gateway_{socket.gethostname()}",
+    },
+    'mysql': {
+        'host': 'localhost',
+        'user': 'm2joy',
+        'password': 'Liu041121@',
+        'database': 'iot_data',
+    },
+    'redis': {
+        'host': 'localhost',
+        'port': 6379,
+        'channel': 'iot_data_stream',
+    },
+    'thresholds': {
+        # 自动控制: 温度 >= fan_on_temp 开风扇，<= fan_off_temp 关风扇；光照 < light_on_lux 开补光灯
+        'fan_on_temp': 30.0,
+        'fan_off_temp': 25.0,
+        'light_on_lux': 50.0,
+        # 数据平滑度检查: 单次读数变化超过阈值的数据被丢弃
+        'smoothing_enabled': True,
+        'max_temp_change': 10.0,
+        'max_humidity_change': 25.0,
+    },
+    'gateway': {
+        # MySQL 不可用时读数暂存到此本地文件
+        'spool_path': 'gateway_spool.dat',
+        'site_queues': True,
+        # 过载策略 (见 backpressure.py): 站点队列中每台设备最多 device_budget 条待处理读数，
+        # 超出时合并为最新值 (latest) 或平均值 + 最小/最大值 (summary)
+        'device_budget': 50,
+        'overload_policy': 'latest',
+        # 批量写库: 攒够 batch_size 条或等待超过 batch_delay_ms 毫秒时写入一批
+        'batch_size': 200,
+        'batch_delay_ms': 50,
+        # 设备状态缓存的有效期 (秒)，过期后重新查询数据库
+        'state_ttl': 30.0,
+        # 设备在线状态 (pipeline.presence = wheel): 超过 presence_timeout 秒没有读数判定离线，每 presence_tick 秒检查一次
+        'presence_timeout': 60.0,
+        'presence_tick': 1.0,
+        # 上报间隔调整 (pipeline.rate = adaptive，见 adaptive_rate.py): 设备固件默认间隔、最短和最长间隔 (秒)
+        'report_interval': 10.0,
+        'min_report_interval': 2.0,
+        'max_report_interval': 60.0,
+        # 滑动窗口统计 (pipeline.stats = rolling): 窗口长度 (秒) 和写入 Redis 的间隔 (秒)
+        'stats_windows': [300, 3600],
+        'stats_interval': 5.0,
+    },
+    # Web 面板: 设备指令直接发布到MQTT代理 (mqtt)，或经 Redis 频道由网关转发 (redis，Web 进程不连接代理)，见 command_bus.py
+    'web': {
+        'command_transport': 'mqtt',
+    },
+    # 网关存储后端: mysql (默认) 或 sqlite (边缘网关，本地 SQLite + 同步到中心 MySQL，见 edge_sync.py)
+    'storage': {
+        'backend': 'mysql',
+        'sqlite_path': 'iot_edge.db',
+        # sqlite 时是否把数据同步到 mysql 段配置的中心数据库
+        'sync': True,
+        'sync_interval': 5.0,
+        'sync_batch_size': 1000,
+        # 已同步的本地数据保留天数，0 表示不清理
+        'retention_days': 7,
+    },
+    # 网关消息处理流水线: preset 选择预设，也可以单独指定某个阶段的实现 (见 gateway/pipeline.py)
+    'pipeline': {
+        'preset': 'fuwu_new',
+    },
+    # 进程级配置 (不区分租户)
+    'metrics_port': 9100,
+    # 是否在指标端口上开放 /debug/profile (可以开关剖析，没有鉴权)
+    'debug_profile': False,
+}
+
+# 只对整个进程生效、不属于租户的顶层键
+PROCESS_KEYS = ('metrics_port', 'debug_profile')
+
+
+def deep_merge(base, override):
+    """递归合并字典，返回新字典，不修改参数"""
+    result = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = deep_merge(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def env_overrides(environ):
+    """IOT__MYSQL__HOST=x -> {'mysql': {'host': 'x'}}"""
+    overrides = {}
+    for name, raw in environ.items():
+        if not name.startswith(ENV_PREFIX):
+            continue
+        path = [part.lower() for part in name[len(ENV_PREFIX):].split('__') if part]
+        if not path:
+            continue
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        node = overrides
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        node[path[-1]] = value
+    return overrides
+
+
+class Config:
+    """一次加载得到的完整配置 (只读快照)"""
+
+    def __init__(self, data, source=None):
+        self.source = source
+        data = copy.deepcopy(data)
+        tenants = data.pop('tenants', None) or {DEFAULT_TENANT: {}}
+        self.process = {key: data.get(key) for key in PROCESS_KEYS}
+        common = {key: value for key, value in data.items() if key not in PROCESS_KEYS}
+        self.tenants = {}
+        for name, override in tenants.items():
+            tenant = deep_merge(common, override or {})
+            if name != DEFAULT_TENANT:
+                if 'client_id' not in (override or {}).get('mqtt', {}):
+                    tenant['mqtt']['client_id'] = f"{tenant['mqtt']['client_id']}_{name}"
+                if 'channel' not in (override or {}).get('redis', {}):
+                    tenant['redis']['channel'] = f"{tenant['redis']['channel']}_{name}"
+                if 'spool_path' not in (override or {}).get('gateway', {}):
+                    root, ext = os.path.splitext(tenant['gateway']['spool_path'])
+                    tenant['gateway']['spool_path'] = f"{root}_{name}{ext}"
+                if 'sqlite_path' not in (override or {}).get('storage', {}):
+                    root, ext = os.path.splitext(tenant['storage']['sqlite_path'])
+                    tenant['storage']['sqlite_path'] = f"{root}_{name}{ext}"
+            self.tenants[name] = tenant
+
+    def tenant(self, name=DEFAULT_TENANT):
+        """指定租户的配置；只有一个租户时不传名称也能取到"""
+        if name not in self.tenants and len(self.tenants) == 1:
+            return next(iter(self.tenants.values()))
+        return self.tenants[name]
+
+    def __getitem__(self, key):
+        return self.process[key]
+
+
+def load(path=None, environ=None, overrides=None):
+    """读取 默认值 + 配置文件 + 环境变量 (+ 命令行参数 overrides)，返回 Config"""
+    environ = os.environ if environ is None else environ
+    path = path or environ.get('IOT_CONFIG', DEFAULT_PATH)
+    data = DEFAULTS
+    source = None
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            data = deep_merge(data, json.load(f))
+        source = path
+    data = deep_merge(data, env_overrides(environ))
+    if overrides:
+        data = deep_merge(data, overrides)
+    return Config(data, source)
+
+
+def load_tenant(name=None, path=None):
+    """单租户服务 (Web端、旧版网关) 使用: 返回 (环境变量 IOT_TENANT 指定的租户配置, 完整 Config)，默认租户为 default"""
+    config = load(path)
+    return config.tenant(name or os.environ.get('IOT_TENANT', DEFAULT_TENANT)), config
+
+
+class ConfigManager:
+    """持有当前配置，支持热加载并通知订阅方 callback(old, new)"""
+
+    def __init__(self, path=None, environ=None, overrides=None):
+        """overrides: 优先级最高的配置 (如命令行 --pipeline)，每次重新加载时都保留"""
+        self.environ = os.environ if environ is None else environ
+        self.overrides = overrides
+        self.path = path or self.environ.get('IOT_CONFIG', DEFAULT_PATH)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._mtime = self._file_mtime()
+        self.current = load(self.path, self.environ, self.overrides)
+        self._stop_event = threading.Event()
+
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def on_reload(self, callback):
+        self._listeners.append(callback)
+
+    def reload(self):
+        """重新加载配置；文件格式错误时保留原配置。返回是否加载成功"""
+        with self._lock:
+            self._mtime = self._file_mtime()
+            try:
+                new = load(self.path, self.environ, self.overrides)
+            except (OSError, ValueError) as e:
+                log.error("❌ 重新加载配置失败，继续使用原配置: %s", e)
+                return False
+            old, self.current = self.current, new
+        log.info("🔄 配置已重新加载 (%s)", new.source or '默认值')
+        for callback in list(self._listeners):
+            try:
+                callback(old, new)
+            except Exception as e:
+                log.exception("❌ 应用新配置失败: %s", e)
+        return True
+
+    def watch(self, interval=5.0):
+        """后台线程定期检查配置文件修改时间，变化时自动 reload()"""
+        def run():
+            while not self._stop_event.wait(interval):
+                if self._file_mtime() != self._mtime:
+                    self.reload()
+        threading.Thread(target=run, name='config-watch', daemon=True).start()
+
+    def install_signal_handler(self, sig=None):
+        """kill -HUP <pid> 重新加载配置 (仅限主线程调用，Windows 下没有 SIGHUP)"""
+        sig = sig or getattr(signal, 'SIGHUP', None)
+        if sig is not None:
+            signal.signal(sig, lambda signum, frame: threading.Thread(target=self.reload, daemon=True).start())
+
+    def stop(self):
+        self._stop_event.set()
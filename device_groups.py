@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+设备分组与分层主题路由
+=====================================
+设备按 站点 (site) / 温室 (greenhouse) / 设备 三级组织，分组关系保存在 device_groups 表中
+(见 backends.DEVICE_GROUPS_DDL)。站点由设备上报数据的主题决定，温室由Web端分配。
+
+主题约定:
+    上报数据   site/{site}/data                  网关以通配符 site/+/data 订阅
+               stm32/data                        旧主题，继续订阅，不带站点信息
+    设备指令   stm32/command/{client_id}         单台设备 (不变)
+    分组指令   site/{site}/command               整个站点
+               site/{site}/gh/{greenhouse}/command  一个温室
+设备固件除了自己的指令主题外，还需订阅所属站点和温室的分组指令主题，
+这样一次分组操作只需要发布一条MQTT消息，而不是逐台下发。
+
+- SiteRouter: 网关按站点把消息分发到各自的处理队列 (每个站点一个工作线程)，
+  某个站点的突发流量或慢处理不会阻塞其他站点；同一设备的消息始终进入同一队列，保持顺序。
+  站点队列内每台设备有待处理限额，超出时按过载策略合并 (见 backpressure.py)
+"""
+import threading
+
+import iot_log
+import metrics
+from backpressure import COALESCERS, DEFAULT_BUDGET, CoalescingQueue
+
+log = iot_log.get_logger('groups')
+
+DEFAULT_SITE = 'default'
+DEFAULT_GREENHOUSE = 'default'
+
+SITE_DATA_TOPIC = 'site/{site}/data'
+SITE_DATA_SUBSCRIPTION = 'site/+/data'
+SITE_COMMAND_TOPIC = 'site/{site}/command'
+GREENHOUSE_COMMAND_TOPIC = 'site/{site}/gh/{greenhouse}/command'
+
+# 站点队列数量上限，防止异常主题无限创建线程；超出后的站点并入默认队列
+MAX_SITES = 256
+SITE_QUEUE_SIZE = 10000
+
+
+def valid_name(name):
+    """站点/温室名称会出现在主题中，不能为空，也不能包含主题分隔符和通配符"""
+    return isinstance(name, str) and 0 < len(name) <= 64 and not any(c in name for c in '/+#')
+
+
+def site_from_topic(topic):
+    """site/{site}/data -> site；旧主题或格式不符时返回 None"""
+    parts = topic.split('/')
+    if len(parts) == 3 and parts[0] == 'site' and parts[2] == 'data' and valid_name(parts[1]):
+        return parts[1]
+    return None
+
+
+def group_command_topic(site, greenhouse=None):
+    """分组指令主题: 指定温室时发往该温室，否则发往整个站点"""
+    if greenhouse:
+        return GREENHOUSE_COMMAND_TOPIC.format(site=site, greenhouse=greenhouse)
+    return SITE_COMMAND_TOPIC.format(site=site)
+
+
+_PRIORITY = object()
+
+
+class SiteRouter:
+    """
+    按站点分发消息到各自的合并队列，每个站点一个工作线程调用 handler(site, item)。
+    同一设备 (device_key) 的待处理消息超过 budget 时按 policy 合并 (item 为 gateway.pipeline.Reading)。
+    """
+
+    def __init__(self, handler, maxsize=SITE_QUEUE_SIZE, max_sites=MAX_SITES, label_prefix='', budget=DEFAULT_BUDGET, policy='latest'):
+        """label_prefix: 队列深度指标标签的前缀，多租户时区分不同租户的同名站点"""
+        if policy not in COALESCERS:
+            raise ValueError(f"未知的过载策略: {policy} (可选: {', '.join(COALESCERS)})")
+        self.handler = handler
+        self.label_prefix = label_prefix
+        self.maxsize = maxsize
+        self.max_sites = max_sites
+        self.budget = budget
+        self.policy = policy
+        coalesce = COALESCERS[policy]
+        # 队列项为 (site, item)，合并后保留新消息的站点
+        self._merge = lambda pending, new: (new[0], coalesce(pending[1], new[1]))
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._threads = []
+
+    def _queue(self, site):
+        q = self._queues.get(site or DEFAULT_SITE)
+        return q if q is not None else self._start(site or DEFAULT_SITE)
+
+    def route(self, site, item, device_key):
+        """放入站点队列；设备超出限额时与其最后一条待处理消息合并，站点总数达到上限时阻塞调用方 (由MQTT代理缓冲)"""
+        self._queue(site).put(device_key, (site, item), self._merge)
+
+    def route_priority(self, site, func):
+        """在站点工作线程中、先于积压的消息执行 func() (Web端手动控制)，与该站点的消息处理互不并发"""
+        self._queue(site).put_priority((_PRIORITY, func))
+
+    def _start(self, key):
+        with self._lock:
+            if key in self._queues:
+                return self._queues[key]
+            if len(self._queues) >= self.max_sites and key != DEFAULT_SITE:
+                log.warning("⚠️ 站点数量超过上限 %d，站点 %s 的消息并入默认队列", self.max_sites, key)
+                self._queues[key] = self._queues.get(DEFAULT_SITE) or self._spawn(DEFAULT_SITE)
+                return self._queues[key]
+            return self._spawn(key)
+
+    def _spawn(self, key):
+        q = CoalescingQueue(self.budget, self.maxsize, name=f'{self.label_prefix}site:{key}', policy=self.policy)
+        thread = threading.Thread(target=self._run, args=(q,), name=f'site-{key}', daemon=True)
+        self._queues[key] = q
+        self._threads.append((q, thread))
+        metrics.QUEUE_DEPTH.labels(f'{self.label_prefix}site:{key}').set_function(q.qsize)
+        thread.start()
+        log.info("🏭 站点 %s 的处理队列已启动", key)
+        return q
+
+    def _run(self, q):
+        while True:
+            entry = q.get()
+            if entry is None:
+                return
+            site, item = entry
+            try:
+                if site is _PRIORITY:
+                    item()
+                else:
+                    self.handler(site, item)
+            except Exception as e:
+                log.exception("❌ 站点队列处理消息失败: %s", e)
+            finally:
+                q.task_done()
+
+    def join(self):
+        """等待所有已入队的消息处理完毕"""
+        for q, _ in list(self._threads):
+            q.join()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            threads, self._threads, self._queues = self._threads, [], {}
+        # 关闭后工作线程处理完剩余消息再退出
+        for q, _ in threads:
+            q.close()
+        for _, thread in threads:
+            thread.join(timeout)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+边缘网关 -> 中心 MySQL 同步
+=====================================
+边缘盒子上的网关把读数写入本地 SQLite (backends.SQLiteStorage)，本模块在网络可用时
+按ID顺序把新数据分批转发到中心 MySQL (多行 INSERT，保留原始采集时间)，并同步设备站点登记。
+- 同步进度保存在本地 sync_state 表中，重启后从断点继续
+- 中心数据库不可用时由 MySQLStorage 的熔断器控制重试间隔，本地继续正常写入
+- 已同步且超过保留期 (retention_days) 的本地数据定期清理，防止边缘盒子磁盘写满
+- 语义为"至少一次": 写入中心库后、记录进度前进程崩溃，重启后该批会重复发送一次
+
+网关配置 storage.backend = "sqlite" 且 storage.sync 为 true 时自动启动同步线程；也可以单独运行:
+    python edge_sync.py --once          # 同步一次后退出 (例如由 cron 调用)
+    python edge_sync.py                 # 持续同步
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+import iot_log
+import metrics
+from backends import MySQLStorage, SQLiteStorage, StorageError
+
+log = iot_log.get_logger('edge_sync')
+
+# 清理已同步旧数据的间隔 (秒)
+PRUNE_INTERVAL = 3600
+
+
+class EdgeSync(threading.Thread):
+    """后台线程: 把 SQLiteStorage 中未同步的读数按批写入中心存储"""
+
+    def __init__(self, local, central, batch_size=1000, interval=5.0, retention_days=7):
+        super().__init__(name='edge-sync', daemon=True)
+        self.local = local
+        self.central = central
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retention_days = retention_days
+        self._central_ready = False
+        self._last_prune = 0.0
+        self._stop_event = threading.Event()
+
+    def sync_once(self):
+        """同步一批读数 (以及待同步的设备站点)，返回同步的读数条数；中心数据库不可用时返回 0"""
+        try:
+            if not self._central_ready:
+                # 中心库的表只需创建一次
+                self.central.setup()
+                self._central_ready = True
+            devices = self.local.unsynced_devices()
+            for device in devices:
+                self.central.register_device(device['client_id'], device['site'])
+            if devices:
+                self.local.mark_devices_synced(devices)
+            rows = self.local.unsynced_readings(self.batch_size)
+            if rows:
+                self.central.insert_many([{key: row[key] for key in row if key != 'id'} for row in rows])
+                self.local.mark_synced(rows[-1]['id'])
+        except StorageError as e:
+            log.debug("同步到中心数据库失败: %s", e)
+            return 0
+        if rows:
+            metrics.READINGS_SYNCED.inc(len(rows))
+            log.info("🔁 已同步 %d 条读数到中心数据库，剩余约 %d 条", len(rows), self.local.sync_backlog())
+        return len(rows)
+
+    def prune_once(self):
+        if not self.retention_days:
+            return 0
+        deleted = self.local.prune(datetime.now() - timedelta(days=self.retention_days))
+        if deleted:
+            log.info("🧹 已清理 %d 条已同步的本地旧数据 (保留 %s 天)", deleted, self.retention_days)
+        return deleted
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                synced = self.sync_once()
+                if time.monotonic() - self._last_prune >= PRUNE_INTERVAL:
+                    self._last_prune = time.monotonic()
+                    self.prune_once()
+            except StorageError as e:
+                log.error("❌ 本地SQLite数据库操作失败: %s", e)
+                synced = 0
+            # 积压时连续同步，否则等待一个周期
+            if synced < self.batch_size:
+                self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def from_config(local, tenant_config):
+    """按租户配置的 storage 段创建同步线程 (未启动)，中心库使用租户的 mysql 配置"""
+    settings = tenant_config['storage']
+    return EdgeSync(local, MySQLStorage(tenant_config['mysql']), batch_size=settings['sync_batch_size'],
+                    interval=settings['sync_interval'], retention_days=settings['retention_days'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把边缘网关的本地 SQLite 数据同步到中心 MySQL')
+    parser.add_argument('--once', action='store_true', help='同步完当前积压的数据后退出')
+    parser.add_argument('--tenant', help='租户名 (默认取环境变量 IOT_TENANT)')
+    args = parser.parse_args()
+    iot_log.setup_logging()
+    tenant_config, _ = config.load_tenant(args.tenant)
+    local = SQLiteStorage(tenant_config['storage']['sqlite_path'])
+    local.setup()
+    sync = from_config(local, tenant_config)
+    if args.once:
+        while sync.sync_once() == sync.batch_size:
+            pass
+        sync.prune_once()
+        log.info("✅ 同步完成，剩余 %d 条未同步", local.sync_backlog())
+        return
+    sync.start()
+    log.info("🚀 边缘同步已启动: %s -> %s/%s", local.path, tenant_config['mysql']['host'], tenant_config['mysql']['database'])
+    try:
+        while sync.is_alive(): sync.join(1)
+    except KeyboardInterrupt:
+        sync.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+MQTT物联网网关 (统一版)
+=====================================
+原 fuwu.py / fuwu_nojson.py / fuwu_new.py 三个版本合并为一个网关，差异由可组合的流水线阶段表达，
+在配置的 pipeline 段中选择 (见 gateway/pipeline.py)。
+"""
+from gateway.core import Gateway, DATA_TOPIC, COMMAND_TOPIC_FORMAT
+from gateway.pipeline import Reading, Stage, Pipeline, PRESETS, DEFAULT_PRESET, build_pipeline, pipeline_spec
+from gateway.supervisor import TenantSupervisor
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+网关启动入口
+=====================================
+    python -m gateway                          # 按配置文件的 pipeline 段 (默认 fuwu_new 预设)
+    python -m gateway --pipeline fuwu_nojson   # 指定预设，覆盖配置文件
+    python fuwu.py / fuwu_nojson.py / fuwu_new.py  # 兼容旧的启动方式，分别对应同名预设
+"""
+import argparse
+import time
+
+import config
+import iot_log
+import metrics
+from gateway.pipeline import PRESETS
+from gateway.supervisor import TenantSupervisor
+
+log = iot_log.get_logger('gateway')
+
+
+def main(argv=None, preset=None):
+    parser = argparse.ArgumentParser(description='MQTT物联网网关服务')
+    parser.add_argument('--pipeline', choices=sorted(PRESETS), default=preset, help='流水线预设 (默认取配置文件中的 pipeline.preset)')
+    parser.add_argument('--config', help='配置文件路径 (默认取环境变量 IOT_CONFIG 或 iot_config.json)')
+    args = parser.parse_args(argv)
+
+    iot_log.setup_logging()
+    overrides = {'pipeline': {'preset': args.pipeline}} if args.pipeline else None
+    manager = config.ConfigManager(args.config, overrides=overrides)
+    log.info("⚙️ 配置来源: %s，租户: %s", manager.current.source or '默认值', ', '.join(manager.current.tenants))
+    supervisor = TenantSupervisor(manager)
+    metrics_port = manager.current['metrics_port']
+    if manager.current['debug_profile']:
+        metrics.add_route('/debug/profile', supervisor.handle_profile)
+    metrics.start_http_server(metrics_port)
+    supervisor.install_signal_handlers()
+    # 配置文件修改后自动生效，也可以 kill -HUP <pid> 立即重新加载
+    manager.install_signal_handler()
+    manager.watch()
+    log.info("📈 指标接口: http://0.0.0.0:%s/metrics", metrics_port)
+    log.info("🔬 剖析: kill -USR1 <pid> 开/关, kill -USR2 <pid> 输出报告%s",
+             ", 或访问 /debug/profile" if manager.current['debug_profile'] else "")
+    log.info("🚀 MQTT物联网网关服务已启动")
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        manager.stop()
+        supervisor.stop()
+        log.info("✅ 网关服务已安全关闭")
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+网关主体: 连接管理 + 按配置组装的消息处理流水线
+=====================================
+一个 Gateway 对应一个租户: 一个 MQTT 连接 (带监督线程自动重连)、一个存储后端 (长连接 + 熔断器，
+不再每条消息检查/重建连接)、一个 Redis 连接、本地暂存文件和站点工作线程。
+消息处理逻辑全部在流水线各阶段中 (见 gateway/pipeline.py、gateway/stages.py)。
+"""
+import json
+import time
+from datetime import datetime
+
+import command_bus
+import config
+import edge_sync
+import iot_log
+import metrics
+from backends import MySQLStorage, SQLiteStorage, RedisPubSub, PahoTransport, StorageError
+from device_groups import SITE_DATA_SUBSCRIPTION, SiteRouter, site_from_topic, group_command_topic
+from gateway.pipeline import Reading, build_pipeline, pipeline_spec
+from profiler import StageProfiler
+from spool import Spool, SpoolReplayer
+
+log = iot_log.get_logger('gateway')
+msg_log = iot_log.get_message_logger('gateway')
+
+DATA_TOPIC = "stm32/data"
+COMMAND_TOPIC_FORMAT = "stm32/command/{client_id}"
+# 固定的客户端ID + 持久会话: 网关重启期间代理会保留发往 QoS 1 订阅的数据，重连后补发
+DATA_TOPIC_QOS = 1
+
+
+class Gateway:
+    def __init__(self, tenant_config, name=config.DEFAULT_TENANT, storage=None, pubsub=None, transport=None):
+        """
+        tenant_config 为 config.py 中一个租户的配置，其中 pipeline 段选择各阶段的实现。
+        storage / pubsub / transport 为可插拔后端 (见 backends.py)，不传时按配置创建 MySQL、Redis、paho 实现；
+        压测时可以传入 Memory* 后端在进程内运行。
+        """
+        self.name = name
+        self.config = tenant_config
+        self.settings = tenant_config['gateway']
+        self.redis_channel = tenant_config['redis']['channel']
+        # 每条消息开始处理时取一次引用，热加载只替换整个字典，处理中的消息使用一致的旧阈值
+        self.thresholds = dict(config.DEFAULTS['thresholds'], **tenant_config['thresholds'])
+        # 非默认租户的队列指标加上租户名前缀
+        self.label_prefix = '' if name == config.DEFAULT_TENANT else f'{name}/'
+        # 已登记到 device_groups 的设备站点，站点变化时才写库
+        self.device_sites = {}
+        # 分阶段剖析器，默认关闭；可通过 SIGUSR1/SIGUSR2 或指标端口的 /debug/profile 控制
+        self.profiler = StageProfiler('on_message')
+
+        self.sync = None
+        self.storage = storage if storage is not None else self._create_storage(tenant_config)
+        try:
+            self.storage.setup()
+        except StorageError as e:
+            log.error("❌ %s", e)
+        if isinstance(self.storage, SQLiteStorage) and tenant_config['storage']['sync']:
+            self.sync = edge_sync.from_config(self.storage, tenant_config)
+            metrics.QUEUE_DEPTH.labels(f'{self.label_prefix}edge_sync').set_function(self.storage.sync_backlog)
+            self.sync.start()
+
+        self.spool = None
+        self.replayer = None
+        spool_path = self.settings.get('spool_path')
+        if spool_path:
+            self.spool = Spool(spool_path)
+            metrics.QUEUE_DEPTH.labels(f'{self.label_prefix}spool').set_function(lambda: self.spool.pending)
+            self.replayer = SpoolReplayer(self.spool, self.storage)
+            self.replayer.start()
+        breaker = getattr(self.storage, 'breaker', None)
+        if breaker is not None:
+            metrics.DB_CIRCUIT_OPEN.labels(name).set_function(lambda: 1 if breaker.is_open else 0)
+
+        self.spec = pipeline_spec(tenant_config.get('pipeline'))
+        # Web 面板配置为经 Redis 下发指令时，由网关转发到MQTT代理 (见 command_bus.py)
+        self.relay_commands = tenant_config['web']['command_transport'] == 'redis'
+        # 只有用到 Redis 的阶段 (notify、cached state 的失效通知、stats 的统计键、presence 的在线状态、rate 的已下发间隔) 和指令转发才连接 Redis
+        self.pubsub = pubsub
+        if pubsub is None and (self.spec['notify'] == 'redis' or self.spec['state'] == 'cached' or self.spec['stats'] == 'rolling'
+                               or self.spec['presence'] == 'wheel' or self.spec['rate'] == 'adaptive' or self.relay_commands):
+            self.pubsub = self._connect_redis(tenant_config['redis'])
+
+        self.pipeline = build_pipeline(self, self.spec)
+        self.state = self.pipeline.get('state')
+        self.notifier = self.pipeline.get('notify')
+        self.pipeline.start()
+        log.info("🧩 租户 %s 的处理流水线: %s", name,
+                 ' -> '.join(f'{stage}:{impl}' for stage, impl in self.spec.items() if impl != 'none'))
+
+        self.decoder = self.pipeline.get('decode')
+        self.router = None
+        if self.settings.get('site_queues', True):
+            self.router = SiteRouter(self.handle_message, label_prefix=self.label_prefix,
+                                     budget=self.settings.get('device_budget', 50), policy=self.settings.get('overload_policy', 'latest'))
+
+        mqtt = tenant_config['mqtt']
+        self.transport = transport if transport is not None else PahoTransport(mqtt['broker_ip'], mqtt['port'], mqtt['timeout'], mqtt['client_id'], tenant=name)
+        # 连接、断线重连都由传输层的监督线程负责，这里不会阻塞也不会抛出连接异常
+        self.transport.start(self.on_connect, self.on_message)
+        if self.relay_commands and self.pubsub is not None:
+            self.pubsub.subscribe(command_bus.command_channel(self.redis_channel), self.on_relayed_commands)
+            log.info("📡 转发Web端指令: %s", command_bus.command_channel(self.redis_channel))
+
+    @staticmethod
+    def _create_storage(tenant_config):
+        # 边缘网关使用本地 SQLite，不需要在现场运行 MySQL 服务器
+        if tenant_config['storage']['backend'] == 'sqlite':
+            log.info("🗄️  使用本地SQLite存储: %s", tenant_config['storage']['sqlite_path'])
+            return SQLiteStorage(tenant_config['storage']['sqlite_path'])
+        return MySQLStorage(tenant_config['mysql'])
+
+    @staticmethod
+    def _connect_redis(redis_config):
+        try:
+            pubsub = RedisPubSub(redis_config['host'], redis_config['port'])
+            log.info("✅ 成功连接到Redis服务器")
+            return pubsub
+        except Exception as e:
+            log.error("❌ 连接Redis失败: %s", e)
+            return None
+
+    def update_thresholds(self, thresholds):
+        """热加载阈值: 整体替换字典，队列中和处理中的消息都不受影响"""
+        self.thresholds = dict(config.DEFAULTS['thresholds'], **thresholds)
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            log.info("✅ 成功连接到MQTT代理服务器!")
+            # 每次(重)连接都重新订阅；持久会话下订阅已存在时代理会直接沿用
+            self.transport.subscribe(DATA_TOPIC, qos=DATA_TOPIC_QOS)
+            self.transport.subscribe(SITE_DATA_SUBSCRIPTION, qos=DATA_TOPIC_QOS)
+            log.info("📡 已订阅主题: %s, %s", DATA_TOPIC, SITE_DATA_SUBSCRIPTION)
+        else:
+            log.error("❌ 连接失败，错误代码: %s", rc)
+
+    def on_message(self, client, userdata, msg):
+        metrics.MESSAGES_RECEIVED.inc()
+        site = site_from_topic(msg.topic)
+        reading = Reading(msg.topic, msg.payload, site, self.thresholds, time.time())
+        if self.router is None:
+            self.handle_message(site, reading)
+            return
+        # 站点队列按设备限额合并，需要先在网络线程中解析出 client_id (只解析，不访问存储)。
+        # 计时模式下剖析从这里开始，包含解析和排队时间；cProfile 按线程采集，只在工作线程中开启
+        trace = self.profiler.begin() if self.profiler.mode == 'timer' else None
+        reading.trace = trace
+        if not self.decoder.decode(reading):
+            if trace: trace.finish()
+            return
+        if trace: trace.mark('decode')
+        self.router.route(site, reading, reading.client_id)
+
+    def handle_message(self, site, reading):
+        decoded = reading.client_id is not None
+        trace = reading.trace if reading.trace is not None else self.profiler.begin()
+        try:
+            if decoded:
+                # 在队列中等待的时间
+                if reading.trace: trace.mark('queue')
+                self.note_site(reading.client_id, site)
+            self.pipeline.run(reading, trace, start=1 if decoded else 0)
+        except Exception as e:
+            log.exception("❌ 处理消息时发生未知错误: %s", e)
+        finally:
+            if trace: trace.finish()
+
+    def run_priority(self, client_id, func):
+        """在设备所在站点的工作线程中、先于积压的读数执行 func() (Web端手动控制的优先通道)"""
+        if self.router is None:
+            func()
+        else:
+            self.router.route_priority(self.device_sites.get(client_id), func)
+
+    def note_site(self, client_id, site):
+        """设备第一次从某个站点主题上报 (或更换站点) 时登记到 device_groups"""
+        if site is None or self.device_sites.get(client_id) == site:
+            return
+        try:
+            self.storage.register_device(client_id, site)
+            self.device_sites[client_id] = site
+        except StorageError as e:
+            msg_log.debug("登记设备站点失败，下次重试: %s", e)
+
+    def spool_reading(self, row, error):
+        """数据库不可用时把读数暂存到本地文件，返回不带 id 的记录；未启用暂存时返回 None"""
+        if self.spool is None:
+            log.error("❌ 数据库操作失败，数据未保存: %s", error)
+            return None
+        if self.spool.pending == 0:
+            log.warning("📦 数据库不可用，开始暂存读数到 %s: %s", self.spool.path, error)
+        record = dict(row)
+        record.setdefault('timestamp', datetime.now().replace(microsecond=0))
+        self.spool.append(record)
+        metrics.READINGS_SPOOLED.inc()
+        return dict(record, id=None)
+
+    def notify_many(self, records):
+        """批量写入完成后由写入线程调用"""
+        if self.notifier is not None:
+            self.notifier.publish_many(records)
+
+    def publish_command(self, client_id, command, **params):
+        command_topic = COMMAND_TOPIC_FORMAT.format(client_id=client_id)
+        command_payload = json.dumps({"command": command, "timestamp": time.time(), **params})
+        self.transport.publish(command_topic, command_payload, qos=1)
+        metrics.COMMANDS_PUBLISHED.labels(command).inc()
+        log.info("📤 已发送指令 '%s' 到 '%s'", command, command_topic)
+
+    def on_relayed_commands(self, channel, message):
+        """Web 端经 Redis 发来的一批指令 (command_bus.RedisCommandRelay)，原样发布到MQTT代理"""
+        commands = command_bus.decode_relayed(message)
+        for topic, payload in commands:
+            self.transport.publish(topic, payload, qos=1)
+        metrics.COMMANDS_RELAYED.inc(len(commands))
+        msg_log.debug("📤 转发Web端指令 %d 条", len(commands))
+
+    def publish_group_command(self, site, command, greenhouse=None):
+        """向整个站点或一个温室下发指令，只发布一条MQTT消息"""
+        command_topic = group_command_topic(site, greenhouse)
+        command_payload = json.dumps({"command": command, "timestamp": time.time()})
+        self.transport.publish(command_topic, command_payload, qos=1)
+        metrics.COMMANDS_PUBLISHED.labels(command).inc()
+        log.info("📤 已发送分组指令 '%s' 到 '%s'", command, command_topic)
+
+    def join(self):
+        """等待已收到的消息全部处理并写入 (压测结束时使用)"""
+        if self.router: self.router.join()
+        self.pipeline.join()
+
+    def stop(self):
+        # 先停止接收，再排空站点队列和批量写入缓冲，最后关闭后端连接
+        if self.transport: self.transport.stop()
+        if self.router: self.router.stop()
+        self.pipeline.close()
+        if self.replayer: self.replayer.stop()
+        if self.sync:
+            self.sync.stop()
+            self.sync.central.close()
+        if self.spool: self.spool.close()
+        self.storage.close()
+        if self.pubsub: self.pubsub.close()
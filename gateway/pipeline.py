@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+消息处理流水线
+=====================================
+每条MQTT消息依次经过以下阶段 (每个阶段有多种实现，由配置选择，'none' 表示跳过):
+
+    decode    解析载荷            semicolon ({id;t;h;l}) / json ({"client_id": .., "Light intensity": ..})
+    presence  设备在线状态        wheel (超时未上报判定离线，上线/离线变化发布到 Redis) / none
+    validate  数据校验/平滑       smoothing / none
+    stats     滑动窗口统计        rolling (每台设备最近 N 分钟的平均/最小/最大值，写入 Redis 键) / none
+    state     读取设备当前状态    cached (内存缓存 + 数据库) / storage (每条查数据库) / memory (只在内存)
+    rules     自动控制规则        threshold
+    rate      调整设备上报间隔    adaptive (读数平稳时放慢、接近阈值时加快，下发 set_interval 指令，需要设备固件支持) / none
+    command   下发控制指令        mqtt / none
+    persist   写入数据库          batched (后台线程批量写入) / direct (逐条写入) / none
+    notify    通知Web端           redis / none
+
+PRESETS 给出与原来三个网关版本对应的组合，配置中 pipeline.preset 选择预设，
+也可以单独覆盖某个阶段，例如 {"pipeline": {"preset": "fuwu_new", "persist": "direct"}}。
+"""
+
+
+class Reading:
+    """一条消息在流水线中的上下文"""
+    __slots__ = ('topic', 'payload', 'site', 'thresholds', 'client_id', 'temperature', 'humidity', 'light_intensity',
+                 'fan_status', 'light_status', 'control_mode', 'commands', 'record', 'coalesced', 'summary', 'trace',
+                 'received')
+
+    def __init__(self, topic, payload, site=None, thresholds=None, received=None):
+        self.topic = topic
+        self.payload = payload
+        self.site = site
+        # 消息开始处理时的阈值快照，热加载不影响处理中的消息
+        self.thresholds = thresholds
+        self.client_id = None
+        self.temperature = self.humidity = self.light_intensity = None
+        self.fan_status = self.light_status = False
+        self.control_mode = 'auto'
+        self.commands = []
+        self.record = None
+        # 过载时合并进来的读数条数 (含自身) 和被合并读数的最小/最大值 (见 backpressure.py)
+        self.coalesced = 1
+        self.summary = None
+        self.trace = None
+        # 网关收到消息的时间 (排队、合并后处理时间会滞后)
+        self.received = received
+
+    def row(self):
+        """写入数据库的字段 (不含 id/timestamp)"""
+        return {'client_id': self.client_id, 'temperature': self.temperature, 'humidity': self.humidity,
+                'light_intensity': self.light_intensity, 'fan_status': 1 if self.fan_status else 0,
+                'light_status': 1 if self.light_status else 0, 'control_mode': self.control_mode}
+
+
+class Stage:
+    """流水线阶段基类；name 用于剖析报告"""
+    name = ''
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def process(self, reading):
+        """处理一条消息，返回 False 时丢弃该消息，不再执行后续阶段"""
+        return True
+
+    def start(self):
+        pass
+
+    def join(self):
+        """等待阶段内部缓冲的消息处理完毕 (如批量写入)"""
+
+    def close(self):
+        pass
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = [stage for stage in stages if stage is not None]
+
+    def get(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def run(self, reading, trace=None, start=0):
+        """从第 start 个阶段开始处理 (站点队列模式下 decode 已在入队前完成)"""
+        for stage in self.stages[start:]:
+            keep = stage.process(reading)
+            if trace: trace.mark(stage.name)
+            if keep is False:
+                return False
+        return True
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def join(self):
+        for stage in self.stages:
+            stage.join()
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+
+
+STAGE_ORDER = ('decode', 'presence', 'validate', 'stats', 'state', 'rules', 'rate', 'command', 'persist', 'notify')
+
+PRESETS = {
+    # 原 fuwu.py: JSON 载荷，设备状态只保存在内存中
+    'fuwu': {'decode': 'json', 'presence': 'none', 'validate': 'none', 'stats': 'none', 'state': 'memory', 'rules': 'threshold',
+             'rate': 'none', 'command': 'mqtt', 'persist': 'direct', 'notify': 'none'},
+    # 原 fuwu_nojson.py: 分号格式，设备状态以数据库为准 (现在带内存缓存)
+    'fuwu_nojson': {'decode': 'semicolon', 'presence': 'none', 'validate': 'none', 'stats': 'none', 'state': 'cached', 'rules': 'threshold',
+                    'rate': 'none', 'command': 'mqtt', 'persist': 'direct', 'notify': 'none'},
+    # 原 fuwu_new.py: 分号格式 + 平滑度检查 + Redis 通知，批量写库
+    'fuwu_new': {'decode': 'semicolon', 'presence': 'none', 'validate': 'smoothing', 'stats': 'none', 'state': 'cached', 'rules': 'threshold',
+                 'rate': 'none', 'command': 'mqtt', 'persist': 'batched', 'notify': 'redis'},
+}
+DEFAULT_PRESET = 'fuwu_new'
+
+
+def pipeline_spec(pipeline_config):
+    """配置中的 pipeline 段 -> {阶段: 实现名}"""
+    pipeline_config = pipeline_config or {}
+    preset = pipeline_config.get('preset', DEFAULT_PRESET)
+    if preset not in PRESETS:
+        raise ValueError(f"未知的流水线预设: {preset} (可选: {', '.join(PRESETS)})")
+    spec = dict(PRESETS[preset])
+    spec.update({stage: pipeline_config[stage] for stage in STAGE_ORDER if stage in pipeline_config})
+    from gateway.stages import STAGES
+    for stage, impl in spec.items():
+        if impl != 'none' and impl not in STAGES[stage]:
+            raise ValueError(f"阶段 {stage} 没有实现 {impl} (可选: {', '.join(STAGES[stage])}, none)")
+    return spec
+
+
+def build_pipeline(gateway, spec):
+    """按 spec 创建各阶段实例，返回 Pipeline"""
+    from gateway.stages import STAGES
+    stages = []
+    for stage in STAGE_ORDER:
+        impl = spec.get(stage, 'none')
+        if impl == 'none':
+            continue
+        choices = STAGES[stage]
+        if impl not in choices:
+            raise ValueError(f"阶段 {stage} 没有实现 {impl} (可选: {', '.join(choices)}, none)")
+        stages.append(choices[impl](gateway))
+    return Pipeline(stages)
@@ -0,0 +1,660 @@
+# -*- coding: utf-8 -*-
+"""
+流水线各阶段的实现
+=====================================
+STAGES[阶段][实现名] -> Stage 子类，由 pipeline.build_pipeline() 按配置选择。
+各阶段通过 gateway (gateway.core.Gateway) 访问存储、发布订阅、MQTT 传输和暂存文件。
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import iot_log
+import metrics
+from backends import StorageError
+from adaptive_rate import DEFAULT_BASE_INTERVAL, DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, RateController
+from gateway.pipeline import Stage
+from liveness import DEFAULT_TICK, DEFAULT_TIMEOUT, LivenessTracker
+from rolling import DEFAULT_WINDOWS, RollingStats
+
+log = iot_log.get_logger('gateway')
+msg_log = iot_log.get_message_logger('gateway')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+# =============================================================================
+# decode: 解析载荷
+# =============================================================================
+class Decoder(Stage):
+    name = 'decode'
+
+    def process(self, reading):
+        if not self.decode(reading):
+            return False
+        self.gateway.note_site(reading.client_id, reading.site)
+        return True
+
+    def decode(self, reading):
+        """只解析载荷 (不访问存储)，可以在 MQTT 网络线程中调用"""
+        try:
+            payload_str = reading.payload.decode('utf-8')
+            msg_log.debug("📨 收到来自主题 '%s' 的消息: %s", reading.topic, payload_str)
+            ok = self.parse(reading, payload_str)
+        except (ValueError, TypeError) as e:
+            msg_log.debug("数据转换失败: %s", e)
+            ok = False
+        if not ok:
+            metrics.MESSAGES_INVALID.inc()
+            log.warning("❌ 格式错误: %r", reading.payload)
+            return False
+        metrics.MESSAGES_PARSED.inc()
+        return True
+
+    def parse(self, reading, payload_str):
+        """填充 client_id 和三项读数，格式不符时返回 False"""
+        raise NotImplementedError
+
+
+class SemicolonDecoder(Decoder):
+    """{client_id;temperature;humidity;light_intensity}"""
+
+    def parse(self, reading, payload_str):
+        parts = payload_str.strip('{}').split(';')
+        if len(parts) != 4 or not parts[0]:
+            return False
+        reading.client_id = parts[0]
+        reading.temperature, reading.humidity, reading.light_intensity = float(parts[1]), float(parts[2]), float(parts[3])
+        return True
+
+
+class JsonDecoder(Decoder):
+    """{"client_id": .., "temperature": .., "humidity": .., "Light intensity": ..}"""
+
+    def parse(self, reading, payload_str):
+        data = json.loads(payload_str)
+        if not isinstance(data, dict):
+            return False
+        light_intensity = data.get('Light intensity', data.get('light_intensity'))
+        if data.get('client_id') is None or data.get('temperature') is None or data.get('humidity') is None or light_intensity is None:
+            return False
+        reading.client_id = str(data['client_id'])
+        reading.temperature, reading.humidity, reading.light_intensity = float(data['temperature']), float(data['humidity']), float(light_intensity)
+        return True
+
+
+# =============================================================================
+# presence: 设备在线状态
+# =============================================================================
+class PresenceStage(Stage):
+    """
+    每条解析成功的读数 (包括随后被校验丢弃的) 刷新设备的截止时间 (liveness.LivenessTracker，gateway.presence_timeout 秒)。
+    后台线程每 presence_tick 秒推进时间轮，把这段时间内的上线/离线变化作为一个 JSON 数组发布到 Redis 频道
+    "<频道名>:presence"，并写入同名哈希；网关启动时从哈希恢复之前在线的设备。
+    """
+    name = 'presence'
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        self.tick = gateway.settings.get('presence_tick', DEFAULT_TICK)
+        self.tracker = LivenessTracker(gateway.settings.get('presence_timeout', DEFAULT_TIMEOUT), self.tick)
+        self.key = f'{gateway.redis_channel}:presence'
+        # 配置重新加载时新建的阶段接管同一个租户的指标
+        self._gauge = metrics.DEVICES_ONLINE.labels(gateway.name)
+        self._gauge.set_function(self.tracker.__len__)
+        self._online = []  # 上次发布以来上线的设备 (client_id, 时间)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._restore()
+        self._thread = threading.Thread(target=self._run, name=f'presence-{self.gateway.name}', daemon=True)
+        self._thread.start()
+
+    def _restore(self):
+        pubsub = self.gateway.pubsub
+        if pubsub is None:
+            return
+        try:
+            saved = pubsub.get_fields(self.key)
+        except Exception as e:
+            log.warning("⚠️ 读取设备在线状态失败，所有设备视为新上线: %s", e)
+            return
+        # 哈希中只在状态变化时写入时间，在线设备的最后上报时间未知: 从启动时开始计时，之后仍未上报的设备在 timeout 后离线
+        now = time.time()
+        last_seen = {}
+        for client_id, value in saved.items():
+            try:
+                online = json.loads(value).get('online')
+            except (ValueError, AttributeError):
+                continue
+            if online:
+                last_seen[client_id] = now
+        self.tracker.seed(last_seen)
+        if last_seen:
+            log.info("🟢 恢复在线设备 %d 台", len(last_seen))
+
+    def process(self, reading):
+        if self.tracker.touch(reading.client_id):
+            with self._lock:
+                self._online.append((reading.client_id, time.time()))
+        return True
+
+    def timeout(self, client_id):
+        return self.tracker.timeouts.get(client_id, self.tracker.timeout)
+
+    def publish(self, now=None):
+        """推进时间轮并发布上线/离线变化，返回变化的设备数"""
+        now = time.time() if now is None else now
+        offline = self.tracker.tick(now)
+        with self._lock:
+            online, self._online = self._online, []
+        if not online and not offline:
+            return 0
+        metrics.DEVICE_TRANSITIONS.labels('online').inc(len(online))
+        metrics.DEVICE_TRANSITIONS.labels('offline').inc(len(offline))
+        events = [{'client_id': client_id, 'online': True, 'since': round(seen, 3), 'last_seen': round(seen, 3)} for client_id, seen in online]
+        # 离线时间按截止时间计算，不受推进间隔影响
+        events += [{'client_id': client_id, 'online': False, 'since': round(seen + self.timeout(client_id), 3), 'last_seen': round(seen, 3)}
+                   for client_id, seen in offline]
+        for client_id, _ in offline:
+            log.info("🔴 设备 %s 超过 %.0f 秒未上报，判定离线", client_id, self.timeout(client_id))
+        pubsub = self.gateway.pubsub
+        if pubsub is None:
+            return len(events)
+        try:
+            pubsub.set_fields(self.key, {event['client_id']: json.dumps(event) for event in events})
+            pubsub.publish(self.key, json.dumps(events))
+        except Exception as e:
+            log.error("❌ 发布设备在线状态失败: %s", e)
+        return len(events)
+
+    def _run(self):
+        while not self._stop_event.wait(self.tick):
+            self.publish()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+        self.publish()
+        if self._gauge.func == self.tracker.__len__:
+            self._gauge.set_function(None)
+            self._gauge.set(0)
+
+
+# =============================================================================
+# validate: 数据平滑度检查
+# =============================================================================
+def smoothing_violation(last, temperature, humidity, thresholds):
+    """与上一次有效读数 last=(温度, 湿度) 比较，变化超过阈值时返回 (字段, 变化量, 阈值)，否则返回 None (bulk_import.py 共用)"""
+    if last is None:
+        return None
+    temp_diff = abs(temperature - last[0])
+    if temp_diff > thresholds['max_temp_change']:
+        return 'temperature', temp_diff, thresholds['max_temp_change']
+    hum_diff = abs(humidity - last[1])
+    if hum_diff > thresholds['max_humidity_change']:
+        return 'humidity', hum_diff, thresholds['max_humidity_change']
+    return None
+
+
+class SmoothingFilter(Stage):
+    """单次读数变化超过阈值的数据被丢弃；阈值和开关取自消息的阈值快照，可热加载"""
+    name = 'validate'
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        # 每个设备上一次有效读数: {'client_id': (temperature, humidity)}
+        self.last_valid = {}
+
+    def process(self, reading):
+        thresholds = reading.thresholds
+        if not thresholds['smoothing_enabled']:
+            return True
+        violation = smoothing_violation(self.last_valid.get(reading.client_id), reading.temperature, reading.humidity, thresholds)
+        if violation is not None:
+            field, diff, limit = violation
+            if field == 'temperature':
+                log.warning("⚠️  数据异常: 设备 %s 温度突变 %.1f°C (阈值 %s°C)，数据已丢弃。", reading.client_id, diff, limit)
+            else:
+                log.warning("⚠️  数据异常: 设备 %s 湿度突变 %.1f%% (阈值 %s%%)，数据已丢弃。", reading.client_id, diff, limit)
+            metrics.MESSAGES_REJECTED.labels(field).inc()
+            return False
+        self.last_valid[reading.client_id] = (reading.temperature, reading.humidity)
+        return True
+
+
+# =============================================================================
+# stats: 滑动窗口统计
+# =============================================================================
+class RollingStatsStage(Stage):
+    """
+    每条通过校验的读数更新 rolling.RollingStats (gateway.stats_windows 秒的窗口)。
+    后台线程每 stats_interval 秒把有新读数的设备写入 Redis 键 "<频道名>:stats:<client_id>" (JSON)，
+    键的过期时间为最长窗口，设备停止上报后统计自动消失。
+    """
+    name = 'stats'
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        self.engine = RollingStats(gateway.settings.get('stats_windows', DEFAULT_WINDOWS))
+        self.interval = gateway.settings.get('stats_interval', 5.0)
+        self.key_prefix = f'{gateway.redis_channel}:stats:'
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f'stats-{self.gateway.name}', daemon=True)
+        self._thread.start()
+
+    def process(self, reading):
+        self.engine.update(reading.client_id, reading.temperature, reading.humidity, reading.light_intensity)
+        return True
+
+    def publish(self):
+        """把有新读数的设备统计写入 Redis，返回写入的键数"""
+        dirty = self.engine.take_dirty()
+        pubsub = self.gateway.pubsub
+        if not dirty or pubsub is None:
+            return 0
+        now = time.time()
+        values = {self.key_prefix + client_id: json.dumps(self.engine.snapshot(client_id, now)) for client_id in dirty}
+        try:
+            pubsub.set_values(values, ttl=max(self.engine.windows))
+        except Exception as e:
+            # 这些设备的统计在下一条读数到达后重新写入
+            log.error("❌ 写入滑动窗口统计到Redis失败: %s", e)
+            return 0
+        return len(values)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.publish()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+        self.publish()
+
+
+# =============================================================================
+# state: 设备当前的风扇/补光灯状态和控制模式
+# =============================================================================
+class StateStage(Stage):
+    name = 'state'
+
+    def process(self, reading):
+        status = self.lookup(reading.client_id)
+        if status:
+            reading.fan_status = bool(status['fan_status'])
+            reading.light_status = bool(status['light_status'])
+            reading.control_mode = status['control_mode']
+        return True
+
+    def lookup(self, client_id):
+        """返回 {'fan_status', 'light_status', 'control_mode'}，未知设备返回 None"""
+        raise NotImplementedError
+
+    def remember(self, reading):
+        """规则执行后记录设备的新状态"""
+
+
+def _status_of(reading):
+    return {'fan_status': reading.fan_status, 'light_status': reading.light_status, 'control_mode': reading.control_mode}
+
+
+class MemoryState(StateStage):
+    """状态只保存在内存中 (原 fuwu.py)，看不到Web端的手动操作"""
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        self.status = {}
+
+    def lookup(self, client_id):
+        return self.status.get(client_id)
+
+    def remember(self, reading):
+        self.status[reading.client_id] = _status_of(reading)
+
+
+class StorageState(MemoryState):
+    """每条消息都查询数据库 (device_latest 主键查询)，数据库不可用时退回到内存中的状态"""
+
+    def lookup(self, client_id):
+        with metrics.STATUS_LOOKUP_SECONDS.time():
+            try:
+                return self.gateway.storage.latest_status(client_id)
+            except StorageError as e:
+                msg_log.debug("查询设备状态失败，使用内存中的状态: %s", e)
+                return self.status.get(client_id)
+
+
+class CachedState(StateStage):
+    """
+    内存缓存 + 数据库: 缓存项过期 (gateway.state_ttl 秒) 后才重新查询数据库。
+    Web端修改状态时发布带 origin='web' 的记录到 Redis 频道，这里订阅后立即更新缓存；
+    没有 Redis 时Web端的修改最迟在一个过期周期后生效。
+    """
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        self.ttl = gateway.settings.get('state_ttl', 30.0)
+        # client_id -> (状态, 过期时间)
+        self._cache = {}
+
+    def start(self):
+        if self.gateway.pubsub is not None:
+            try:
+                self.gateway.pubsub.subscribe(self.gateway.redis_channel, self.on_notify)
+            except Exception as e:
+                log.error("❌ 订阅Redis频道失败，Web端的状态修改将在缓存过期后生效: %s", e)
+
+    def lookup(self, client_id):
+        entry = self._cache.get(client_id)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        with metrics.STATUS_LOOKUP_SECONDS.time():
+            try:
+                status = self.gateway.storage.latest_status(client_id)
+            except StorageError as e:
+                msg_log.debug("查询设备状态失败，使用缓存中的状态: %s", e)
+                return entry[0] if entry is not None else None
+        self._cache[client_id] = (status, now + self.ttl)
+        return status
+
+    def remember(self, reading):
+        # 保留原来的过期时间: 设备持续上报时也会定期回源数据库
+        entry = self._cache.get(reading.client_id)
+        expires = entry[1] if entry is not None else time.monotonic() + self.ttl
+        self._cache[reading.client_id] = (_status_of(reading), expires)
+
+    def on_notify(self, channel, message):
+        # 频道上大部分是网关自己发布的记录，先按字符串过滤，避免逐条解析
+        if '"origin"' not in message:
+            return
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        for record in payload if isinstance(payload, list) else [payload]:
+            if isinstance(record, dict) and record.get('origin') == 'web' and record.get('client_id'):
+                status = {'fan_status': record['fan_status'], 'light_status': record['light_status'], 'control_mode': record['control_mode']}
+                # 走站点队列的优先通道: 先于积压的读数生效，且不会被正在处理的读数的 remember() 覆盖
+                self.gateway.run_priority(record['client_id'], lambda client_id=record['client_id'], status=status: self.apply(client_id, status))
+
+    def apply(self, client_id, status):
+        self._cache[client_id] = (status, time.monotonic() + self.ttl)
+
+
+# =============================================================================
+# rules: 自动控制规则
+# =============================================================================
+class ThresholdRules(Stage):
+    """自动模式下按阈值决定风扇/补光灯开关，指令放入 reading.commands，由 command 阶段下发"""
+    name = 'rules'
+
+    def process(self, reading):
+        if reading.control_mode == 'auto':
+            thresholds = reading.thresholds
+            if reading.temperature >= thresholds['fan_on_temp'] and not reading.fan_status:
+                reading.commands.append('open_fan')
+                reading.fan_status = True
+            elif reading.temperature <= thresholds['fan_off_temp'] and reading.fan_status:
+                reading.commands.append('close_fan')
+                reading.fan_status = False
+
+            if reading.light_intensity < thresholds['light_on_lux'] and not reading.light_status:
+                reading.commands.append('open_light')
+                reading.light_status = True
+            elif reading.light_intensity >= thresholds['light_on_lux'] and reading.light_status:
+                reading.commands.append('close_light')
+                reading.light_status = False
+        if self.gateway.state is not None:
+            self.gateway.state.remember(reading)
+        return True
+
+
+# =============================================================================
+# rate: 调整设备上报间隔
+# =============================================================================
+class AdaptiveRateStage(Stage):
+    """
+    按读数稳定性调整每台设备的上报间隔 (adaptive_rate.RateController)，需要调整时下发
+    {"command": "set_interval", "interval": 秒}。放在 rules 之后，使用规则执行后的控制模式。
+    已下发的间隔写入哈希 "<频道名>:intervals"，网关重启后恢复；启用 presence 时按间隔延长设备的离线超时。
+    """
+    name = 'rate'
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        settings = gateway.settings
+        self.controller = RateController(settings.get('report_interval', DEFAULT_BASE_INTERVAL),
+                                         settings.get('min_report_interval', DEFAULT_MIN_INTERVAL),
+                                         settings.get('max_report_interval', DEFAULT_MAX_INTERVAL))
+        self.key = f'{gateway.redis_channel}:intervals'
+        self.presence = None
+
+    def start(self):
+        self.presence = self.gateway.pipeline.get('presence')
+        pubsub = self.gateway.pubsub
+        if pubsub is None:
+            return
+        try:
+            saved = pubsub.get_fields(self.key)
+        except Exception as e:
+            log.warning("⚠️ 读取已下发的上报间隔失败，所有设备按默认间隔处理: %s", e)
+            return
+        intervals = {}
+        for client_id, value in saved.items():
+            try:
+                intervals[client_id] = float(value)
+            except (TypeError, ValueError):
+                continue
+        self.controller.restore(intervals)
+        for client_id, interval in intervals.items():
+            self._extend_timeout(client_id, interval)
+        if intervals:
+            log.info("⏱️ 恢复已下发的上报间隔 %d 台", len(intervals))
+
+    def _extend_timeout(self, client_id, interval):
+        # 至少容忍两次上报丢失
+        if self.presence is not None:
+            tracker = self.presence.tracker
+            tracker.set_timeout(client_id, max(tracker.timeout, 3 * interval))
+
+    def process(self, reading):
+        interval = self.controller.observe(reading.client_id, reading.temperature, reading.humidity, reading.light_intensity,
+                                           reading.thresholds, reading.control_mode == 'auto', reading.received)
+        if interval is None:
+            return True
+        self._extend_timeout(reading.client_id, interval)
+        self.gateway.publish_command(reading.client_id, 'set_interval', interval=interval)
+        pubsub = self.gateway.pubsub
+        if pubsub is not None:
+            try:
+                pubsub.set_fields(self.key, {reading.client_id: interval})
+            except Exception as e:
+                log.error("❌ 保存上报间隔失败: %s", e)
+        return True
+
+
+# =============================================================================
+# command: 下发控制指令
+# =============================================================================
+class MqttCommand(Stage):
+    name = 'command'
+
+    def process(self, reading):
+        for command in reading.commands:
+            self.gateway.publish_command(reading.client_id, command)
+        return True
+
+
+# =============================================================================
+# persist: 写入数据库
+# =============================================================================
+class DirectPersist(Stage):
+    """逐条写入，写入后的完整记录 (含 id/timestamp) 交给 notify 阶段"""
+    name = 'persist'
+
+    def process(self, reading):
+        try:
+            with metrics.DB_INSERT_SECONDS.time():
+                reading.record = self.gateway.storage.insert_reading(
+                    reading.client_id, reading.temperature, reading.humidity, reading.light_intensity,
+                    reading.fan_status, reading.light_status, reading.control_mode)
+            metrics.READINGS_INSERTED.inc()
+            msg_log.debug("💾 数据已保存到数据库, ID=%s", reading.record.get('id'))
+        except StorageError as e:
+            metrics.DB_ERRORS.inc()
+            reading.record = self.gateway.spool_reading(reading.row(), e)
+        return True
+
+
+class BatchedPersist(Stage):
+    """
+    后台线程批量写入: 攒够 batch_size 条或第一条等待超过 batch_delay_ms 时，
+    用一个多行 INSERT 和一次提交写入整批，然后一次性通知Web端 (gateway.notify_many)。
+    待写入数量达到上限时阻塞处理线程，由站点队列和MQTT代理缓冲，不丢数据。
+    时间戳在入队时生成，与逐条写入时的 CURRENT_TIMESTAMP 含义一致。
+    """
+    name = 'persist'
+
+    def __init__(self, gateway):
+        super().__init__(gateway)
+        self.batch_size = gateway.settings.get('batch_size', 200)
+        self.batch_delay = gateway.settings.get('batch_delay_ms', 50) / 1000.0
+        self.max_pending = self.batch_size * 10
+        self._pending = []
+        self._flushing = False
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        metrics.QUEUE_DEPTH.labels(f'{self.gateway.label_prefix}persist_batch').set_function(lambda: len(self._pending))
+        self._thread = threading.Thread(target=self._run, name=f'persist-{self.gateway.name}', daemon=True)
+        self._thread.start()
+
+    def process(self, reading):
+        row = reading.row()
+        row['timestamp'] = datetime.now().replace(microsecond=0)
+        with self._cond:
+            while len(self._pending) >= self.max_pending and not self._closing:
+                self._cond.wait()
+            # 过载合并的摘要不写入数据库，写入后附加到通知记录
+            self._pending.append((row, reading.summary))
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.batch_delay
+                while len(self._pending) < self.batch_size and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                self._flushing = True
+                self._cond.notify_all()
+            try:
+                self._flush(batch)
+            except Exception as e:
+                log.exception("❌ 批量写入线程出错: %s", e)
+            finally:
+                with self._cond:
+                    self._flushing = False
+                    self._cond.notify_all()
+
+    def _flush(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            with metrics.DB_INSERT_SECONDS.time():
+                records = self.gateway.storage.insert_readings(rows)
+            metrics.READINGS_INSERTED.inc(len(records))
+            msg_log.debug("💾 批量写入 %d 条读数", len(records))
+        except StorageError as e:
+            metrics.DB_ERRORS.inc()
+            records = [self.gateway.spool_reading(row, e) for row in rows]
+        for record, (_, summary) in zip(records, batch):
+            if record is not None and summary is not None:
+                record['summary'] = summary
+        self.gateway.notify_many([record for record in records if record is not None])
+
+    def join(self):
+        """等待已入队的读数全部写入"""
+        with self._cond:
+            while self._pending or self._flushing:
+                self._cond.wait(0.1)
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(10.0)
+
+
+# =============================================================================
+# notify: 通知Web端
+# =============================================================================
+class RedisNotify(Stage):
+    """把写入后的记录发布到 Redis 频道 (Web端SSE转发)；批量写入时一批记录作为一个 JSON 数组发布"""
+    name = 'notify'
+
+    def process(self, reading):
+        if reading.record is not None:
+            if reading.summary is not None:
+                reading.record['summary'] = reading.summary
+            self.publish(reading.record)
+        return True
+
+    def publish_many(self, records):
+        if records:
+            self.publish(records)
+
+    def publish(self, payload):
+        pubsub = self.gateway.pubsub
+        if pubsub is None:
+            return
+        try:
+            message = json.dumps(payload, default=_json_default)
+            with metrics.REDIS_PUBLISH_SECONDS.time():
+                pubsub.publish(self.gateway.redis_channel, message)
+            metrics.REDIS_PUBLISHED.inc(len(payload) if isinstance(payload, list) else 1)
+            msg_log.debug("📡 已发布到Redis频道 '%s'", self.gateway.redis_channel)
+        except Exception as e:
+            log.error("❌ 发布到Redis失败: %s", e)
+
+
+STAGES = {
+    'decode': {'semicolon': SemicolonDecoder, 'json': JsonDecoder},
+    'presence': {'wheel': PresenceStage},
+    'validate': {'smoothing': SmoothingFilter},
+    'stats': {'rolling': RollingStatsStage},
+    'state': {'memory': MemoryState, 'storage': StorageState, 'cached': CachedState},
+    'rules': {'threshold': ThresholdRules},
+    'rate': {'adaptive': AdaptiveRateStage},
+    'command': {'mqtt': MqttCommand},
+    'persist': {'direct': DirectPersist, 'batched': BatchedPersist},
+    'notify': {'redis': RedisNotify},
+}
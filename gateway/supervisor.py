@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""多租户管理: 每个租户一个 Gateway，随配置热加载启动/更新/重建/停止"""
+import signal
+import threading
+from urllib.parse import parse_qs
+
+import iot_log
+from gateway.core import Gateway
+from gateway.pipeline import pipeline_spec
+
+log = iot_log.get_logger('gateway')
+
+
+def _connection_settings(tenant_config):
+    """租户配置中需要重建网关才能生效的部分 (阈值以外的全部配置，包括流水线选择)"""
+    return {key: value for key, value in tenant_config.items() if key != 'thresholds'}
+
+
+class TenantSupervisor:
+    """
+    一个进程服务多个租户: 每个租户一个 Gateway。
+    配置热加载时只改了阈值的租户就地更新；连接或流水线配置变化的租户先停止旧网关
+    (站点队列和批量写入缓冲处理完已收到的消息) 再重建；新增的租户启动，删除的租户停止。
+    """
+
+    def __init__(self, manager):
+        self._lock = threading.Lock()
+        self.gateways = {}
+        self.apply(None, manager.current)
+        manager.on_reload(self.apply)
+
+    def apply(self, old, new):
+        with self._lock:
+            for name in set(self.gateways) - set(new.tenants):
+                log.info("🛑 租户 %s 已从配置中删除，停止网关", name)
+                self.gateways.pop(name).stop()
+            for name, tenant_config in new.tenants.items():
+                gateway = self.gateways.get(name)
+                try:
+                    if gateway is not None and old is not None and name in old.tenants \
+                            and _connection_settings(old.tenants[name]) == _connection_settings(tenant_config):
+                        if old.tenants[name]['thresholds'] != tenant_config['thresholds']:
+                            gateway.update_thresholds(tenant_config['thresholds'])
+                            log.info("🔄 租户 %s 的阈值已更新: %s", name, tenant_config['thresholds'])
+                        continue
+                    # 先校验流水线配置，有误时保留旧网关继续运行
+                    pipeline_spec(tenant_config.get('pipeline'))
+                except Exception as e:
+                    log.error("❌ 租户 %s 的配置有误，未应用: %s", name, e)
+                    continue
+                try:
+                    if gateway is not None:
+                        log.info("🔄 租户 %s 的连接配置已变化，重建网关", name)
+                        self.gateways.pop(name).stop()
+                    self.gateways[name] = Gateway(tenant_config, name)
+                    log.info("🚀 租户 %s 的网关已启动 (MQTT %s:%s, 数据库 %s/%s)", name, tenant_config['mqtt']['broker_ip'],
+                             tenant_config['mqtt']['port'], tenant_config['mysql']['host'], tenant_config['mysql']['database'])
+                except Exception as e:
+                    log.error("❌ 租户 %s 的网关启动失败: %s", name, e)
+                    self.gateways.pop(name, None)
+
+    def handle_profile(self, query):
+        """/debug/profile?tenant=<租户名>&action=...，只有一个租户时可省略 tenant"""
+        name = parse_qs(query).get('tenant', [None])[0]
+        with self._lock:
+            gateways = dict(self.gateways)
+        if name is None and len(gateways) == 1:
+            name = next(iter(gateways))
+        if name not in gateways:
+            return 400, 'text/plain; charset=utf-8', f"请指定租户: tenant={'|'.join(sorted(gateways))}\n"
+        return gateways[name].profiler.handle_http(query)
+
+    def install_signal_handlers(self):
+        """SIGUSR1 切换所有租户的剖析开关，SIGUSR2 输出所有租户的剖析报告 (仅限主线程调用，Windows 下没有这两个信号)"""
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: [g.profiler.toggle() for g in list(self.gateways.values())])
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, lambda signum, frame: [g.profiler.dump() for g in list(self.gateways.values())])
+
+    def stop(self):
+        with self._lock:
+            for gateway in self.gateways.values():
+                gateway.stop()
+            self.gateways = {}
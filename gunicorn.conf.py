@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置 (在项目目录下运行 gunicorn 时自动加载)
+=====================================
+    gunicorn --workers 3 --bind 127.0.0.1:5000 web_display:app
+指令发布器在每个 worker fork 之后才创建MQTT连接 (见 command_bus.py)，master 进程中不建立连接、不启动线程，
+MQTT 代理不可用时 worker 照常启动，指令在连上后发出。
+"""
+
+
+def post_fork(server, worker):
+    # 不预加载时这里会在 worker 中导入应用，与随后 gunicorn 加载应用是同一个模块
+    from web_display import command_publisher
+    command_publisher.post_fork()
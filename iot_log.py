@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+结构化日志模块
+=====================================
+- 替代各服务中的 print()，支持日志级别 (环境变量 IOT_LOG_LEVEL，默认 INFO)
+- 日志记录先放入内存队列，由后台线程统一格式化并写出，处理消息的线程不会阻塞在 stdout/journald 上
+- 每条MQTT消息都会触发的日志使用 get_message_logger()，级别为 DEBUG，并支持按 1/N 采样 (IOT_LOG_SAMPLE)
+- 输出格式: text (默认) 或 json (IOT_LOG_FORMAT=json)，通过 extra={...} 传入的字段会作为结构化字段输出
+
+用法:
+    log = iot_log.get_logger('gateway')
+    msg_log = iot_log.get_message_logger('gateway')
+    msg_log.debug("📨 收到消息: %s", payload_str)   # 生产环境 INFO 级别下不会格式化字符串
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+ROOT_LOGGER_NAME = 'iot'
+
+# 日志队列长度上限，写出跟不上时直接丢弃新日志，而不是阻塞业务线程
+QUEUE_MAXSIZE = 10000
+
+# LogRecord 自带的属性，其余属性视为 extra 结构化字段
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_lock = threading.Lock()
+_listener = None
+_handler = None
+_output_handler = None
+_sample_filters = []
+_sample_every = 1  # setup_logging() 时读取 IOT_LOG_SAMPLE
+
+
+class _SampleFilter(logging.Filter):
+    """每 N 条记录只放行 1 条，WARNING 及以上级别不采样"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        return next(self._counter) % self.every == 0
+
+
+class StructuredFormatter(logging.Formatter):
+    """text 格式: 时间 级别 logger 消息 | key=value ...；json 格式: 每行一个JSON对象"""
+
+    def __init__(self, fmt='text'):
+        super().__init__()
+        self.fmt = fmt
+
+    def _extra_fields(self, record):
+        return {k: v for k, v in record.__dict__.items() if k not in _STANDARD_ATTRS and not k.startswith('_')}
+
+    def format(self, record):
+        message = record.getMessage()
+        fields = self._extra_fields(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        timestamp = self.formatTime(record, '%Y-%m-%d %H:%M:%S') + ',%03d' % record.msecs
+        if self.fmt == 'json':
+            entry = {'ts': timestamp, 'level': record.levelname, 'logger': record.name, 'msg': message}
+            entry.update(fields)
+            if record.exc_text:
+                entry['exc'] = record.exc_text
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        line = f"{timestamp} {record.levelname:<7} {record.name} {message}"
+        if fields:
+            line += ' | ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    队列满时丢弃日志而不是阻塞；并且不在调用线程里格式化消息，
+    格式化工作全部交给后台监听线程完成。
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_handler.queue, _output_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _after_fork_in_child():
+    # 预派生模型 (gunicorn) 下监听线程不会被复制到子进程，需要重新创建队列和线程
+    global _handler
+    if _handler is None:
+        return
+    _handler.queue = queue.Queue(QUEUE_MAXSIZE)
+    _start_listener()
+
+
+def _env_sample_every():
+    """IOT_LOG_SAMPLE 的值，无法解析时返回 None"""
+    try:
+        return int(os.environ.get('IOT_LOG_SAMPLE', '1'))
+    except ValueError:
+        return None
+
+
+def setup_logging(level=None, fmt=None, sample_every=None, stream=None):
+    """
+    初始化 'iot' 日志树，可重复调用 (只有第一次会创建后台线程)。
+
+    参数:
+        level: 日志级别名称或数值，默认读取 IOT_LOG_LEVEL，未设置时为 INFO
+        fmt: 'text' 或 'json'，默认读取 IOT_LOG_FORMAT
+        sample_every: 逐条消息日志的采样间隔 N，默认读取 IOT_LOG_SAMPLE，未设置时为 1 (不采样)
+        stream: 输出流，默认 sys.stdout
+    """
+    global _handler, _output_handler, _sample_every
+    level = level or os.environ.get('IOT_LOG_LEVEL', 'INFO')
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    fmt = fmt or os.environ.get('IOT_LOG_FORMAT', 'text')
+    invalid_sample = False
+    if not sample_every:
+        sample_every = _env_sample_every()
+        invalid_sample = sample_every is None
+    sample_every = max(1, int(sample_every or 1))
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _lock:
+        root.setLevel(level)
+        _sample_every = sample_every
+        for sample_filter in _sample_filters:
+            sample_filter.every = sample_every
+        if _handler is not None:
+            _output_handler.setFormatter(StructuredFormatter(fmt))
+            return _warn_invalid_sample(root, invalid_sample)
+        _output_handler = logging.StreamHandler(stream or sys.stdout)
+        _output_handler.setFormatter(StructuredFormatter(fmt))
+        _handler = _NonBlockingQueueHandler(queue.Queue(QUEUE_MAXSIZE))
+        root.addHandler(_handler)
+        root.propagate = False
+        _start_listener()
+        atexit.register(shutdown_logging)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+    return _warn_invalid_sample(root, invalid_sample)
+
+
+def _warn_invalid_sample(root, invalid):
+    if invalid:
+        root.warning("⚠️ IOT_LOG_SAMPLE=%r 不是整数，逐条消息日志不采样", os.environ.get('IOT_LOG_SAMPLE'))
+    return root
+
+
+def shutdown_logging():
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name):
+    """获取 'iot.<name>' 日志器，用于启动、连接、错误等低频日志"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def get_message_logger(name):
+    """
+    获取 'iot.<name>.msg' 日志器，用于每条消息都会触发的日志。
+    请只用 debug() 并以 %s 占位符传参，默认级别下调用几乎没有开销。
+    """
+    logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}.msg")
+    if not any(isinstance(f, _SampleFilter) for f in logger.filters):
+        sample_filter = _SampleFilter(_sample_every)
+        logger.addFilter(sample_filter)
+        _sample_filters.append(sample_filter)
+    return logger
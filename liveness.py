@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+设备在线状态 (超时未上报即离线)
+=====================================
+原来没有任何地方发现设备停止上报: 页面一直显示最后一行数据，找出"沉默"的设备需要对 sensor_readings 做全表 MAX(timestamp) 扫描。
+网关在处理每条读数时刷新该设备的截止时间，超过 timeout 秒没有新读数即判定离线:
+
+- TimerWheel: 哈希时间轮，slots 个槽、每槽 tick 秒，登记和每次推进都是 O(1) (与设备总数无关，只与到期的设备数有关)
+- 延迟重排: 读数到达时只更新 last_seen (一次字典赋值)，不在时间轮中移动设备；
+  槽到期时再检查 last_seen，期间有新读数的设备按新的截止时间重新登记。每台设备每个 timeout 周期最多重排一次
+- LivenessTracker.touch() 返回设备是否刚刚上线，tick() 返回刚刚离线的设备
+
+gateway/stages.py 的 PresenceStage 把上线/离线变化发布到 Redis 频道 "<频道名>:presence"，并写入哈希 "<频道名>:presence"
+(client_id -> {"online", "since", "last_seen"})，web_display.py 的 /api/devices/presence 读取该哈希。
+"""
+import math
+import threading
+import time
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_TICK = 1.0
+DEFAULT_SLOTS = 512
+
+
+class TimerWheel:
+    """哈希时间轮: schedule(key, deadline) 登记 (同一个键只保留最后一次)，advance(now) 返回到期的键"""
+
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, start=0.0):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # 每槽: 键 -> 到期的刻度
+        self.current = int(start // tick)
+        self._where = {}  # 键 -> 所在槽
+
+    def schedule(self, key, deadline):
+        # 截止时间不早于下一个刻度，保证在下一次推进时被检查
+        due = max(math.ceil(deadline / self.tick), self.current + 1)
+        slot = due % len(self.slots)
+        old = self._where.get(key)
+        if old is not None and old != slot:
+            del self.slots[old][key]
+        self.slots[slot][key] = due
+        self._where[key] = slot
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now):
+        """推进到 now，返回到期的键 (从时间轮中移除)。超过一圈没有推进时每个槽只检查一次"""
+        target = int(now // self.tick)
+        slots = self.slots
+        expired = []
+        for step in range(1, min(target - self.current, len(slots)) + 1):
+            slot = slots[(self.current + step) % len(slots)]
+            if not slot:
+                continue
+            # 截止时间超过一圈的键留在槽中，下一圈再检查
+            due = [key for key, tick in slot.items() if tick <= target]
+            for key in due:
+                del slot[key]
+                del self._where[key]
+            expired.extend(due)
+        self.current = max(self.current, target)
+        return expired
+
+    def __len__(self):
+        return len(self._where)
+
+
+class LivenessTracker:
+    """所有设备的在线状态 (线程安全: 站点工作线程调用 touch，定时线程调用 tick)"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS, clock=time.time):
+        self.timeout = timeout
+        self.clock = clock
+        self.last_seen = {}  # 在线设备 -> 最后一条读数的时间
+        self.timeouts = {}   # 上报间隔被调整过的设备 -> 超时 (见 adaptive_rate.py)
+        self.wheel = TimerWheel(tick, slots, clock())
+        self._lock = threading.Lock()
+
+    def touch(self, client_id, now=None):
+        """收到设备读数，返回 True 表示设备刚刚上线 (第一次出现或离线后恢复)"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            online = client_id in self.last_seen
+            self.last_seen[client_id] = now
+            if not online:
+                self.wheel.schedule(client_id, now + self.timeouts.get(client_id, self.timeout))
+        return not online
+
+    def set_timeout(self, client_id, timeout):
+        """设置单台设备的超时 (上报间隔变化时)；延长立即生效，缩短在当前截止时间到期后生效"""
+        with self._lock:
+            if timeout == self.timeout:
+                self.timeouts.pop(client_id, None)
+            else:
+                self.timeouts[client_id] = timeout
+
+    def seed(self, last_seen):
+        """网关重启时恢复之前在线的设备 {client_id: 时间戳}，不产生上线事件；之后仍未上报的设备按时离线"""
+        with self._lock:
+            for client_id, seen in last_seen.items():
+                if client_id not in self.last_seen:
+                    self.last_seen[client_id] = seen
+                    self.wheel.schedule(client_id, seen + self.timeouts.get(client_id, self.timeout))
+
+    def tick(self, now=None):
+        """推进时间轮，返回刚刚离线的设备 [(client_id, 最后一条读数的时间), ...]"""
+        now = self.clock() if now is None else now
+        offline = []
+        with self._lock:
+            for client_id in self.wheel.advance(now):
+                seen = self.last_seen.get(client_id)
+                if seen is None:
+                    continue
+                timeout = self.timeouts.get(client_id, self.timeout)
+                if seen + timeout > now:
+                    self.wheel.schedule(client_id, seen + timeout)
+                else:
+                    del self.last_seen[client_id]
+                    offline.append((client_id, seen))
+        return offline
+
+    def is_online(self, client_id):
+        return client_id in self.last_seen
+
+    def __len__(self):
+        return len(self.last_seen)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+图表序列降采样 (Largest-Triangle-Three-Buckets)
+=====================================
+把 n 个点的时间序列降到 points 个点，同时尽量保留曲线形状 (峰值、谷值、突变):
+首尾两点固定保留，中间的点均分为 points-2 个桶，每个桶选出与"上一个选中点"和"下一个桶的平均点"
+构成三角形面积最大的点。参考 Sveinn Steinarsson, "Downsampling Time Series for Visual Representation" (2013)。
+
+- 桶内的面积计算用 NumPy 向量化，桶之间的依赖 (上一个选中点) 只需一个 points 次的循环；
+  一周的秒级数据 (约 60 万点) 降到 1000 点约几十毫秒
+- 未安装 NumPy 时使用纯 Python 实现，结果相同
+- 温度/湿度/光照各自选点 (downsample_series)，返回 ECharts 时间轴可以直接使用的 [毫秒时间戳, 值] 数组
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 数据点数超过目标点数的这个倍数时，先在数据库中按时间分桶取平均 (见 web_display.chart_range)，再做 LTTB
+ROLLUP_FACTOR = 8
+
+
+def _bucket_edges(n, points):
+    """中间 points-2 个桶的边界: 第 i 个桶为 [edges[i], edges[i+1])，覆盖下标 1 .. n-2"""
+    step = (n - 2) / (points - 2)
+    return [1 + int(i * step) for i in range(points - 2)] + [n - 1]
+
+
+def _lttb_numpy(x, y, points):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    edges = np.asarray(_bucket_edges(n, points), dtype=np.intp)
+    starts, ends = edges[:-1], edges[1:]
+    # 各桶的平均点用前缀和一次算出；最后一个桶的"下一个桶"是最后一个点
+    csx = np.concatenate(([0.0], np.cumsum(x)))
+    csy = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    next_x = np.append(((csx[ends] - csx[starts]) / counts)[1:], x[-1])
+    next_y = np.append(((csy[ends] - csy[starts]) / counts)[1:], y[-1])
+    selected = np.empty(points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected.tolist()
+
+
+def _lttb_python(x, y, points):
+    n = len(x)
+    edges = _bucket_edges(n, points)
+    selected = [0]
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = hi, edges[i + 2]
+            next_x = sum(x[nlo:nhi]) / (nhi - nlo)
+            next_y = sum(y[nlo:nhi]) / (nhi - nlo)
+        else:
+            next_x, next_y = x[-1], y[-1]
+        ax, ay = x[a], y[a]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((ax - next_x) * (y[j] - ay) - (ax - x[j]) * (next_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def lttb_indices(x, y, points):
+    """按 x 升序的序列 (x, y) -> 保留点的下标列表 (升序)；点数不超过 points 时返回全部下标"""
+    n = len(x)
+    if points >= n or n <= 2:
+        return list(range(n))
+    if points < 3:
+        raise ValueError('points must be at least 3')
+    # 时间戳数值很大，减去起点再计算面积，避免浮点误差
+    x0 = x[0]
+    x = [v - x0 for v in x] if np is None else np.asarray(x, dtype=np.float64) - x0
+    return (_lttb_python if np is None else _lttb_numpy)(x, y, points)
+
+
+def downsample_series(timestamps, columns, points):
+    """
+    timestamps: Unix 时间戳 (秒) 列表，升序；columns: {名称: 数值列表}
+    返回 {名称: [[毫秒时间戳, 值], ...]}，每一列各自做 LTTB
+    """
+    series = {}
+    for name, values in columns.items():
+        values = [float(v) for v in values]
+        series[name] = [[int(timestamps[i] * 1000), values[i]] for i in lttb_indices(timestamps, values, points)]
+    return series
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标模块 (Prometheus 文本格式)
+=====================================
+- 计数器 (Counter)、仪表 (Gauge)、直方图 (Histogram) 三种指标类型
+- 网关进程通过 start_http_server() 在独立端口暴露 /metrics
+- Web服务直接在 Flask 路由中返回 render_metrics() 的结果
+- 只依赖标准库，所有指标操作都是线程安全的
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 延迟类直方图的默认分桶 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """所有指标类型的公共部分：名称、说明、标签和按标签值分组的子指标"""
+    type_name = ''
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """按标签值获取子指标，例如 QUEUE_DEPTH.labels('db_writer').set(3)"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要 {len(self.labelnames)} 个标签值")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        # 无标签指标直接在自身上操作
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.samples(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器，例如收到的消息总数"""
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self.func = None
+
+    def set(self, value):
+        self.value = float(value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set_function(self, func):
+        """采集时调用 func() 取值，适合队列长度这类随时可读的状态"""
+        self.func = func
+
+    def samples(self, name, labelnames, key):
+        value = self.value
+        if self.func is not None:
+            try:
+                value = float(self.func())
+            except Exception:
+                pass
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，例如当前SSE连接数、队列深度"""
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, func):
+        self._default().set_function(func)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labelnames, key):
+        lines, cumulative = [], 0
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', '+Inf'))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    """with HISTOGRAM.time(): ... 记录代码块耗时"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    """分桶统计的耗时分布，例如数据库插入延迟"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    """指标注册表，render() 输出所有已注册指标"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+# --- 网关侧指标 ---
+MESSAGES_RECEIVED = Counter('iot_messages_received_total', 'MQTT消息接收总数', registry=REGISTRY)
+MESSAGES_PARSED = Counter('iot_messages_parsed_total', '成功解析的消息总数', registry=REGISTRY)
+MESSAGES_INVALID = Counter('iot_messages_invalid_total', '格式错误或缺少字段的消息总数', registry=REGISTRY)
+MESSAGES_REJECTED = Counter('iot_messages_rejected_total', '被数据平滑度检查丢弃的消息总数', ('field',), registry=REGISTRY)
+READINGS_INSERTED = Counter('iot_readings_inserted_total', '写入数据库的记录总数', registry=REGISTRY)
+DB_ERRORS = Counter('iot_db_errors_total', '数据库操作失败次数', registry=REGISTRY)
+REDIS_PUBLISHED = Counter('iot_redis_published_total', '发布到Redis的消息总数', registry=REGISTRY)
+READINGS_SPOOLED = Counter('iot_readings_spooled_total', '数据库不可用时暂存到本地文件的读数总数', registry=REGISTRY)
+READINGS_REPLAYED = Counter('iot_readings_replayed_total', '从本地暂存文件回放到数据库的读数总数', registry=REGISTRY)
+READINGS_COALESCED = Counter('iot_readings_coalesced_total', '过载时与同一设备待处理读数合并的读数总数', ('policy',), registry=REGISTRY)
+READINGS_SYNCED = Counter('iot_readings_synced_total', '边缘网关同步到中心数据库的读数总数', registry=REGISTRY)
+DB_CIRCUIT_OPEN = Gauge('iot_db_circuit_open', '数据库熔断器是否处于断开状态 (1=断开)', ('tenant',), registry=REGISTRY)
+COMMANDS_PUBLISHED = Counter('iot_commands_published_total', '下发给设备的控制指令总数', ('command',), registry=REGISTRY)
+COMMANDS_RELAYED = Counter('iot_commands_relayed_total', '网关从 Redis 指令频道转发到MQTT代理的指令总数', registry=REGISTRY)
+DEVICE_TRANSITIONS = Counter('iot_device_transitions_total', '设备上线/离线的次数', ('state',), registry=REGISTRY)
+
+DB_INSERT_SECONDS = Histogram('iot_db_insert_seconds', '数据库插入耗时 (秒)', registry=REGISTRY)
+STATUS_LOOKUP_SECONDS = Histogram('iot_status_lookup_seconds', '设备最新状态查询耗时 (秒)', registry=REGISTRY)
+REDIS_PUBLISH_SECONDS = Histogram('iot_redis_publish_seconds', 'Redis发布耗时 (秒)', registry=REGISTRY)
+
+# --- MQTT 连接状态 ---
+MQTT_CONNECTED = Gauge('iot_mqtt_connected', '网关是否已连接到MQTT代理 (1=已连接)', ('tenant',), registry=REGISTRY)
+MQTT_DISCONNECTS = Counter('iot_mqtt_disconnects_total', '与MQTT代理意外断开的次数', registry=REGISTRY)
+MQTT_RECONNECTS = Counter('iot_mqtt_reconnects_total', '重连MQTT代理的尝试次数', registry=REGISTRY)
+MQTT_CONNECT_FAILURES = Counter('iot_mqtt_connect_failures_total', '连接MQTT代理失败的次数', registry=REGISTRY)
+
+# --- Web侧与队列指标 ---
+SSE_CLIENTS = Gauge('iot_sse_clients', '当前连接的SSE客户端数量', registry=REGISTRY)
+WS_CLIENTS = Gauge('iot_ws_clients', '当前连接的WebSocket客户端数量', registry=REGISTRY)
+DEVICES_ONLINE = Gauge('iot_devices_online', '网关判定在线的设备数量', ('tenant',), registry=REGISTRY)
+QUEUE_DEPTH = Gauge('iot_queue_depth', '内部队列当前长度', ('queue',), registry=REGISTRY)
+
+
+# 指标端口上的附加路由: path -> func(query_string) -> (状态码, Content-Type, 内容)
+_EXTRA_ROUTES = {}
+
+
+def add_route(path, func):
+    """在指标HTTP服务上挂载调试路由，例如剖析器的 /debug/profile"""
+    _EXTRA_ROUTES[path] = func
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/metrics':
+            status, content_type, body = 200, CONTENT_TYPE, render_metrics()
+        elif path in _EXTRA_ROUTES:
+            try:
+                status, content_type, body = _EXTRA_ROUTES[path](query)
+            except Exception as e:
+                status, content_type, body = 500, 'text/plain; charset=utf-8', f"{type(e).__name__}: {e}\n"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不输出访问日志
+        pass
+
+
+def start_http_server(port, addr='0.0.0.0'):
+    """在后台守护线程中启动 /metrics HTTP 服务，返回 server 对象"""
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return server
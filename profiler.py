@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+on_message 热路径分阶段性能剖析
+=====================================
+- 运行时开关，无需重启: 信号 (SIGUSR1 开/关, SIGUSR2 输出报告，由 gateway/supervisor.py 注册) 或 HTTP (指标端口上的 /debug/profile)
+- timer 模式: 在每个阶段 (网关流水线的 decode/validate/state/rules/command/persist/notify) 打点，按阶段聚合次数、总耗时、平均、最大
+- cprofile 模式: 额外用 cProfile 采样处理函数，报告附带按累计耗时排序的前 N 个函数。
+  cProfile 不能在多个线程中同时开启 (调用栈会交错，Python 3.12 起直接报错)，只采集第一个处理消息的线程，其他线程仍按 timer 模式打点
+- 关闭状态下 begin() 直接返回 None，热路径只多一次属性判断
+
+HTTP 用法 (网关指标端口，默认 9100):
+    curl 'http://localhost:9100/debug/profile?action=start'            # 开启 timer 模式
+    curl 'http://localhost:9100/debug/profile?action=start&mode=cprofile&sample=10'
+    curl 'http://localhost:9100/debug/profile'                         # 查看报告
+    curl 'http://localhost:9100/debug/profile?action=stop'
+    curl 'http://localhost:9100/debug/profile?action=reset'
+"""
+import cProfile
+import io
+import itertools
+import pstats
+import threading
+import time
+from urllib.parse import parse_qs
+
+import iot_log
+
+log = iot_log.get_logger('profiler')
+
+
+class _Trace:
+    """一条消息的剖析上下文，mark(stage) 记录距上一次打点的耗时"""
+    __slots__ = ('profiler', 'last', 'started', 'cprofile')
+
+    def __init__(self, profiler, cprofile=None):
+        self.profiler = profiler
+        self.cprofile = cprofile
+        self.started = self.last = time.perf_counter()
+        if cprofile is not None:
+            cprofile.enable()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.profiler.record(stage, now - self.last)
+        self.last = now
+
+    def finish(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.profiler.record('total', time.perf_counter() - self.started)
+
+
+class _Snapshot:
+    """
+    采集中的 cProfile 的统计快照。pstats.Stats(profile) 会调用 profile.create_stats()，
+    其中的 disable() 作用于调用 report() 的线程而不是采集线程，这里只读取统计
+    """
+
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+class StageProfiler:
+    def __init__(self, name='on_message'):
+        self.name = name
+        self.enabled = False
+        self.mode = 'timer'
+        self.sample_every = 1
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {}            # stage -> [次数, 总耗时, 最大耗时]
+        self._cprofile = None
+        self._cprofile_thread = None  # 采集 cProfile 的线程
+        self._started_at = None
+
+    # --- 开关 ---
+    def start(self, mode='timer', sample_every=1):
+        with self._lock:
+            self.mode = mode if mode in ('timer', 'cprofile') else 'timer'
+            self.sample_every = max(1, int(sample_every))
+            if self.mode == 'cprofile' and self._cprofile is None:
+                self._cprofile, self._cprofile_thread = cProfile.Profile(), None
+            self._started_at = time.time()
+            self.enabled = True
+        log.info("🔬 已开启 %s 剖析 (模式=%s, 每%s条采样1条)", self.name, self.mode, self.sample_every)
+
+    def stop(self):
+        self.enabled = False
+        log.info("🔬 已关闭 %s 剖析", self.name)
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start(self.mode, self.sample_every)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._cprofile = cProfile.Profile() if self.mode == 'cprofile' else None
+            self._cprofile_thread = None
+            self._started_at = time.time() if self.enabled else None
+
+    # --- 热路径 ---
+    def begin(self):
+        """开启时返回 _Trace，未开启或未被采样时返回 None"""
+        if not self.enabled:
+            return None
+        if self.sample_every > 1 and next(self._counter) % self.sample_every:
+            return None
+        return _Trace(self, self._thread_cprofile() if self.mode == 'cprofile' else None)
+
+    def _thread_cprofile(self):
+        thread = threading.get_ident()
+        if self._cprofile_thread is None:
+            with self._lock:
+                if self._cprofile_thread is None:
+                    self._cprofile_thread = thread
+        return self._cprofile if self._cprofile_thread == thread else None
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._stats.get(stage)
+            if entry is None:
+                self._stats[stage] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    # --- 报告 ---
+    def snapshot(self):
+        with self._lock:
+            return {stage: {'count': c, 'total_ms': t * 1000, 'avg_ms': t * 1000 / c, 'max_ms': m * 1000}
+                    for stage, (c, t, m) in self._stats.items()}
+
+    def report(self, top=20):
+        stats = self.snapshot()
+        total = stats.get('total', {}).get('total_ms') or sum(s['total_ms'] for s in stats.values()) or 1.0
+        state = '开启' if self.enabled else '关闭'
+        lines = [f"{self.name} 分阶段耗时 (状态={state}, 模式={self.mode}, 采样=1/{self.sample_every})",
+                 f"{'阶段':<12}{'次数':>10}{'总耗时ms':>14}{'平均ms':>12}{'最大ms':>12}{'占比':>8}"]
+        for stage, s in sorted(stats.items(), key=lambda kv: -kv[1]['total_ms']):
+            share = '' if stage == 'total' else f"{s['total_ms'] / total * 100:.1f}%"
+            lines.append(f"{stage:<12}{s['count']:>10}{s['total_ms']:>14.2f}{s['avg_ms']:>12.3f}{s['max_ms']:>12.3f}{share:>8}")
+        if self._cprofile is not None and self.mode == 'cprofile':
+            out = io.StringIO()
+            try:
+                pstats.Stats(_Snapshot(self._cprofile), stream=out).sort_stats('cumulative').print_stats(top)
+                lines.append('')
+                lines.append(f"cProfile (线程 {self._cprofile_thread}):")
+                lines.append(out.getvalue())
+            except TypeError:
+                # 还没有采集到任何数据
+                pass
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        log.info("🔬 剖析报告:\n%s", self.report())
+
+    # --- 控制入口 ---
+    def handle_http(self, query):
+        """/debug/profile 路由，返回 (状态码, Content-Type, 内容)"""
+        params = parse_qs(query)
+        action = params.get('action', ['report'])[0]
+        if action == 'start':
+            mode = params.get('mode', ['timer'])[0]
+            if mode not in ('timer', 'cprofile'):
+                return 400, 'text/plain; charset=utf-8', f"未知模式: {mode} (可选: timer, cprofile)\n"
+            try:
+                sample_every = int(params.get('sample', ['1'])[0])
+            except ValueError:
+                return 400, 'text/plain; charset=utf-8', "sample 需要是正整数\n"
+            if sample_every < 1:
+                return 400, 'text/plain; charset=utf-8', "sample 需要是正整数\n"
+            self.start(mode, sample_every)
+        elif action == 'stop':
+            self.stop()
+        elif action == 'reset':
+            self.reset()
+        elif action != 'report':
+            return 400, 'text/plain; charset=utf-8', f"未知操作: {action}\n"
+        return 200, 'text/plain; charset=utf-8', self.report()
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+合成数据生成 + SQL 查询压测
+=====================================
+index() 的窗口函数查询、图表查询等的耗时完全取决于 sensor_readings 的规模，这里可以在单独的库中生成指定规模的数据，
+对网关和 Web 端实际执行的每一条查询计时，分别在现有表结构和加上建议索引 (PROPOSED_INDEXES) 后各测一次，输出可对比的报告。
+
+seed  生成合成读数 (默认写入单独的库 iot_bench，不影响生产数据):
+      - 设备上报频率不均匀 (对数正态分布，少数设备上报很频繁)，约 20% 的设备有一段离线时间
+      - 温度/湿度/光照按昼夜周期变化 (湿度与温度负相关，夜间光照接近 0)，加随机噪声；
+        风扇/补光灯状态按默认阈值推导，约 3% 的设备为手动模式
+      - 多个进程各自生成一部分设备，按时间顺序写入 (id 随时间递增，与实际写入顺序一致)，
+        通过 bulk_import.Loader 以 LOAD DATA / 多行 INSERT 写入；最后重建 device_latest 并分配站点/温室
+run   对 QUERIES 中的每条查询计时 (每次随机选择设备)，报告 p50/p95/最大耗时、返回行数和 EXPLAIN 使用的索引；
+      --indexes 时创建建议索引后再测一次 (报告索引创建耗时和大小)，默认测完后删除索引
+
+用法:
+    python query_benchmark.py seed --devices 1000 --rows 10000000 --days 90 --workers 4
+    python query_benchmark.py run --repeat 10 --indexes --output query_report.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+from datetime import datetime, timedelta
+
+import config
+import iot_log
+from backends import (ASSIGN_GROUP_SQL, DEVICE_GROUPS_DDL, DEVICE_LATEST_DDL, INSERT_READINGS_SQL, READING_COLUMNS, SENSOR_READINGS_DDL,
+                      UPSERT_DEVICE_LATEST_SQL, auto_increment_step, device_latest_values, refresh_device_latest)
+from benchmark import percentile
+from bulk_import import Loader
+
+log = iot_log.get_logger('query_benchmark')
+
+DEFAULT_DATABASE = 'iot_bench'
+# 每次生成一个时间片内所有设备的读数，排序后写入
+SLICE_SECONDS = 3600
+OUTAGE_PROBABILITY = 0.2
+MANUAL_PROBABILITY = 0.03
+
+# 建议索引: 按设备 + 时间的查询 (最新状态、图表、时间范围) 和按时间的查询 (归档、清理)。
+# SQLite 边缘存储已有同样的索引 (backends.SQLITE_SCHEMA)
+PROPOSED_INDEXES = {
+    'idx_readings_client_ts': "CREATE INDEX idx_readings_client_ts ON sensor_readings (client_id, timestamp)",
+    'idx_readings_ts': "CREATE INDEX idx_readings_ts ON sensor_readings (timestamp)",
+}
+
+RANGE_WHERE = "client_id = %s AND timestamp >= %s AND timestamp < %s"
+
+# (名称, 来源, SQL, 参数)；参数为函数 (ctx) -> 元组，ctx 提供随机设备和数据的时间范围
+QUERIES = [
+    ('index.latest_ids', 'web_display.index', "SELECT client_id, reading_id FROM device_latest", None),
+    ('index.window20', 'web_display.index / web_asgi.index',
+     "WITH LatestReadings AS (SELECT *, ROW_NUMBER() OVER(PARTITION BY client_id ORDER BY timestamp DESC) as rn FROM sensor_readings) "
+     "SELECT * FROM LatestReadings WHERE rn <= 20 ORDER BY client_id, timestamp DESC", None),
+    ('chart_data.window30', 'web_display.chart_data / web_asgi.chart_data',
+     "SELECT client_id, timestamp, temperature, humidity, light_intensity FROM (SELECT client_id, timestamp, temperature, humidity, light_intensity, "
+     "ROW_NUMBER() OVER(PARTITION BY client_id ORDER BY timestamp DESC) AS rn FROM sensor_readings) t WHERE rn <= %s ORDER BY client_id, timestamp ASC",
+     lambda ctx: (30,)),
+    ('chart.device_limit30', '原 fuwu_new 图表接口 (每台设备一次)',
+     "SELECT timestamp, temperature, humidity, light_intensity FROM sensor_readings WHERE client_id = %s ORDER BY timestamp DESC LIMIT 30",
+     lambda ctx: (ctx.device(),)),
+    ('latest_status.scan', '原 get_latest_device_status',
+     "SELECT fan_status, light_status, control_mode FROM sensor_readings WHERE client_id = %s ORDER BY timestamp DESC LIMIT 1",
+     lambda ctx: (ctx.device(),)),
+    ('latest_status.device_latest', 'backends.MySQLStorage.latest_status',
+     "SELECT fan_status, light_status, control_mode FROM device_latest WHERE client_id = %s", lambda ctx: (ctx.device(),)),
+    ('devices_latest', 'web_display.devices_latest', "SELECT * FROM device_latest ORDER BY client_id", None),
+    ('chart_range.count_24h', 'web_display.chart_range', f"SELECT COUNT(*) AS n FROM sensor_readings WHERE {RANGE_WHERE}",
+     lambda ctx: ctx.device_range(timedelta(days=1))),
+    ('chart_range.raw_1h', 'web_display.chart_range',
+     f"SELECT timestamp AS ts, temperature, humidity, light_intensity FROM sensor_readings WHERE {RANGE_WHERE} ORDER BY timestamp, id",
+     lambda ctx: ctx.device_range(timedelta(hours=1))),
+    ('chart_range.rollup_7d', 'web_display.chart_range',
+     "SELECT FLOOR(TIMESTAMPDIFF(SECOND, %s, timestamp) / %s) AS b, AVG(TIMESTAMPDIFF(SECOND, %s, timestamp)) AS seconds, AVG(temperature) AS temperature, AVG(humidity) AS humidity, "
+     f"AVG(light_intensity) AS light_intensity FROM sensor_readings WHERE {RANGE_WHERE} GROUP BY b ORDER BY b",
+     lambda ctx: (lambda client_id, start, end: (start, max(1, 7 * 86400 // 8000), start, client_id, start, end))(*ctx.device_range(timedelta(days=7)))),
+    ('refresh_device_latest.device', 'backends.refresh_device_latest (回放/导入之后)',
+     "SELECT client_id, id FROM (SELECT client_id, id, ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY timestamp DESC, id DESC) AS rn "
+     "FROM sensor_readings WHERE client_id = %s) ranked WHERE rn = 1", lambda ctx: (ctx.device(),)),
+    ('groups', 'web_display.groups',
+     "SELECT site, greenhouse, COUNT(*) AS devices FROM device_groups GROUP BY site, greenhouse ORDER BY site, greenhouse", None),
+    ('archive.chunk', 'archive_blocks.archive_once', "SELECT * FROM sensor_readings WHERE id > %s AND timestamp < %s ORDER BY id LIMIT 50000",
+     lambda ctx: (0, ctx.end - timedelta(days=30))),
+]
+# 写入: 网关批量写库的一批 (多行 INSERT + device_latest upsert)，测完回滚；建议索引会增加写入成本
+WRITE_BATCH_ROWS = 200
+
+
+# =============================================================================
+# seed: 合成数据
+# =============================================================================
+def device_profiles(devices, rows, start, end, seed):
+    """每台设备的上报间隔、气候参数和离线时段；各设备上报速率之和约为 rows / 时间跨度"""
+    rng = random.Random(seed)
+    span = (end - start).total_seconds()
+    weights = [rng.lognormvariate(0, 0.75) for _ in range(devices)]
+    total = sum(weights)
+    profiles = []
+    for i, weight in enumerate(weights):
+        outage = None
+        if rng.random() < OUTAGE_PROBABILITY:
+            length = rng.uniform(0.01, 0.1) * span
+            outage_start = start.timestamp() + rng.uniform(0, span - length)
+            outage = (outage_start, outage_start + length)
+        profiles.append({'client_id': f'dev{i:06d}', 'interval': span * total / (rows * weight), 'base_temp': rng.gauss(24, 3),
+                         'base_humidity': rng.gauss(60, 8), 'max_light': rng.uniform(300, 1200),
+                         'control_mode': 'manual' if rng.random() < MANUAL_PROBABILITY else 'auto', 'outage': outage})
+    return profiles
+
+
+def reading_at(profile, ts, rng, thresholds):
+    """设备在时间 ts 的一条读数 (READING_COLUMNS 顺序)"""
+    day = (ts % 86400) / 86400
+    # 温度在 15 点左右最高，光照在 6~18 点之间
+    temperature = profile['base_temp'] + 5 * math.sin(2 * math.pi * (day - 0.375)) + rng.gauss(0, 0.4)
+    humidity = min(99.0, max(5.0, profile['base_humidity'] - 1.5 * (temperature - profile['base_temp']) + rng.gauss(0, 2)))
+    light = max(0.0, profile['max_light'] * math.sin(math.pi * (day - 0.25) / 0.5) if 0.25 < day < 0.75 else 0.0) + abs(rng.gauss(0, 5))
+    fan = 1 if temperature >= thresholds['fan_on_temp'] else 0
+    lamp = 1 if light < thresholds['light_on_lux'] else 0
+    return (profile['client_id'], round(temperature, 2), round(humidity, 1), round(light, 1), fan, lamp, profile['control_mode'],
+            datetime.fromtimestamp(int(ts)))
+
+
+def generate(profiles, start, end, seed, thresholds):
+    """按时间片产生读数列表，每片内按时间排序"""
+    rng = random.Random(seed)
+    next_ts = [start.timestamp() + rng.uniform(0, p['interval']) for p in profiles]
+    slice_start, stop = start.timestamp(), end.timestamp()
+    while slice_start < stop:
+        slice_end = min(stop, slice_start + SLICE_SECONDS)
+        rows = []
+        for i, profile in enumerate(profiles):
+            ts, interval, outage = next_ts[i], profile['interval'], profile['outage']
+            while ts < slice_end:
+                if outage is None or not outage[0] <= ts < outage[1]:
+                    rows.append((ts, reading_at(profile, ts, rng, thresholds)))
+                ts += interval * rng.uniform(0.9, 1.1)
+            next_ts[i] = ts
+        rows.sort(key=lambda item: item[0])
+        yield [row for _, row in rows]
+        slice_start = slice_end
+
+
+def run_seeder(index, profiles, start, end, seed, mysql_config, thresholds, method, results):
+    iot_log.setup_logging()
+    # 合成数据不做平滑度检查
+    loader = Loader(mysql_config, dict(thresholds, smoothing_enabled=False), method=method)
+    for rows in generate(profiles, start, end, seed + index, thresholds):
+        loader.add(rows)
+    loader.close()
+    results.put(loader.stats)
+
+
+def seed_database(args, mysql_config, thresholds):
+    import mysql.connector
+    conn = mysql.connector.connect(**mysql_config)
+    try:
+        with conn.cursor() as cursor:
+            for ddl in (SENSOR_READINGS_DDL, DEVICE_LATEST_DDL, DEVICE_GROUPS_DDL):
+                cursor.execute(ddl)
+            if args.truncate:
+                for table in ('sensor_readings', 'device_latest', 'device_groups'):
+                    cursor.execute(f"TRUNCATE TABLE {table}")
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM sensor_readings)")
+            if cursor.fetchone()[0] and not args.append:
+                raise SystemExit(f"{mysql_config['database']}.sensor_readings 已有数据，使用 --truncate 清空或 --append 追加")
+        conn.commit()
+    finally:
+        conn.close()
+
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=args.days)
+    profiles = device_profiles(args.devices, args.rows, start, end, args.seed)
+    log.info("🌱 生成 %d 台设备约 %d 条读数 (%s ~ %s)，%d 个进程", args.devices, args.rows, start, end, args.workers)
+    started = time.perf_counter()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_seeder, name=f'seeder-{i}', daemon=True,
+                                         args=(i, profiles[i::args.workers], start, end, args.seed, mysql_config, thresholds, args.method, results))
+                 for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    loaded = failed = 0
+    for _ in processes:
+        stats = results.get()
+        loaded, failed = loaded + stats['loaded'], failed + stats['failed']
+    for process in processes:
+        process.join()
+    load_seconds = time.perf_counter() - started
+
+    conn = mysql.connector.connect(**mysql_config)
+    try:
+        with conn.cursor() as cursor:
+            refresh_device_latest(cursor)
+            rng = random.Random(args.seed)
+            cursor.executemany(ASSIGN_GROUP_SQL, [(p['client_id'], f'site{rng.randrange(args.sites)}', f'gh{rng.randrange(4)}') for p in profiles])
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE TABLE sensor_readings, device_latest, device_groups")
+            cursor.fetchall()
+    finally:
+        conn.close()
+    log.info("✅ 写入 %d 条读数 (失败 %d)，%.0f 条/秒，总用时 %.1f 秒", loaded, failed, loaded / max(load_seconds, 1e-9), time.perf_counter() - started)
+
+
+# =============================================================================
+# run: 查询计时
+# =============================================================================
+class QueryContext:
+    """查询参数: 随机设备，时间范围以数据中最新的读数时间为终点"""
+
+    def __init__(self, devices, end, seed):
+        self.devices = devices
+        self.end = end
+        self.rng = random.Random(seed)
+
+    def device(self):
+        return self.rng.choice(self.devices)
+
+    def device_range(self, length):
+        return self.device(), self.end - length, self.end
+
+
+def table_sizes(cursor, database):
+    cursor.execute("SELECT table_name AS name, table_rows AS row_estimate, data_length, index_length FROM information_schema.tables "
+                   "WHERE table_schema = %s AND table_name IN ('sensor_readings', 'device_latest', 'device_groups')", (database,))
+    return {row['name']: {'row_estimate': row['row_estimate'], 'data_mb': round(row['data_length'] / 2 ** 20, 1),
+                          'index_mb': round(row['index_length'] / 2 ** 20, 1)} for row in cursor.fetchall()}
+
+
+def explain(cursor, sql, params):
+    """EXPLAIN 中 sensor_readings / device_latest 的访问方式: '表:type/key/rows' 列表"""
+    cursor.execute("EXPLAIN " + sql, params)
+    plans = []
+    for row in cursor.fetchall():
+        if row.get('table') in ('sensor_readings', 'device_latest', 'device_groups'):
+            plans.append(f"{row['table']}:{row.get('type')}/{row.get('key') or '-'}/{row.get('rows')}")
+    return plans
+
+
+def time_query(conn, sql, params_fn, ctx, repeat, warmup, mysql_errors):
+    timings, rows, errors = [], 0, 0
+    params = params_fn(ctx) if params_fn else ()
+    with conn.cursor(dictionary=True) as cursor:
+        plan = explain(cursor, sql, params)
+        for i in range(warmup + repeat):
+            params = params_fn(ctx) if params_fn else ()
+            start = time.perf_counter()
+            try:
+                cursor.execute(sql, params)
+                rows = len(cursor.fetchall())
+            except mysql_errors as e:
+                # 3024: 超过 max_execution_time
+                errors += 1
+                log.warning("⏱️ 查询失败: %s", e)
+                if e.errno == 3024:
+                    break
+                continue
+            if i >= warmup:
+                timings.append(time.perf_counter() - start)
+        conn.rollback()
+    timings.sort()
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {'runs': len(timings), 'errors': errors, 'rows': rows, 'p50_ms': ms(percentile(timings, 50)), 'p95_ms': ms(percentile(timings, 95)),
+            'max_ms': ms(timings[-1] if timings else None), 'plan': plan}
+
+
+def time_write_batch(conn, ctx, repeat):
+    """网关一批写入 (WRITE_BATCH_ROWS 条) 的耗时，每次回滚，不改变数据"""
+    timings = []
+    with conn.cursor() as cursor:
+        step = auto_increment_step(cursor)
+    for _ in range(repeat):
+        now = ctx.end
+        rows = [(ctx.device(), 25.0, 60.0, 300.0, 0, 0, 'auto', now) for _ in range(WRITE_BATCH_ROWS)]
+        start = time.perf_counter()
+        with conn.cursor() as cursor:
+            cursor.executemany(INSERT_READINGS_SQL, rows)
+            records = [dict(zip(READING_COLUMNS, row), id=cursor.lastrowid + i * step) for i, row in enumerate(rows)]
+            cursor.executemany(UPSERT_DEVICE_LATEST_SQL, [device_latest_values(r) for r in records])
+        timings.append(time.perf_counter() - start)
+        conn.rollback()
+    timings.sort()
+    return {'runs': len(timings), 'errors': 0, 'rows': WRITE_BATCH_ROWS, 'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2), 'max_ms': round(timings[-1] * 1000, 2), 'plan': []}
+
+
+def run_phase(conn, ctx, args, mysql_errors):
+    results = {}
+    for name, source, sql, params_fn in QUERIES:
+        if args.query and not any(pattern in name for pattern in args.query):
+            continue
+        results[name] = dict(time_query(conn, sql, params_fn, ctx, args.repeat, args.warmup, mysql_errors), source=source)
+        log.info("⏱️ %-30s p50 %s ms  (%s)", name, results[name]['p50_ms'], ', '.join(results[name]['plan']))
+    if not args.query or any(pattern in 'gateway.write_batch' for pattern in args.query):
+        results['gateway.write_batch'] = dict(time_write_batch(conn, ctx, args.repeat), source='backends.MySQLStorage.insert_readings')
+    return results
+
+
+def existing_indexes(cursor):
+    cursor.execute("SHOW INDEX FROM sensor_readings")
+    return {row['Key_name'] for row in cursor.fetchall()}
+
+
+def run_benchmark(args, mysql_config):
+    import mysql.connector
+    conn = mysql.connector.connect(**mysql_config)
+    report = {'database': mysql_config['database'], 'repeat': args.repeat, 'phases': {}}
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            # 只对 SELECT 生效；超时的查询记为失败，不再重复
+            cursor.execute("SET SESSION max_execution_time = %s", (int(args.timeout * 1000),))
+            cursor.execute("SELECT client_id, timestamp FROM device_latest")
+            latest = cursor.fetchall()
+            if not latest:
+                raise SystemExit("device_latest 为空，先运行 seed")
+            report['tables'] = table_sizes(cursor, mysql_config['database'])
+            indexes = existing_indexes(cursor)
+        conn.rollback()
+        ctx = QueryContext([row['client_id'] for row in latest], max(row['timestamp'] for row in latest), args.seed)
+        log.info("📊 %d 台设备，sensor_readings 约 %s 行，现有索引: %s", len(latest), report['tables'].get('sensor_readings', {}).get('row_estimate'),
+                 ', '.join(sorted(indexes)))
+        report['phases']['baseline'] = {'indexes': sorted(indexes), 'queries': run_phase(conn, ctx, args, mysql.connector.Error)}
+
+        if args.indexes:
+            created = {}
+            with conn.cursor(dictionary=True) as cursor:
+                for name, ddl in PROPOSED_INDEXES.items():
+                    if name in indexes:
+                        continue
+                    start = time.perf_counter()
+                    cursor.execute(ddl)
+                    created[name] = round(time.perf_counter() - start, 2)
+                    log.info("🔧 创建索引 %s 用时 %.1f 秒", name, created[name])
+                cursor.execute("ANALYZE TABLE sensor_readings")
+                cursor.fetchall()
+                sizes = table_sizes(cursor, mysql_config['database'])
+            try:
+                ctx.rng.seed(args.seed)  # 与基准阶段使用相同的设备序列
+                report['phases']['indexed'] = {'indexes': sorted(indexes | set(PROPOSED_INDEXES)), 'build_seconds': created,
+                                               'tables': sizes, 'queries': run_phase(conn, ctx, args, mysql.connector.Error)}
+            finally:
+                if not args.keep_indexes:
+                    with conn.cursor() as cursor:
+                        for name in created:
+                            cursor.execute(f"DROP INDEX {name} ON sensor_readings")
+    finally:
+        conn.close()
+    return report
+
+
+def print_report(report):
+    baseline = report['phases']['baseline']['queries']
+    indexed = report['phases'].get('indexed', {}).get('queries', {})
+    print(f"\n===== SQL 查询压测: {report['database']} (每条 {report['repeat']} 次) =====")
+    for table, size in report['tables'].items():
+        print(f"{table}: 约 {size['row_estimate']} 行, 数据 {size['data_mb']} MB, 索引 {size['index_mb']} MB")
+    if indexed:
+        phase = report['phases']['indexed']
+        print(f"建议索引: 创建用时 {phase['build_seconds']} 秒, sensor_readings 索引 {phase['tables'].get('sensor_readings', {}).get('index_mb')} MB")
+    print(f"{'查询':<30}{'行数':>8}{'p50ms':>12}{'p95ms':>12}" + (f"{'索引后p50':>12}{'加速':>8}" if indexed else '') + "  执行计划")
+    for name, stats in baseline.items():
+        line = f"{name:<30}{stats['rows']:>8}{str(stats['p50_ms']):>12}{str(stats['p95_ms']):>12}"
+        plan = stats['plan']
+        if indexed and name in indexed:
+            after = indexed[name]
+            speedup = f"{stats['p50_ms'] / after['p50_ms']:.1f}x" if stats['p50_ms'] and after['p50_ms'] else '-'
+            line += f"{str(after['p50_ms']):>12}{speedup:>8}"
+            plan = after['plan'] or plan
+        if stats['errors']:
+            line += f"  (失败/超时 {stats['errors']} 次)"
+        print(line + "  " + ', '.join(plan))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='合成数据生成和 SQL 查询压测')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='使用的库 (默认 iot_bench，不存在时创建)，其余连接参数取自配置')
+    parser.add_argument('--seed', type=int, default=42)
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed = commands.add_parser('seed', help='生成合成读数')
+    seed.add_argument('--devices', type=int, default=1000)
+    seed.add_argument('--rows', type=int, default=1000000, help='大约生成的读数条数 (1M ~ 100M)')
+    seed.add_argument('--days', type=float, default=30.0, help='数据的时间跨度 (天)，截止到当前时间')
+    seed.add_argument('--sites', type=int, default=10, help='设备分配到的站点数')
+    seed.add_argument('--workers', type=int, default=4, help='生成/写入进程数')
+    seed.add_argument('--method', choices=('load', 'insert'), default='load', help='同 bulk_import.py --method')
+    seed.add_argument('--truncate', action='store_true', help='先清空 sensor_readings / device_latest / device_groups')
+    seed.add_argument('--append', action='store_true', help='表中已有数据时继续追加')
+    run = commands.add_parser('run', help='对网关和 Web 端的查询计时')
+    run.add_argument('--repeat', type=int, default=5, help='每条查询计时的次数')
+    run.add_argument('--warmup', type=int, default=1, help='每条查询先执行的不计时次数')
+    run.add_argument('--timeout', type=float, default=120.0, help='单条查询的超时 (秒)，超时不再重复')
+    run.add_argument('--query', action='append', help='只测名称包含该字符串的查询，可以指定多次')
+    run.add_argument('--indexes', action='store_true', help='创建建议索引后再测一次')
+    run.add_argument('--keep-indexes', action='store_true', help='测完后保留建议索引')
+    run.add_argument('--output', help='把报告写入JSON文件')
+    args = parser.parse_args(argv)
+    iot_log.setup_logging()
+
+    import mysql.connector
+    tenant_config, _ = config.load_tenant()
+    mysql_config = dict(tenant_config['mysql'], database=args.database)
+    server_config = {key: value for key, value in mysql_config.items() if key != 'database'}
+    conn = mysql.connector.connect(**server_config)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+    finally:
+        conn.close()
+
+    if args.command == 'seed':
+        seed_database(args, mysql_config, dict(config.DEFAULTS['thresholds'], **tenant_config['thresholds']))
+        return
+    report = run_benchmark(args, mysql_config)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+每台设备的滑动窗口统计
+=====================================
+网关在处理每条读数时增量更新，"最近 5 / 60 分钟的平均温度"之类的查询不需要扫描 sensor_readings:
+- 每个窗口一个样本队列，样本进入时加到累计和、过期时减去，求和/计数/平均 O(1)
+- 最小值/最大值各用一个单调队列，每个样本最多进出一次 (均摊 O(1))
+- 数值按 codec.SCALES 量化为整数 (与数据库列精度相同) 后累加，长时间运行累计和也没有浮点误差
+
+gateway/stages.py 的 RollingStatsStage 把结果定期写入 Redis 键 "<频道名>:stats:<client_id>"，
+web_display.py 的 /api/devices/<client_id>/stats 读取该键。
+"""
+import threading
+import time
+from collections import deque
+
+from codec import SCALES, quantize
+
+FIELDS = tuple(field for field, _ in SCALES)
+(_, TEMPERATURE_SCALE), (_, HUMIDITY_SCALE), (_, LIGHT_SCALE) = SCALES
+DEFAULT_WINDOWS = (300, 3600)
+
+
+def window_name(seconds):
+    """300 -> '5m'，3600 -> '1h'，45 -> '45s'"""
+    if seconds % 3600 == 0:
+        return f'{seconds // 3600}h'
+    if seconds % 60 == 0:
+        return f'{seconds // 60}m'
+    return f'{seconds}s'
+
+
+class _Extremum:
+    """单调队列: 队首为窗口内的最小值或最大值 (入队在 RollingWindow.add 中完成)"""
+    __slots__ = ('items',)
+
+    def __init__(self):
+        self.items = deque()  # (序号, 值)
+
+    def expire(self, first_seq):
+        items = self.items
+        while items and items[0][0] < first_seq:
+            items.popleft()
+
+    def value(self):
+        return self.items[0][1] if self.items else None
+
+
+class RollingWindow:
+    """一台设备一个时间窗口内的样本: 各字段的累计和与最小/最大值单调队列"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()  # (时间戳, 序号, 各字段的量化值)
+        self.sums = [0] * len(FIELDS)
+        self.mins = [_Extremum() for _ in FIELDS]
+        self.maxs = [_Extremum() for _ in FIELDS]
+        self._seq = 0
+
+    def add(self, ts, values):
+        # 每条读数都会调用: 过期检查和单调队列入队直接在这里完成，减少方法调用
+        samples = self.samples
+        if samples and samples[0][0] <= ts - self.seconds:
+            self.expire(ts)
+        seq = self._seq
+        self._seq = seq + 1
+        samples.append((ts, seq, values))
+        sums = self.sums
+        for i, value in enumerate(values):
+            sums[i] += value
+            items = self.mins[i].items
+            while items and items[-1][1] >= value:
+                items.pop()
+            items.append((seq, value))
+            items = self.maxs[i].items
+            while items and items[-1][1] <= value:
+                items.pop()
+            items.append((seq, value))
+
+    def expire(self, now):
+        samples, cutoff, sums = self.samples, now - self.seconds, self.sums
+        if not samples or samples[0][0] > cutoff:
+            return
+        while samples and samples[0][0] <= cutoff:
+            values = samples.popleft()[2]
+            for i, value in enumerate(values):
+                sums[i] -= value
+        first_seq = samples[0][1] if samples else self._seq
+        for extremum in self.mins + self.maxs:
+            extremum.expire(first_seq)
+
+    def stats(self):
+        count = len(self.samples)
+        result = {'count': count}
+        for i, (field, scale) in enumerate(SCALES):
+            if count:
+                result[field] = {'mean': round(self.sums[i] / count / scale, 3), 'min': self.mins[i].value() / scale,
+                                 'max': self.maxs[i].value() / scale}
+            else:
+                result[field] = None
+        return result
+
+
+class RollingStats:
+    """所有设备的滑动窗口统计 (线程安全: 站点工作线程更新，发布线程读取)"""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, clock=time.time):
+        self.windows = tuple(sorted(int(w) for w in windows))
+        self.clock = clock
+        self._devices = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def update(self, client_id, temperature, humidity, light_intensity, ts=None):
+        ts = self.clock() if ts is None else ts
+        values = (quantize(temperature, TEMPERATURE_SCALE), quantize(humidity, HUMIDITY_SCALE), quantize(light_intensity, LIGHT_SCALE))
+        with self._lock:
+            windows = self._devices.get(client_id)
+            if windows is None:
+                windows = self._devices[client_id] = [RollingWindow(seconds) for seconds in self.windows]
+            for window in windows:
+                window.add(ts, values)
+            self._dirty.add(client_id)
+
+    def snapshot(self, client_id, now=None):
+        """{'updated': 时间戳, '5m': {'count': .., 'temperature': {'mean', 'min', 'max'}, ...}, ...}；未知设备返回 None"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            windows = self._devices.get(client_id)
+            if windows is None:
+                return None
+            result = {'updated': round(now, 3)}
+            for window in windows:
+                window.expire(now)
+                result[window_name(window.seconds)] = window.stats()
+            return result
+
+    def take_dirty(self):
+        """返回上次调用以来有新读数的设备"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def devices(self):
+        with self._lock:
+            return list(self._devices)
+
+    def __len__(self):
+        return len(self._devices)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+本地预写暂存 (MySQL 不可用时不丢数据)
+=====================================
+- Spool: 只追加、内存映射 (mmap) 的本地文件，数据库写入失败时把读数暂存到这里
+- SpoolReplayer: 后台线程，数据库恢复后按批 (多行 INSERT) 把暂存的读数回放进 MySQL
+- 数据库重连由 backends.CircuitBreaker 控制 (指数退避 + 抖动)，回放线程与消息处理共用同一个熔断器，
+  故障期间不会出现重连风暴
+
+文件格式:
+    文件头 24 字节: 魔数 b'IOTSPL01' | 读偏移 (uint64) | 写偏移 (uint64)
+    记录:           长度 (uint32) | JSON (utf-8)
+先写记录内容再更新文件头里的写偏移，进程崩溃时最多丢失最后一条未完成的记录。
+全部回放完成后读写偏移复位到文件头之后，文件空间被重复利用。
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+import iot_log
+import metrics
+from backends import StorageError
+
+log = iot_log.get_logger('spool')
+
+MAGIC = b'IOTSPL01'
+HEADER = struct.Struct('<8sQQ')
+LENGTH = struct.Struct('<I')
+DEFAULT_SIZE = 4 * 1024 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+class Spool:
+    def __init__(self, path, initial_size=DEFAULT_SIZE, sync_every=1):
+        """
+        path: 暂存文件路径，不存在时自动创建
+        sync_every: 每追加多少条记录调用一次 mmap.flush() 落盘 (1 表示每条都落盘)
+        """
+        self.path = path
+        self.sync_every = max(1, int(sync_every))
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        new_file = not os.path.exists(path) or os.path.getsize(path) < HEADER.size
+        self._file = open(path, 'w+b' if new_file else 'r+b')
+        if new_file:
+            self._file.truncate(max(initial_size, HEADER.size))
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        if new_file or self._map[:8] != MAGIC:
+            self.read_offset = self.write_offset = HEADER.size
+            self._write_header()
+        else:
+            _, self.read_offset, self.write_offset = HEADER.unpack_from(self._map, 0)
+        self.pending = self._count_records()
+        if self.pending:
+            log.warning("📦 暂存文件 %s 中有 %d 条未回放的读数", path, self.pending)
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, MAGIC, self.read_offset, self.write_offset)
+
+    def _count_records(self):
+        count, offset = 0, self.read_offset
+        while offset + LENGTH.size <= self.write_offset:
+            (length,) = LENGTH.unpack_from(self._map, offset)
+            offset += LENGTH.size + length
+            count += 1
+        return count
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < self.write_offset + needed:
+            size *= 2
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, record):
+        """追加一条记录 (dict)"""
+        data = json.dumps(record, default=_json_default, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            needed = LENGTH.size + len(data)
+            if self.write_offset + needed > len(self._map):
+                self._grow(needed)
+            offset = self.write_offset
+            LENGTH.pack_into(self._map, offset, len(data))
+            self._map[offset + LENGTH.size:offset + needed] = data
+            self.write_offset = offset + needed
+            self._write_header()
+            self.pending += 1
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self._map.flush()
+                self._unsynced = 0
+
+    def peek(self, max_records):
+        """读取最多 max_records 条记录 (不移除)，返回 (记录列表, 读完这些记录后的偏移)"""
+        records = []
+        with self._lock:
+            offset = self.read_offset
+            while len(records) < max_records and offset + LENGTH.size <= self.write_offset:
+                (length,) = LENGTH.unpack_from(self._map, offset)
+                start = offset + LENGTH.size
+                records.append(json.loads(self._map[start:start + length].decode('utf-8')))
+                offset = start + length
+        return records, offset
+
+    def commit(self, offset, count):
+        """确认 peek() 返回的记录已写入数据库"""
+        with self._lock:
+            self.read_offset = offset
+            self.pending -= count
+            if self.read_offset >= self.write_offset:
+                # 全部回放完毕，复位偏移，重复利用文件空间
+                self.read_offset = self.write_offset = HEADER.size
+                self.pending = 0
+            self._write_header()
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+class SpoolReplayer(threading.Thread):
+    """数据库可用时把暂存文件中的读数按批回放到存储后端"""
+
+    def __init__(self, spool, storage, batch_size=500, interval=1.0):
+        super().__init__(name='spool-replayer', daemon=True)
+        self.spool = spool
+        self.storage = storage
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def replay_once(self):
+        """回放一批，返回回放的条数；数据库不可用时返回 0"""
+        records, offset = self.spool.peek(self.batch_size)
+        if not records:
+            return 0
+        try:
+            self.storage.insert_many(records)
+        except StorageError as e:
+            log.debug("回放暂存数据失败: %s", e)
+            return 0
+        self.spool.commit(offset, len(records))
+        metrics.READINGS_REPLAYED.inc(len(records))
+        log.info("📦 已从暂存文件回放 %d 条读数，剩余 %d 条", len(records), self.spool.pending)
+        return len(records)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # 回放成功时立即处理下一批，否则等待一个周期 (熔断器决定何时真正重连)
+            if not self.spool.pending or not self.replay_once():
+                self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
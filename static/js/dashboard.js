@@ -0,0 +1,139 @@
+// IoT 实时数据监控面板: 图表初始数据来自 /api/chart_data，之后由 /ws (WebSocket) 或 /stream (SSE) 增量更新
+const chartInstances = {};
+// 图表点数和表格着色阈值由服务端写入 <body data-*>，与服务端渲染的初始表格一致 (阈值可在配置中修改)
+const PAGE = document.body.dataset;
+const CHART_POINTS = Number(PAGE.chartPoints) || 30;
+const THRESHOLDS = {fanOn: Number(PAGE.fanOnTemp), fanOff: Number(PAGE.fanOffTemp), lightOn: Number(PAGE.lightOnLux)};
+document.addEventListener('DOMContentLoaded', function() {
+    fetch('/api/chart_data').then(res => res.json()).then(initCharts).catch(error => console.error('Error:', error));
+    // 服务端启用了 /ws 时数据和控制走同一个 WebSocket，否则 (或连接失败时) 使用 SSE + POST
+    if (document.body.dataset.ws === '1') connectLive(); else startSSE();
+    const tableBody = document.getElementById('data-table-body');
+    tableBody.addEventListener('click', function(event) {
+        const button = event.target.closest('button'); if (!button) return;
+        const row = button.closest('tr'); if (!row) return;
+        const clientId = row.dataset.clientId;
+        if (button.classList.contains('fan-btn') || button.classList.contains('light-btn')) {
+            sendRequest('/control', { client_id: clientId, command: button.dataset.command });
+        } else if (button.classList.contains('auto-btn')) { sendRequest('/set_auto', { client_id: clientId }); }
+    });
+});
+// codec.DeltaDecoder 的浏览器端实现: 完整帧 [0, 序号, client_id, id, 时间戳, 温度, 湿度, 光照, 标志]，增量帧 [1, 序号, Δid, Δ时间戳, Δ温度, Δ湿度, Δ光照, 标志]
+function DeltaDecoder() { this.devices = []; this.lastId = 0; }
+DeltaDecoder.prototype.decode = function(frame) {
+    let state, id = null;
+    if (frame[0] === 0) {
+        state = [frame[2], frame[4], frame[5], frame[6], frame[7]]; this.devices[frame[1]] = state;
+        if (frame[3] !== null) id = this.lastId = frame[3];
+    } else {
+        state = this.devices[frame[1]];
+        for (let i = 1; i < 5; i++) state[i] += frame[i + 2];
+        if (frame[2] !== null) id = this.lastId = this.lastId + frame[2];
+    }
+    const flags = frame[frame.length - 1];
+    return {client_id: state[0], id: id, timestamp: state[1] * 1000, temperature: state[2] / 100, humidity: state[3] / 10, light_intensity: state[4] / 10,
+            fan_status: flags & 1 ? 1 : 0, light_status: flags & 2 ? 1 : 0, control_mode: flags & 4 ? 'manual' : 'auto'};
+};
+// 每个设备最近 CHART_POINTS 条实时数据；切换到历史时间范围时图表改用 /api/chart_data/range 的降采样数据，实时数据继续在这里累积
+const liveData = {};
+const CHART_RANGES = [['实时', 0], ['1小时', 3600], ['24小时', 86400], ['7天', 7 * 86400]];
+function liveOption(data) {
+    return {tooltip: { trigger: 'axis' },legend: { data: ['温度', '湿度', '光照强度'] },grid: { left: '3%', right: '4%', bottom: '3%', containLabel: true },xAxis: { type: 'category', boundaryGap: false, data: data.labels },yAxis: [ { type: 'value', name: '温度/湿度' }, { type: 'value', name: '光照', position: 'right' } ],series: [{ name: '温度', type: 'line', smooth: true, data: data.temperatures },{ name: '湿度', type: 'line', smooth: true, data: data.humidities },{ name: '光照强度', type: 'line', smooth: true, yAxisIndex: 1, data: data.lights }]};
+}
+function rangeOption(series) {
+    return {tooltip: { trigger: 'axis' },legend: { data: ['温度', '湿度', '光照强度'] },grid: { left: '3%', right: '4%', bottom: '3%', containLabel: true },xAxis: { type: 'time' },yAxis: [ { type: 'value', name: '温度/湿度' }, { type: 'value', name: '光照', position: 'right' } ],series: [{ name: '温度', type: 'line', showSymbol: false, data: series.temperature },{ name: '湿度', type: 'line', showSymbol: false, data: series.humidity },{ name: '光照强度', type: 'line', showSymbol: false, yAxisIndex: 1, data: series.light_intensity }]};
+}
+function showRange(deviceId, seconds) {
+    const chart = chartInstances[deviceId];
+    chart.rangeSeconds = seconds;
+    if (!seconds) { chart.setOption(liveOption(liveData[deviceId]), true); return; }
+    // 目标点数按图表宽度取，每个像素约一个点
+    const end = Date.now() / 1000, points = Math.max(100, Math.min(2000, chart.getWidth()));
+    fetch(`/api/chart_data/range?client_id=${encodeURIComponent(deviceId)}&start=${end - seconds}&end=${end}&points=${points}`)
+    .then(res => res.json()).then(data => { if (chart.rangeSeconds === seconds && data.series) chart.setOption(rangeOption(data.series), true); })
+    .catch(error => console.error('Error:', error));
+}
+function initCharts(chartData) {
+    const chartsArea = document.getElementById('charts-area');
+    for (const deviceId in chartData) {
+        const chartWrapper = document.createElement('div');
+        chartWrapper.innerHTML = `<h2>设备 ${deviceId} - 实时数据图表</h2><div class="btn-group btn-group-sm mb-2">${CHART_RANGES.map(([label, seconds], i) => `<button class="btn btn-outline-secondary${i ? '' : ' active'}" data-range="${seconds}">${label}</button>`).join('')}</div>`;
+        chartWrapper.querySelector('.btn-group').addEventListener('click', function(event) {
+            const button = event.target.closest('button'); if (!button) return;
+            for (const b of this.children) b.classList.toggle('active', b === button);
+            showRange(deviceId, Number(button.dataset.range));
+        });
+        const chartDom = document.createElement('div');
+        chartDom.id = `chart-${deviceId}`; chartDom.className = 'chart-container';
+        chartWrapper.appendChild(chartDom); chartsArea.appendChild(chartWrapper);
+        const myChart = echarts.init(chartDom);
+        liveData[deviceId] = chartData[deviceId];
+        myChart.setOption(liveOption(liveData[deviceId]));
+        chartInstances[deviceId] = myChart;
+    }
+}
+function updateChart(data) {
+    let chart = chartInstances[data.client_id];
+    if (!chart) { /* 如果是新设备，则动态创建图表 */ return; }
+    const live = liveData[data.client_id];
+    live.labels.push(new Date(data.timestamp).toLocaleTimeString()); live.temperatures.push(data.temperature); live.humidities.push(data.humidity); live.lights.push(data.light_intensity);
+    if (live.labels.length > CHART_POINTS) { live.labels.shift(); live.temperatures.shift(); live.humidities.shift(); live.lights.shift(); }
+    if (!chart.rangeSeconds) chart.setOption({xAxis: { data: live.labels },series: [{ data: live.temperatures }, { data: live.humidities }, { data: live.lights }]});
+}
+function updateTable(data) {
+    const tableBody = document.getElementById('data-table-body');
+    let rowToUpdate = tableBody.querySelector(`tr[data-client-id="${data.client_id}"]:not(.history-row)`);
+    if(rowToUpdate) {
+        rowToUpdate.classList.add('history-row');
+        rowToUpdate.querySelector('.fan-control-cell').innerHTML = `<span class="badge bg-secondary">${rowToUpdate.querySelector('.fan-control-cell .status-indicator')?.classList.contains('status-on') ? '开启' : '关闭'}</span>`;
+        rowToUpdate.querySelector('.light-control-cell').innerHTML = `<span class="badge bg-secondary">${rowToUpdate.querySelector('.light-control-cell .status-indicator')?.classList.contains('status-on') ? '开启' : '关闭'}</span>`;
+        rowToUpdate.querySelector('.mode-cell button')?.remove();
+    }
+    const newRow = document.createElement('tr');
+    newRow.dataset.clientId = data.client_id; newRow.dataset.recordId = data.id; newRow.classList.add('new-row');
+    const tempClass = parseFloat(data.temperature) >= THRESHOLDS.fanOn ? 'temperature-high' : (parseFloat(data.temperature) <= THRESHOLDS.fanOff ? 'temperature-low' : '');
+    const lightClass = parseFloat(data.light_intensity) < THRESHOLDS.lightOn ? 'light-low' : '';
+    const fanCtrl = `<div class="d-flex align-items-center"><span class="status-indicator me-2 ${data.fan_status ? 'status-on' : 'status-off'}"></span><button class="btn btn-sm btn-outline-primary fan-btn" data-command="${data.fan_status ? 'close_fan' : 'open_fan'}">${data.fan_status ? '关闭风扇' : '开启风扇'}</button></div>`;
+    const lightCtrl = `<div class="d-flex align-items-center"><span class="status-indicator me-2 ${data.light_status ? 'status-on' : 'status-off'}"></span><button class="btn btn-sm btn-outline-primary light-btn" data-command="${data.light_status ? 'close_light' : 'open_light'}">${data.light_status ? '关闭补光灯' : '开启补光灯'}</button></div>`;
+    let modeHtml = `<span class="badge rounded-pill ${data.control_mode === 'manual' ? 'mode-manual' : 'mode-auto'}">${data.control_mode === 'manual' ? '手动' : '自动'}</span>`;
+    if (data.control_mode === 'manual') modeHtml += ` <button class="btn btn-sm btn-outline-success ms-2 auto-btn">恢复自动</button>`;
+    newRow.innerHTML = `<td>${data.client_id}</td><td class="temp-cell ${tempClass}">${parseFloat(data.temperature).toFixed(2)}</td><td class="hum-cell">${parseFloat(data.humidity).toFixed(1)}</td><td class="light-cell ${lightClass}">${parseFloat(data.light_intensity).toFixed(1)}</td><td class="fan-control-cell">${fanCtrl}</td><td class="light-control-cell">${lightCtrl}</td><td class="mode-cell">${modeHtml}</td><td class="timestamp-cell">${new Date(data.timestamp).toLocaleString()}</td>`;
+    tableBody.prepend(newRow);
+    setTimeout(() => newRow.classList.remove('new-row'), 1000);
+}
+let liveSocket = null, nextReq = 1;
+function handleFrames(decoder, frames) { for (const frame of frames) { const item = decoder.decode(frame); updateTable(item); updateChart(item); } }
+function startSSE() {
+    // 增量编码的紧凑数组 (见 codec.py)，带宽约为完整JSON记录的十分之一
+    const eventSource = new EventSource("/stream?encoding=delta");
+    const decoder = new DeltaDecoder();
+    eventSource.addEventListener('delta', event => handleFrames(decoder, JSON.parse(event.data)));
+    eventSource.onmessage = function(event) {
+        const newData = JSON.parse(event.data);
+        if (newData.error) return;
+        console.log("新数据已接收:", newData);
+        // 批量控制接口一次推送一组记录
+        for (const item of (Array.isArray(newData) ? newData : [newData])) { updateTable(item); updateChart(item); }
+    };
+}
+function connectLive() {
+    // 每个连接的增量编码状态独立，重连后服务端从完整帧开始，解码器也重新创建
+    const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws`);
+    const decoder = new DeltaDecoder(); let opened = false;
+    ws.onopen = () => { opened = true; liveSocket = ws; };
+    ws.onmessage = function(event) {
+        const msg = JSON.parse(event.data);
+        if (msg.type === 'delta') handleFrames(decoder, msg.frames);
+        else if (msg.type === 'ack' && msg.status !== 'success') alert('操作失败: ' + msg.message);
+    };
+    // 曾经连上则断线重连；从未连上 (代理不支持 WebSocket 等) 则改用 SSE
+    ws.onclose = () => { liveSocket = null; if (opened) setTimeout(connectLive, 1000); else startSSE(); };
+}
+function sendRequest(endpoint, body) {
+    if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+        liveSocket.send(JSON.stringify(Object.assign({ type: endpoint === '/control' ? 'control' : 'set_auto', req: nextReq++ }, body))); return;
+    }
+    fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) })
+    .then(res => res.json()).then(data => { if(data.status !== 'success' && data.message) alert('操作失败: ' + data.message); })
+    .catch(error => console.error('Error:', error));
+}
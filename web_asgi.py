@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Web 面板的 ASGI 部署方式 (Starlette + aiomysql + redis.asyncio)
+=====================================
+与 web_display.py 提供相同的页面和接口 (/、/control、/set_auto、/stream，以及页面用到的 /api/chart_data、/static、/metrics)，
+区别在于全部请求运行在一个事件循环上:
+- 同步 gunicorn worker 每个 SSE 连接占住一个 worker (3 个 worker 最多 3 个观看者，之后所有请求排队)；
+  这里一个 SSE 连接只是一个协程和一个有界队列，观看者数量只受内存和文件句柄限制
+- 每个进程只有一个 Redis 订阅连接，收到的消息分发到各观看者的队列 (同步版本每个观看者一个订阅连接)；
+  观看者来不及接收时丢弃最旧的消息 (增量编码在发送时进行，丢弃原始消息不会破坏增量帧)
+- MySQL 使用 aiomysql 连接池，不再每个请求新建连接
+- 控制指令与 web_display.py 相同: MQTT 发布 (或经 Redis 由网关转发，见 command_bus.py) 后立即返回，状态写库由后台任务合并后一个事务完成
+
+依赖 (可选，只有使用 ASGI 部署时需要): pip install -r requirements-asgi.txt
+    uvicorn web_asgi:app --host 127.0.0.1 --port 5000 --workers 2
+两种部署方式的对比压测见 web_benchmark.py。
+"""
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from decimal import Decimal
+
+import aiomysql
+import redis.asyncio as aioredis
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+
+import codec
+import command_bus
+import config
+import iot_log
+import metrics
+from backends import READING_COLUMNS, INSERT_READINGS_SQL, UPSERT_DEVICE_LATEST_SQL, AUTO_INCREMENT_STEP_SQL, device_latest_values
+from build_assets import STATIC_DIR, VENDOR_ASSETS, precompressed
+
+iot_log.setup_logging()
+log = iot_log.get_logger('web_asgi')
+
+TENANT_CONFIG, _ = config.load_tenant()
+TENANT_NAME = os.environ.get('IOT_TENANT', config.DEFAULT_TENANT)
+MYSQL_CONFIG = TENANT_CONFIG['mysql']
+REDIS_CONFIG = TENANT_CONFIG['redis']
+REDIS_CHANNEL = REDIS_CONFIG['channel']
+THRESHOLDS = TENANT_CONFIG['thresholds']
+COMMAND_TOPIC_FORMAT = command_bus.COMMAND_TOPIC_FORMAT
+# 指令 -> (状态字段, 新值)，与 web_display.COMMAND_STATUS 相同
+COMMAND_STATUS = {'open_fan': ('fan_status', 1), 'close_fan': ('fan_status', 0), 'open_light': ('light_status', 1), 'close_light': ('light_status', 0)}
+CHART_POINTS = 30
+STATIC_MAX_AGE = 365 * 24 * 3600
+CONTROL_WRITE_DELAY = 0.02
+DB_POOL_SIZE = 10
+# 每个观看者最多缓存的未发送消息数，以及无消息时发送 SSE 注释保活的间隔 (秒)
+VIEWER_QUEUE_SIZE = 256
+KEEPALIVE_INTERVAL = 15.0
+
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+
+
+def _json_default(value):
+    if isinstance(value, datetime): return value.isoformat()
+    if isinstance(value, Decimal): return float(value)
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+_asset_versions = {}
+
+
+def asset_url(filename):
+    """同 web_display.asset_url: 带内容哈希的静态资源地址，第三方资源未下载时回退到CDN"""
+    version = _asset_versions.get(filename)
+    if version is None:
+        path = os.path.join(STATIC_DIR, filename)
+        if not os.path.isfile(path):
+            return VENDOR_ASSETS.get(filename, f'/static/{filename}')
+        with open(path, 'rb') as f:
+            version = _asset_versions[filename] = hashlib.md5(f.read()).hexdigest()[:10]
+    return f'/static/{filename}?v={version}'
+
+
+templates.env.globals['asset_url'] = asset_url
+
+
+class Broadcaster:
+    """进程内唯一的 Redis 订阅: 频道消息 -> 每个观看者一个有界 asyncio.Queue"""
+
+    def __init__(self, redis_client, channel):
+        self.redis = redis_client
+        self.channel = channel
+        self.viewers = set()
+        self.dropped = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def subscribe(self):
+        queue = asyncio.Queue(VIEWER_QUEUE_SIZE)
+        self.viewers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.viewers.discard(queue)
+
+    async def _run(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                log.info("✅ 已订阅Redis频道 '%s'", self.channel)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self._dispatch(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("❌ Redis订阅中断，1秒后重连: %s", e)
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, data):
+        for queue in self.viewers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(data)
+
+
+class AsyncControlWriter:
+    """web_display.ControlWriter 的协程版本: 合并 CONTROL_WRITE_DELAY 内各设备的状态变化，一个事务写入并发布到Redis"""
+
+    def __init__(self, pool, redis_client, delay=CONTROL_WRITE_DELAY):
+        self.pool = pool
+        self.id_step = None  # 多行 INSERT 中相邻两行的自增ID间隔 (backends.AUTO_INCREMENT_STEP_SQL)
+        self.redis = redis_client
+        self.delay = delay
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        metrics.QUEUE_DEPTH.labels('control_writer').set_function(lambda: len(self._pending))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._pending:
+            await self._write(self._pending)
+
+    def submit(self, client_id, changes):
+        self._pending.setdefault(client_id, {}).update(changes)
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            updates, self._pending = self._pending, {}
+            try:
+                await self._write(updates)
+            except Exception as e:
+                log.error("❌ 写入控制状态失败，1秒后重试: %s", e)
+                # 放回队列，期间的新操作优先
+                for client_id, changes in updates.items():
+                    self._pending[client_id] = dict(changes, **self._pending.get(client_id, {}))
+                self._wakeup.set()
+                await asyncio.sleep(1.0)
+
+    async def _write(self, updates):
+        """同 web_display.write_device_updates: 一次查询、一条多行 INSERT、一条多行 device_latest 更新"""
+        client_ids = list(updates)
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(f"SELECT *, NOW() AS now FROM device_latest WHERE client_id IN ({', '.join(['%s'] * len(client_ids))})", client_ids)
+                latest = {row['client_id']: row for row in await cursor.fetchall()}
+                records = []
+                for client_id in client_ids:
+                    if client_id not in latest: continue
+                    record = {c: latest[client_id][c] for c in READING_COLUMNS}
+                    record.update(updates[client_id], timestamp=latest[client_id]['now'])
+                    records.append(record)
+                if records:
+                    if self.id_step is None:
+                        await cursor.execute(AUTO_INCREMENT_STEP_SQL)
+                        self.id_step = int((await cursor.fetchone())['step'])
+                    # aiomysql 同样把 executemany 改写为一条多行 INSERT，lastrowid 为第一行的ID
+                    await cursor.executemany(INSERT_READINGS_SQL, [tuple(r[c] for c in READING_COLUMNS) for r in records])
+                    for i, record in enumerate(records): record['id'] = cursor.lastrowid + i * self.id_step
+                    await cursor.executemany(UPSERT_DEVICE_LATEST_SQL, [device_latest_values(r) for r in records])
+            await conn.commit()
+        missing = [c for c in client_ids if c not in latest]
+        if missing: log.warning("⚠️ 设备没有历史数据，未记录控制状态: %s", ', '.join(missing))
+        if records: await self.publish(records if len(records) > 1 else records[0])
+
+    async def publish(self, payload):
+        for record in payload if isinstance(payload, list) else [payload]: record['origin'] = 'web'
+        try:
+            with metrics.REDIS_PUBLISH_SECONDS.time():
+                await self.redis.publish(REDIS_CHANNEL, json.dumps(payload, default=_json_default))
+            metrics.REDIS_PUBLISHED.inc()
+        except Exception as e:
+            log.error("❌ Web App发布到Redis失败: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    state = app.state
+    # aiomysql 的库名参数是 db，不接受 mysql-connector 的 database
+    mysql_config = dict(MYSQL_CONFIG)
+    mysql_config['db'] = mysql_config.pop('database', None)
+    state.pool = await aiomysql.create_pool(minsize=1, maxsize=DB_POOL_SIZE, autocommit=False, **mysql_config)
+    state.redis = aioredis.Redis(host=REDIS_CONFIG['host'], port=REDIS_CONFIG['port'], decode_responses=True)
+    # 在 worker 进程的 lifespan 中创建: paho 的网络循环在自己的线程中，publish() 只是放入发送队列，不会阻塞事件循环
+    state.commands = None
+    if TENANT_CONFIG['web']['command_transport'] != 'redis':
+        mqtt_config = TENANT_CONFIG['mqtt']
+        state.commands = command_bus.MqttCommandPublisher(mqtt_config['broker_ip'], mqtt_config['port'], client_prefix='web_asgi', tenant=TENANT_NAME)
+        state.commands.client()
+    state.broadcaster = Broadcaster(state.redis, REDIS_CHANNEL)
+    state.broadcaster.start()
+    state.writer = AsyncControlWriter(state.pool, state.redis)
+    state.writer.start()
+    metrics.SSE_CLIENTS.set_function(lambda: len(state.broadcaster.viewers))
+    try:
+        yield
+    finally:
+        await state.writer.stop()
+        await state.broadcaster.stop()
+        if state.commands is not None: state.commands.close()
+        await state.redis.aclose()
+        state.pool.close()
+        await state.pool.wait_closed()
+
+
+async def fetch_all(request, sql, params=None):
+    async with request.app.state.pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+
+async def index(request):
+    """同 web_display.index: 每个设备最近 20 条读数的表格"""
+    latest_id_per_device = {row['client_id']: row['reading_id'] for row in await fetch_all(request, "SELECT client_id, reading_id FROM device_latest")}
+    readings = await fetch_all(request, "WITH LatestReadings AS (SELECT *, ROW_NUMBER() OVER(PARTITION BY client_id ORDER BY timestamp DESC) as rn FROM sensor_readings) SELECT * FROM LatestReadings WHERE rn <= 20 ORDER BY client_id, timestamp DESC")
+    for reading in readings:
+        reading['timestamp_str'] = reading['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+        reading['temperature'], reading['humidity'], reading['light_intensity'] = float(reading['temperature']), float(reading['humidity']), float(reading['light_intensity'])
+        reading['is_latest'] = (reading['id'] == latest_id_per_device.get(reading['client_id']))
+        reading['temp_class'] = 'temperature-high' if reading['temperature'] >= THRESHOLDS['fan_on_temp'] else ('temperature-low' if reading['temperature'] <= THRESHOLDS['fan_off_temp'] else '')
+        reading['light_class'] = 'light-low' if reading['light_intensity'] < THRESHOLDS['light_on_lux'] else ''
+    return templates.TemplateResponse(request, 'index.html', {'readings': readings, 'ws_enabled': False, 'thresholds': THRESHOLDS, 'chart_points': CHART_POINTS})
+
+
+async def chart_data(request):
+    """同 web_display.chart_data (不带 ETag 缓存)"""
+    rows = await fetch_all(request, "SELECT client_id, timestamp, temperature, humidity, light_intensity FROM (SELECT client_id, timestamp, temperature, humidity, light_intensity, ROW_NUMBER() OVER(PARTITION BY client_id ORDER BY timestamp DESC) AS rn FROM sensor_readings) t WHERE rn <= %s ORDER BY client_id, timestamp ASC", (CHART_POINTS,))
+    data = {}
+    for r in rows:
+        series = data.setdefault(r['client_id'], {'labels': [], 'temperatures': [], 'humidities': [], 'lights': []})
+        series['labels'].append(r['timestamp'].strftime('%H:%M:%S')); series['temperatures'].append(float(r['temperature']))
+        series['humidities'].append(float(r['humidity'])); series['lights'].append(float(r['light_intensity']))
+    return Response(json.dumps(data, separators=(',', ':'), ensure_ascii=False), media_type='application/json')
+
+
+async def static_file(request):
+    """同 web_display.static_file: 客户端支持时返回预压缩的 .br / .gz 文件"""
+    filename = request.path_params['filename']
+    path = os.path.realpath(os.path.join(STATIC_DIR, filename))
+    if not path.startswith(os.path.realpath(STATIC_DIR) + os.sep) or not os.path.isfile(path):
+        return PlainTextResponse('Not Found', status_code=404)
+    max_age = STATIC_MAX_AGE if request.query_params.get('v') else 0
+    media_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accept = request.headers.get('accept-encoding', '')
+    headers = {'Vary': 'Accept-Encoding',
+               'Cache-Control': f'public, max-age={max_age}, immutable' if max_age else 'no-cache'}
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accept and precompressed(path, suffix):
+            return FileResponse(path + suffix, media_type=media_type, headers=dict(headers, **{'Content-Encoding': encoding}))
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def publish_commands(state, messages):
+    """按 web.command_transport 下发一批指令: 直接发布到MQTT代理，或发布到 Redis 指令频道由网关转发"""
+    if state.commands is not None:
+        return state.commands.publish_many(messages)
+    try:
+        receivers = await state.redis.publish(command_bus.command_channel(REDIS_CHANNEL), json.dumps([list(m) for m in messages]))
+    except Exception as e:
+        log.error("❌ 指令发布到Redis失败: %s", e)
+        return False
+    return receivers > 0
+
+
+async def control_device(request):
+    data = await _json_body(request)
+    client_id, command = data.get('client_id'), data.get('command')
+    if not all([client_id, command]): return JSONResponse({'status': 'error', 'message': 'Missing parameters'}, 400)
+    if command not in COMMAND_STATUS: return JSONResponse({'status': 'error', 'message': 'Unknown command'}, 400)
+    if not await publish_commands(request.app.state, [(COMMAND_TOPIC_FORMAT.format(client_id=client_id), command_bus.command_payload(command))]):
+        return JSONResponse({'status': 'error', 'message': 'Command not delivered'}, 503)
+    metrics.COMMANDS_PUBLISHED.labels(command).inc()
+    field, value = COMMAND_STATUS[command]
+    request.app.state.writer.submit(client_id, {field: value, 'control_mode': 'manual'})
+    return JSONResponse({'status': 'success'})
+
+
+async def set_auto(request):
+    client_id = (await _json_body(request)).get('client_id')
+    if not client_id: return JSONResponse({'status': 'error', 'message': 'Missing client_id'}, 400)
+    request.app.state.writer.submit(client_id, {'control_mode': 'auto'})
+    return JSONResponse({'status': 'success'})
+
+
+def sse_event(data, encoder):
+    """一条频道消息 -> SSE 事件文本 (同 web_display.stream)，没有可发送的内容时返回 None"""
+    if encoder is None:
+        return f"data: {data}\n\n"
+    payload, frames = json.loads(data), []
+    for record in payload if isinstance(payload, list) else [payload]:
+        try: frames.append(encoder.encode(record))
+        except (KeyError, TypeError, ValueError): pass
+    return f"event: delta\ndata: {json.dumps(frames, separators=(',', ':'), ensure_ascii=False)}\n\n" if frames else None
+
+
+async def stream(request):
+    """SSE 实时推送，?encoding=delta 时发送增量帧；客户端断开时 Starlette 取消该生成器"""
+    encoder = codec.DeltaEncoder() if request.query_params.get('encoding') == 'delta' else None
+    broadcaster = request.app.state.broadcaster
+
+    async def event_stream():
+        queue = broadcaster.subscribe()
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                event = sse_event(data, encoder)
+                if event: yield event
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render_metrics(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/', index),
+    Route('/api/chart_data', chart_data),
+    Route('/static/{filename:path}', static_file),
+    Route('/control', control_device, methods=['POST']),
+    Route('/set_auto', set_auto, methods=['POST']),
+    Route('/stream', stream),
+    Route('/metrics', metrics_endpoint),
+])
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Web 面板压测: 同步 (gunicorn + web_display.py) 与 ASGI (uvicorn + web_asgi.py) 部署方式对比
+=====================================
+对每个 --url 依次执行:
+1. 观看者容量: 逐个打开 /stream?encoding=delta 长连接 (每批 --ramp 个)，统计在 --connect-timeout 内收到响应头的连接数
+2. 请求延迟: 在观看者保持连接的同时，以 --concurrency 个并发发送 --requests 个 POST /control 和 GET / 请求，
+   报告延迟百分位和失败数 (超时也计为失败)
+3. 推送: 测试期间各观看者收到的事件数 (/control 产生的状态记录会经 Redis 推送给所有观看者)
+
+只使用标准库 (asyncio 原始 HTTP/1.0 连接)，可以在任意机器上对两种部署方式运行；
+被测的 ASGI 服务需要先安装 requirements-asgi.txt。
+
+用法:
+    gunicorn --workers 3 --bind 127.0.0.1:5000 web_display:app
+    uvicorn web_asgi:app --host 127.0.0.1 --port 5001 --workers 3
+    python web_benchmark.py --url http://127.0.0.1:5000 --url http://127.0.0.1:5001 --viewers 500 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from benchmark import percentile
+
+
+class Viewer:
+    """一个 SSE 观看者: 保持连接并统计收到的事件数"""
+
+    def __init__(self):
+        self.connected = False
+        self.events = 0
+        self.writer = None
+        self.task = None
+
+    async def open(self, host, port, path, timeout):
+        try:
+            reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            self.writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+            status = await asyncio.wait_for(reader.readline(), timeout)
+            if b' 200 ' not in status:
+                return False
+            while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                pass
+        except (OSError, asyncio.TimeoutError):
+            return False
+        self.connected = True
+        self.task = asyncio.create_task(self._consume(reader))
+        return True
+
+    async def _consume(self, reader):
+        # HTTP/1.0 响应不使用分块编码，按行读取即可
+        try:
+            async for line in reader:
+                if line.startswith(b'data:'):
+                    self.events += 1
+        except (OSError, asyncio.CancelledError):
+            pass
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.writer:
+            self.writer.close()
+
+
+async def http_request(host, port, method, path, body, timeout):
+    """发送一个 HTTP/1.0 请求并读完响应，返回 (状态码, 耗时秒)；失败或超时返回 (None, 耗时)"""
+    start = time.perf_counter()
+    headers = f"{method} {path} HTTP/1.0\r\nHost: {host}\r\n"
+    data = b''
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers += f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(headers.encode() + b"\r\n" + data)
+        response = await asyncio.wait_for(reader.read(), timeout - (time.perf_counter() - start))
+        status = int(response.split(b' ', 2)[1])
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+        status = None
+    finally:
+        if writer:
+            writer.close()
+    return status, time.perf_counter() - start
+
+
+async def measure_requests(host, port, args):
+    """以 args.concurrency 个并发发送请求，返回各接口的延迟统计"""
+    jobs = []
+    for i in range(args.requests):
+        command = 'open_fan' if i % 2 == 0 else 'close_fan'
+        jobs.append(('POST /control', 'POST', '/control', {'client_id': args.client_id, 'command': command}))
+        jobs.append(('GET /', 'GET', '/', None))
+    results = {name: [] for name, *_ in jobs[:2]}
+    failures = {name: 0 for name in results}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run(name, method, path, body):
+        async with semaphore:
+            status, elapsed = await http_request(host, port, method, path, body, args.request_timeout)
+        if status is not None and status < 400:
+            results[name].append(elapsed)
+        else:
+            failures[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(*job) for job in jobs))
+    elapsed = time.perf_counter() - start
+    summary = {}
+    for name, values in results.items():
+        values.sort()
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        summary[name] = {'ok': len(values), 'failed': failures[name], 'per_sec': round(len(values) / elapsed, 1),
+                         'p50_ms': ms(percentile(values, 50)), 'p95_ms': ms(percentile(values, 95)), 'p99_ms': ms(percentile(values, 99))}
+    return summary
+
+
+async def run_target(url, args):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    viewers = []
+    start = time.perf_counter()
+    for i in range(0, args.viewers, args.ramp):
+        batch = [Viewer() for _ in range(min(args.ramp, args.viewers - i))]
+        await asyncio.gather(*(v.open(host, port, '/stream?encoding=delta', args.connect_timeout) for v in batch))
+        viewers.extend(batch)
+    connected = [v for v in viewers if v.connected]
+    ramp_seconds = time.perf_counter() - start
+    try:
+        requests = await measure_requests(host, port, args)
+        # 等待最后一批状态记录经控制写入器和 Redis 推送到观看者
+        await asyncio.sleep(args.settle)
+    finally:
+        events = [v.events for v in connected]
+        await asyncio.gather(*(v.close() for v in viewers))
+    return {
+        'url': url,
+        'viewers_requested': args.viewers,
+        'viewers_connected': len(connected),
+        'ramp_s': round(ramp_seconds, 2),
+        'requests': requests,
+        'events_per_viewer': {'min': min(events), 'max': max(events), 'avg': round(sum(events) / len(events), 1)} if events else None,
+    }
+
+
+def print_report(report):
+    print(f"\n===== Web 压测: {report['url']} =====")
+    print(f"观看者: {report['viewers_connected']}/{report['viewers_requested']} 个连接成功 (用时 {report['ramp_s']} s)")
+    for name, stats in report['requests'].items():
+        print(f"{name}: 成功 {stats['ok']} 失败 {stats['failed']}  {stats['per_sec']} req/s  "
+              f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms")
+    print(f"每个观看者收到的事件数: {report['events_per_viewer']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Web面板压测: 观看者容量和请求延迟')
+    parser.add_argument('--url', action='append', required=True, help='要压测的服务地址，可以指定多次进行对比')
+    parser.add_argument('--viewers', type=int, default=100, help='同时打开的 SSE 观看者数')
+    parser.add_argument('--ramp', type=int, default=50, help='每批同时打开的观看者数')
+    parser.add_argument('--connect-timeout', type=float, default=3.0, help='观看者等待响应头的时间 (秒)')
+    parser.add_argument('--requests', type=int, default=200, help='POST /control 和 GET / 各发送的请求数')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发请求数')
+    parser.add_argument('--request-timeout', type=float, default=10.0, help='单个请求的超时 (秒)')
+    parser.add_argument('--client-id', default='bench_web', help='/control 使用的设备ID (需要在 device_latest 中有记录才会产生推送)')
+    parser.add_argument('--settle', type=float, default=1.0, help='请求结束后等待推送到达的时间 (秒)')
+    parser.add_argument('--output', help='把报告写入JSON文件')
+    args = parser.parse_args(argv)
+
+    reports = []
+    for url in args.url:
+        report = asyncio.run(run_target(url, args))
+        print_report(report)
+        reports.append(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
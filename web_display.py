@@ -6,283 +6,563 @@ Web显示和控制服务 (最终稳定版 v2.2)
 - 可视化: 集成ECharts实时折线图
 - Bug修复: 修复所有已知问题
 """
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, url_for
 import mysql.connector
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-import paho.mqtt.client as mqtt
 import json
 from decimal import Decimal
 import time
+import threading
+import hashlib
+import mimetypes
 import redis
+import metrics
+import iot_log
+import config
+import codec
+import lttb
+import command_bus
+import archive_blocks
+from backends import (SENSOR_READINGS_DDL, DEVICE_LATEST_DDL, DEVICE_GROUPS_DDL, READING_BLOCKS_DDL, READING_COLUMNS, INSERT_READINGS_SQL,
+                      UPSERT_DEVICE_LATEST_SQL, ASSIGN_GROUP_SQL, auto_increment_step, device_latest_values, refresh_device_latest)
+from device_groups import DEFAULT_GREENHOUSE, valid_name, group_command_topic
+from build_assets import STATIC_DIR, VENDOR_ASSETS, precompressed
 
-app = Flask(__name__)
+try: # WebSocket 通道 (/ws) 为可选功能: pip install flask-sock (见 requirements-optional.txt)
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
-# --- 配置 ---
-MYSQL_CONFIG = { 'host': 'localhost', 'user': 'm2joy', 'password': 'Liu041121@', 'database': 'iot_data' }
-MQTT_BROKER_IP = 'localhost'
-MQTT_BROKER_PORT = 1883
-COMMAND_TOPIC_FORMAT = "stm32/command/{client_id}"
-REDIS_HOST = 'localhost'
-REDIS_PORT = 6379
-REDIS_CHANNEL = 'iot_data_stream'
+# 静态文件由下面的 static_file() 提供 (支持预压缩文件)，不使用 Flask 默认的 static 路由
+app = Flask(__name__, static_folder=None)
+sock = Sock(app) if Sock is not None else None
+
+# gunicorn 不会执行 __main__，所以在导入时初始化日志 (可重复调用)
+iot_log.setup_logging()
+log = iot_log.get_logger('web')
+
+# --- 配置 (config.py: 默认值 + iot_config.json + IOT__ 环境变量，IOT_TENANT 选择租户) ---
+TENANT_CONFIG, _ = config.load_tenant()
+TENANT_NAME = os.environ.get('IOT_TENANT', config.DEFAULT_TENANT)
+MYSQL_CONFIG = TENANT_CONFIG['mysql']
+COMMAND_TOPIC_FORMAT = command_bus.COMMAND_TOPIC_FORMAT
+REDIS_HOST = TENANT_CONFIG['redis']['host']
+REDIS_PORT = TENANT_CONFIG['redis']['port']
+REDIS_CHANNEL = TENANT_CONFIG['redis']['channel']
+THRESHOLDS = TENANT_CONFIG['thresholds']
+MAX_BATCH_DEVICES = 2000 # 批量控制接口单次最多处理的设备数
+STATIC_MAX_AGE = 365 * 24 * 3600 # 带版本号的静态资源缓存一年
+CHART_POINTS = 30
+CHART_MAX_POINTS = 5000 # 时间范围图表接口允许的最大目标点数
+CONTROL_WRITE_DELAY = 0.02 # 延迟写库: 合并这段时间内的控制操作，一个事务写入
 
 # --- 客户端和服务初始化 ---
-mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"web_control_{int(time.time())}")
-mqtt_client.connect(MQTT_BROKER_IP, MQTT_BROKER_PORT)
-mqtt_client.loop_start()
+# 各请求共用的Redis连接池，不再每次发布都新建连接 (redis-py 在 fork 后的子进程中会自动重建连接)
+redis_pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+# 指令发布器: 导入时不连接MQTT代理，每个 worker 第一次使用时 (或 gunicorn.conf.py 的 post_fork 钩子中) 才连接，见 command_bus.py
+command_publisher = command_bus.from_config(TENANT_CONFIG, redis.Redis(connection_pool=redis_pool), TENANT_NAME)
 
 def get_db_connection():
     try:
         return mysql.connector.connect(**MYSQL_CONFIG)
     except mysql.connector.Error as err:
-        print(f"Database connection error: {err}")
+        log.error("Database connection error: %s", err)
         return None
 
 def create_table_if_not_exists():
     """启动时检查并创建数据表"""
     conn = get_db_connection()
     if not conn:
-        print("❌ 无法连接到数据库，跳过表创建检查。")
+        log.error("❌ 无法连接到数据库，跳过表创建检查。")
         return
     try:
         with conn.cursor() as cursor:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sensor_readings (
-                    id INT AUTO_INCREMENT PRIMARY KEY, client_id VARCHAR(255) NOT NULL,
-                    temperature DECIMAL(5,2) NOT NULL, humidity DECIMAL(4,1) NOT NULL,
-                    light_intensity DECIMAL(7,1) NOT NULL, fan_status TINYINT(1) DEFAULT 0,
-                    light_status TINYINT(1) DEFAULT 0, control_mode VARCHAR(10) DEFAULT 'auto',
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            cursor.execute(SENSOR_READINGS_DDL)
+            cursor.execute(DEVICE_LATEST_DDL)
+            cursor.execute(DEVICE_GROUPS_DDL)
+            cursor.execute(READING_BLOCKS_DDL)
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM device_latest)")
+            if not cursor.fetchone()[0]: refresh_device_latest(cursor) # 首次建表时从历史数据回填
         conn.commit()
     finally:
         if conn.is_connected(): conn.close()
 
-def publish_to_redis(record_dict):
+def _json_default(value):
+    if isinstance(value, datetime): return value.isoformat()
+    if isinstance(value, Decimal): return float(value)
+    raise TypeError(f"无法序列化 {type(value)}")
+
+def publish_to_redis(payload):
+    """
+    发布一条记录 (dict)，或批量操作产生的一组记录 (list，页面端逐条处理)。
+    记录带 origin='web'，网关据此立即更新设备状态缓存 (见 gateway/stages.py CachedState)
+    """
+    for record in payload if isinstance(payload, list) else [payload]: record['origin'] = 'web'
     try:
-        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-        for key, value in record_dict.items():
-            if isinstance(value, datetime): record_dict[key] = value.isoformat()
-            elif isinstance(value, Decimal): record_dict[key] = float(value)
-        r.publish(REDIS_CHANNEL, json.dumps(record_dict))
-        r.close()
+        r = redis.Redis(connection_pool=redis_pool)
+        with metrics.REDIS_PUBLISH_SECONDS.time():
+            r.publish(REDIS_CHANNEL, json.dumps(payload, default=_json_default))
+        metrics.REDIS_PUBLISHED.inc()
     except Exception as e:
-        print(f"❌ Web App发布到Redis失败: {e}")
+        log.error("❌ Web App发布到Redis失败: %s", e)
 
-def set_device_manual_status(client_id, fan_status=None, light_status=None):
-    conn = get_db_connection()
-    if conn is None: return
-    try:
-        with conn.cursor(dictionary=True) as cursor:
-            cursor.execute("SELECT temperature, humidity, light_intensity, fan_status, light_status FROM sensor_readings WHERE client_id = %s ORDER BY timestamp DESC LIMIT 1", (client_id,))
-            latest_reading = cursor.fetchone() or {'temperature': 0, 'humidity': 0, 'light_intensity': 0, 'fan_status': 0, 'light_status': 0}
-            new_fan_status = fan_status if fan_status is not None else latest_reading['fan_status']
-            new_light_status = light_status if light_status is not None else latest_reading['light_status']
-            sql = "INSERT INTO sensor_readings (client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-            val = (client_id, latest_reading['temperature'], latest_reading['humidity'], latest_reading['light_intensity'], new_fan_status, new_light_status, 'manual')
-            cursor.execute(sql, val)
-            new_id = cursor.lastrowid
+_asset_versions = {}
+
+def asset_url(filename):
+    """模板中引用静态资源: 带内容哈希作为版本号 (可以长期缓存)；第三方资源未下载时回退到CDN"""
+    version = _asset_versions.get(filename)
+    if version is None:
+        path = os.path.join(STATIC_DIR, filename)
+        if not os.path.isfile(path):
+            if filename in VENDOR_ASSETS: return VENDOR_ASSETS[filename]
+            return url_for('static', filename=filename)
+        with open(path, 'rb') as f: version = _asset_versions[filename] = hashlib.md5(f.read()).hexdigest()[:10]
+    return url_for('static', filename=filename, v=version)
+
+app.jinja_env.globals['asset_url'] = asset_url
+
+@app.route('/static/<path:filename>', endpoint='static')
+def static_file(filename):
+    """静态资源: 客户端支持时直接返回 build_assets.py 生成的 .br / .gz 文件 (比源文件旧时返回源文件)"""
+    max_age = STATIC_MAX_AGE if request.args.get('v') else 0
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and precompressed(os.path.join(STATIC_DIR, filename), suffix):
+            response = send_from_directory(STATIC_DIR, filename + suffix, mimetype=mimetype, max_age=max_age)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(STATIC_DIR, filename, mimetype=mimetype, max_age=max_age)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if max_age: response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+    return response
+
+# 批量控制: 指令 -> (状态字段, 新值)
+COMMAND_STATUS = {'open_fan': ('fan_status', 1), 'close_fan': ('fan_status', 0), 'open_light': ('light_status', 1), 'close_light': ('light_status', 0)}
+
+def resolve_selector(cursor, selector):
+    """按选择器从 device_latest 选出设备，条件可组合: {"all": true} / {"prefix": "gh_"} / {"control_mode": "manual"} /
+    {"site": "north"} / {"site": "north", "greenhouse": "g1"} (分组见 device_groups 表)"""
+    where, params = [], []
+    if selector.get('prefix'):
+        where.append("l.client_id LIKE %s"); params.append(selector['prefix'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if selector.get('control_mode'):
+        where.append("l.control_mode = %s"); params.append(selector['control_mode'])
+    if selector.get('site'):
+        where.append("g.site = %s"); params.append(selector['site'])
+    if selector.get('greenhouse'):
+        if not selector.get('site'): raise ValueError('greenhouse requires site')
+        where.append("g.greenhouse = %s"); params.append(selector['greenhouse'])
+    if not where and not selector.get('all'): raise ValueError('Empty selector')
+    join = " JOIN device_groups g ON g.client_id = l.client_id" if selector.get('site') else ""
+    cursor.execute("SELECT l.client_id FROM device_latest l" + join + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY l.client_id", params)
+    return [row['client_id'] for row in cursor]
+
+def group_topic_for(selector):
+    """选择器恰好是一个站点或温室时返回对应的分组指令主题，否则返回 None (逐台下发)"""
+    if not isinstance(selector, dict) or not selector.get('site') or set(selector) - {'site', 'greenhouse'}: return None
+    return group_command_topic(selector['site'], selector.get('greenhouse'))
+
+_id_step = None  # 多行 INSERT 中相邻两行的自增ID间隔，第一次写入时读取
+
+def write_device_updates(cursor, updates):
+    """updates: {client_id: {'control_mode': .., 'fan_status': .., ...}}，以每个设备的最新读数为基础写入新状态:
+    一次查询、一条多行 INSERT、一条多行 device_latest 更新 (不提交)。返回 (新记录列表, 没有历史数据而跳过的设备)"""
+    client_ids = list(updates)
+    cursor.execute(f"SELECT *, NOW() AS now FROM device_latest WHERE client_id IN ({', '.join(['%s'] * len(client_ids))})", client_ids)
+    latest = {row['client_id']: row for row in cursor}
+    records = []
+    for client_id in client_ids:
+        if client_id not in latest: continue
+        record = {c: latest[client_id][c] for c in READING_COLUMNS}
+        record.update(updates[client_id], timestamp=latest[client_id]['now'])
+        records.append(record)
+    if records:
+        global _id_step
+        if _id_step is None: _id_step = auto_increment_step(cursor)
+        # mysql-connector 把 executemany 改写为一条多行 INSERT，lastrowid 为第一行的ID
+        cursor.executemany(INSERT_READINGS_SQL, [tuple(r[c] for c in READING_COLUMNS) for r in records])
+        for i, record in enumerate(records): record['id'] = cursor.lastrowid + i * _id_step
+        cursor.executemany(UPSERT_DEVICE_LATEST_SQL, [device_latest_values(r) for r in records])
+    return records, [c for c in client_ids if c not in latest]
+
+class ControlWriter:
+    """单台设备控制 (/control、/set_auto、WebSocket) 的延迟写库: 请求线程下发MQTT指令后只把状态变化放入队列就返回，
+    后台线程把 CONTROL_WRITE_DELAY 内的操作按设备合并 (后到的覆盖先到的字段)，一个事务写入并发布一次Redis通知"""
+    def __init__(self, delay=CONTROL_WRITE_DELAY):
+        self.delay, self._pending, self._cond, self._thread = delay, {}, threading.Condition(), None
+        metrics.QUEUE_DEPTH.labels('control_writer').set_function(lambda: len(self._pending))
+    def submit(self, client_id, changes):
+        with self._cond:
+            # gunicorn 预加载时不能在 fork 之前启动线程，第一次使用时启动
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='control-writer', daemon=True); self._thread.start()
+            self._pending.setdefault(client_id, {}).update(changes); self._cond.notify()
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending: self._cond.wait()
+            time.sleep(self.delay)
+            with self._cond: updates, self._pending = self._pending, {}
+            try: self._write(updates)
+            except Exception as e:
+                log.error("❌ 写入控制状态失败，1秒后重试: %s", e)
+                with self._cond: # 放回队列，期间的新操作优先
+                    for client_id, changes in updates.items(): self._pending[client_id] = dict(changes, **self._pending.get(client_id, {}))
+                time.sleep(1.0)
+    def _write(self, updates):
+        conn = get_db_connection()
+        if conn is None: raise ConnectionError('Database connection failed')
+        try:
+            with conn.cursor(dictionary=True) as cursor: records, missing = write_device_updates(cursor, updates)
             conn.commit()
-            cursor.execute("SELECT * FROM sensor_readings WHERE id = %s", (new_id,))
-            new_record = cursor.fetchone()
-            if new_record: publish_to_redis(new_record)
-    finally:
-        if conn.is_connected(): conn.close()
+        finally:
+            if conn.is_connected(): conn.close()
+        if missing: log.warning("⚠️ 设备没有历史数据，未记录控制状态: %s", ', '.join(missing))
+        if records: publish_to_redis(records if len(records) > 1 else records[0])
+
+control_writer = ControlWriter()
+
+def send_device_command(client_id, command):
+    """下发单台设备的控制指令并登记状态变化 (延迟写库)，返回错误信息或 None"""
+    if command not in COMMAND_STATUS: return 'Unknown command'
+    if not command_publisher.publish_many([(COMMAND_TOPIC_FORMAT.format(client_id=client_id), command_bus.command_payload(command))]): return 'Command not delivered'
+    metrics.COMMANDS_PUBLISHED.labels(command).inc()
+    field, value = COMMAND_STATUS[command]
+    control_writer.submit(client_id, {field: value, 'control_mode': 'manual'})
+    return None
 
-def set_device_auto_mode(client_id):
+def apply_batch(client_ids, selector, control_mode, changes=None):
+    """在一个事务中为一批设备写入新状态: 一次查询最新状态、一条多行 INSERT、一条多行 device_latest 更新。
+    client_ids 为空时按 selector 选择设备。返回 (目标设备列表, 新记录列表, 没有历史数据而跳过的设备)"""
     conn = get_db_connection()
-    if conn is None: return
+    if conn is None: raise ConnectionError('Database connection failed')
     try:
         with conn.cursor(dictionary=True) as cursor:
-            cursor.execute("SELECT * FROM sensor_readings WHERE client_id = %s ORDER BY timestamp DESC LIMIT 1", (client_id,))
-            latest_reading = cursor.fetchone()
-            if not latest_reading: return
-            sql = "INSERT INTO sensor_readings (client_id, temperature, humidity, light_intensity, fan_status, light_status, control_mode) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-            val = (client_id, latest_reading['temperature'], latest_reading['humidity'], latest_reading['light_intensity'], latest_reading['fan_status'], latest_reading['light_status'], 'auto')
-            cursor.execute(sql, val)
-            new_id = cursor.lastrowid
+            targets = list(dict.fromkeys(client_ids)) if client_ids else resolve_selector(cursor, selector)
+            if len(targets) > MAX_BATCH_DEVICES: raise ValueError(f'Too many devices (max {MAX_BATCH_DEVICES})')
+            if not targets: return [], [], []
+            records, missing = write_device_updates(cursor, {c: dict(changes or {}, control_mode=control_mode) for c in targets})
             conn.commit()
-            cursor.execute("SELECT * FROM sensor_readings WHERE id = %s", (new_id,))
-            new_record = cursor.fetchone()
-            if new_record: publish_to_redis(new_record)
+            return targets, records, missing
     finally:
         if conn.is_connected(): conn.close()
 
+def _batch_request(control_mode, changes=None, command=None):
+    """/control/batch 和 /set_auto/batch 的公共部分: 参数校验、批量写库、下发MQTT指令、一次聚合的Redis通知"""
+    data = request.get_json(silent=True) or {}
+    client_ids, selector = data.get('client_ids'), data.get('selector')
+    if client_ids is not None and not (isinstance(client_ids, list) and client_ids and all(isinstance(c, str) and c for c in client_ids)):
+        return jsonify({'status': 'error', 'message': 'client_ids must be a non-empty list of strings'}), 400
+    if client_ids is None and not isinstance(selector, dict):
+        return jsonify({'status': 'error', 'message': 'Missing client_ids or selector'}), 400
+    try:
+        targets, records, missing = apply_batch(client_ids, selector, control_mode, changes)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except (ConnectionError, mysql.connector.Error) as e:
+        log.error("❌ 批量操作失败: %s", e)
+        return jsonify({'status': 'error', 'message': 'Database error'}), 500
+    group_topic = None if client_ids else group_topic_for(selector)
+    if command and group_topic and targets:
+        # 站点/温室内的设备都订阅了分组指令主题，一条消息即可
+        if command_publisher.publish_many([(group_topic, command_bus.command_payload(command))]): metrics.COMMANDS_PUBLISHED.labels(command).inc()
+    elif command:
+        # 一批指令一次提交: paho 只是放入发送队列由网络线程连续发出，Redis 转发方式只发布一条消息
+        payload = command_bus.command_payload(command)
+        if command_publisher.publish_many([(COMMAND_TOPIC_FORMAT.format(client_id=client_id), payload) for client_id in targets]):
+            metrics.COMMANDS_PUBLISHED.labels(command).inc(len(targets))
+    if records: publish_to_redis(records)
+    log.info("📦 批量操作: 模式=%s, 指令=%s, 目标设备%d台, 更新%d台", control_mode, command, len(targets), len(records))
+    return jsonify({'status': 'success', 'devices': len(targets), 'updated': len(records), 'missing': missing})
+
 @app.route('/')
 def index():
+    """只渲染表格，图表数据由页面加载后请求 /api/chart_data"""
     conn = get_db_connection()
     if conn is None: return "Database connection failed", 500
-    all_readings, chart_data = [], {}
+    all_readings = []
     try:
         with conn.cursor(dictionary=True) as cursor:
-            cursor.execute("SELECT DISTINCT client_id FROM sensor_readings ORDER BY client_id")
-            devices = [row['client_id'] for row in cursor]
-            for device_id in devices:
-                query = ("(SELECT timestamp, temperature, humidity, light_intensity FROM sensor_readings WHERE client_id = %s ORDER BY timestamp DESC LIMIT 30) ORDER BY timestamp ASC;")
-                cursor.execute(query, (device_id,))
-                records = cursor.fetchall()
-                chart_data[device_id] = {'labels': [r['timestamp'].strftime('%H:%M:%S') for r in records],'temperatures': [float(r['temperature']) for r in records],'humidities': [float(r['humidity']) for r in records],'lights': [float(r['light_intensity']) for r in records]}
+            cursor.execute("SELECT client_id, reading_id FROM device_latest")
+            latest_id_per_device = {row['client_id']: row['reading_id'] for row in cursor}
             
             cursor.execute("WITH LatestReadings AS (SELECT *, ROW_NUMBER() OVER(PARTITION BY client_id ORDER BY timestamp DESC) as rn FROM sensor_readings) SELECT * FROM LatestReadings WHERE rn <= 20 ORDER BY client_id, timestamp DESC;")
             all_readings = cursor.fetchall()
             
-            cursor.execute("SELECT client_id, MAX(id) as max_id FROM sensor_readings GROUP BY client_id")
-            latest_id_per_device = {row['client_id']: row['max_id'] for row in cursor}
-            
             for reading in all_readings:
                 reading['timestamp_str'] = reading['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
                 reading['temperature'], reading['humidity'], reading['light_intensity'] = float(reading['temperature']), float(reading['humidity']), float(reading['light_intensity'])
                 reading['is_latest'] = (reading['id'] == latest_id_per_device.get(reading['client_id']))
-                reading['temp_class'] = 'temperature-high' if reading['temperature'] >= 30.0 else ('temperature-low' if reading['temperature'] <= 25.0 else '')
-                reading['light_class'] = 'light-low' if reading['light_intensity'] < 50.0 else ''
-        return render_template('index.html', readings=all_readings, chart_data=json.dumps(chart_data))
+                reading['temp_class'] = 'temperature-high' if reading['temperature'] >= THRESHOLDS['fan_on_temp'] else ('temperature-low' if reading['temperature'] <= THRESHOLDS['fan_off_temp'] else '')
+                reading['light_class'] = 'light-low' if reading['light_intensity'] < THRESHOLDS['light_on_lux'] else ''
+        return render_template('index.html', readings=all_readings, ws_enabled=sock is not None, thresholds=THRESHOLDS, chart_points=CHART_POINTS)
+    finally:
+        if conn.is_connected(): conn.close()
+
+# JSON 接口的进程内缓存 (每个 worker 一份): 名称 -> (etag, 已序列化的响应体)
+_json_cache = {}
+_json_cache_lock = threading.Lock()
+
+def cached_json_response(name, build):
+    """ETag 由设备数和 device_latest.reading_id 之和生成，任何设备有新记录都会改变。
+    轮询方带 If-None-Match 且数据未变化时只需一次聚合查询并返回 304；ETag 未变时复用缓存的响应体，
+    否则调用 build(cursor) 生成响应体"""
+    conn = get_db_connection()
+    if conn is None: return jsonify({'status': 'error', 'message': 'Database connection failed'}), 500
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT COUNT(*) AS n, COALESCE(SUM(reading_id), 0) AS s FROM device_latest")
+            row = cursor.fetchone()
+            etag = f"{row['n']}-{row['s']}"
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                with _json_cache_lock:
+                    cached = _json_cache.get(name)
+                body = cached[1] if cached and cached[0] == etag else None
+                if body is None:
+                    body = build(cursor)
+                    with _json_cache_lock: _json_cache[name] = (etag, body)
+                response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache' # 允许缓存，但每次都要用 ETag 重新验证
+            return response
+    finally:
+        if conn.is_connected(): conn.close()
+
+@app.route('/api/devices/latest')
+def devices_latest():
+    """所有设备的最新读数 (device_latest 表)"""
+    def build(cursor):
+        cursor.execute("SELECT * FROM device_latest ORDER BY client_id")
+        return json.dumps({'devices': cursor.fetchall()}, default=_json_default)
+    return cached_json_response('devices_latest', build)
+
+@app.route('/api/chart_data')
+def chart_data():
+    """首页图表的初始数据: 每个设备最近 CHART_POINTS 条读数，一次查询、紧凑JSON"""
+    def build(cursor):
+        cursor.execute("SELECT client_id, timestamp, temperature, humidity, light_intensity FROM (SELECT client_id, timestamp, temperature, humidity, light_intensity, ROW_NUMBER() OVER(PARTITION BY client_id ORDER BY timestamp DESC) AS rn FROM sensor_readings) t WHERE rn <= %s ORDER BY client_id, timestamp ASC", (CHART_POINTS,))
+        data = {}
+        for r in cursor:
+            series = data.setdefault(r['client_id'], {'labels': [], 'temperatures': [], 'humidities': [], 'lights': []})
+            series['labels'].append(r['timestamp'].strftime('%H:%M:%S')); series['temperatures'].append(float(r['temperature']))
+            series['humidities'].append(float(r['humidity'])); series['lights'].append(float(r['light_intensity']))
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    return cached_json_response('chart_data', build)
+
+@app.route('/api/devices/<client_id>/stats')
+def device_stats(client_id):
+    """设备的滑动窗口统计 (最近 5 / 60 分钟的平均/最小/最大值)，由网关的 stats 阶段写入 Redis，不查询数据库"""
+    try: data = redis.Redis(connection_pool=redis_pool).get(f"{REDIS_CHANNEL}:stats:{client_id}")
+    except redis.RedisError as e:
+        log.error("❌ 读取滑动窗口统计失败: %s", e)
+        return jsonify({'status': 'error', 'message': 'Redis unavailable'}), 503
+    if data is None: return jsonify({'status': 'error', 'message': 'No recent readings'}), 404
+    return Response(data, mimetype='application/json')
+
+@app.route('/api/devices/presence')
+def devices_presence():
+    """设备在线状态 (网关的 presence 阶段写入 Redis 哈希)，?status=online|offline 过滤，离线时间最早的在前"""
+    status = request.args.get('status')
+    if status not in (None, 'online', 'offline'): return jsonify({'status': 'error', 'message': 'status must be online or offline'}), 400
+    try: saved = redis.Redis(connection_pool=redis_pool).hgetall(f"{REDIS_CHANNEL}:presence")
+    except redis.RedisError as e:
+        log.error("❌ 读取设备在线状态失败: %s", e)
+        return jsonify({'status': 'error', 'message': 'Redis unavailable'}), 503
+    devices = [json.loads(value) for value in saved.values()]
+    online = sum(1 for d in devices if d.get('online'))
+    if status: devices = [d for d in devices if bool(d.get('online')) == (status == 'online')]
+    devices.sort(key=lambda d: (d.get('online', False), d.get('since', 0)))
+    return jsonify({'online': online, 'offline': len(saved) - online, 'devices': devices})
+
+def parse_time(value, default):
+    """查询参数中的时间: ISO 格式或 Unix 时间戳 (秒)，为空时返回 default。
+    数据库中的时间戳是服务器本地时间，带时区的 ISO 时间换算为本地时间"""
+    if not value: return default
+    try: return datetime.fromtimestamp(float(value))
+    except ValueError: value = datetime.fromisoformat(value)
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo is not None else value
+
+def rollup(records, bucket, origin):
+    """与 chart_range 中数据库分桶查询相同的按时间分桶平均 (用于已归档的读数，从 origin 起每 bucket 秒一桶)"""
+    buckets = {}
+    for r in records:
+        buckets.setdefault(int((r['ts'] - origin).total_seconds() // bucket), []).append(r)
+    return [dict({c: sum(r[c] for r in group) / len(group) for c in ('temperature', 'humidity', 'light_intensity')},
+                 ts=origin + sum((r['ts'] - origin for r in group), timedelta()) / len(group))
+            for _, group in sorted(buckets.items())]
+
+@app.route('/api/chart_data/range')
+def chart_range():
+    """单个设备任意时间范围的图表数据: ?client_id=..&start=..&end=..&points=1000 (默认最近24小时)。
+    原始读数不超过 points * ROLLUP_FACTOR 条时取原始读数，否则先在数据库中按时间分桶取平均，
+    再用 LTTB 降到 points 个点。已归档的读数 (archive_blocks.py) 从 reading_blocks 解码后按同样的分桶合并。
+    返回 ECharts 时间轴格式 {"series": {"temperature": [[毫秒时间戳, 值], ...], ...}}"""
+    client_id = request.args.get('client_id')
+    try:
+        end = parse_time(request.args.get('end'), datetime.now())
+        start = parse_time(request.args.get('start'), end - timedelta(days=1))
+        points = int(request.args.get('points', 1000))
+    except (ValueError, OverflowError, OSError): return jsonify({'status': 'error', 'message': 'Invalid start, end or points'}), 400
+    if not client_id: return jsonify({'status': 'error', 'message': 'Missing client_id'}), 400
+    if start >= end or not 3 <= points <= CHART_MAX_POINTS: return jsonify({'status': 'error', 'message': f'Need start < end and 3 <= points <= {CHART_MAX_POINTS}'}), 400
+    conn = get_db_connection()
+    if conn is None: return jsonify({'status': 'error', 'message': 'Database connection failed'}), 500
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            where, params = "client_id = %s AND timestamp >= %s AND timestamp < %s", (client_id, start, end)
+            # 时间统一按本进程时区转换 (与 parse_time 一致)，不用 UNIX_TIMESTAMP() (取决于数据库会话时区)
+            archived = [{'ts': r['timestamp'], 'temperature': r['temperature'], 'humidity': r['humidity'], 'light_intensity': r['light_intensity']}
+                        for r in archive_blocks.read_archived(cursor, client_id, start, end)]
+            cursor.execute(f"SELECT COUNT(*) AS n FROM sensor_readings WHERE {where}", params)
+            total = cursor.fetchone()['n'] + len(archived)
+            if total > points * lttb.ROLLUP_FACTOR:
+                bucket = max(1, int((end - start).total_seconds() // (points * lttb.ROLLUP_FACTOR)))
+                cursor.execute(f"SELECT FLOOR(TIMESTAMPDIFF(SECOND, %s, timestamp) / %s) AS b, AVG(TIMESTAMPDIFF(SECOND, %s, timestamp)) AS seconds, AVG(temperature) AS temperature, AVG(humidity) AS humidity, AVG(light_intensity) AS light_intensity FROM sensor_readings WHERE {where} GROUP BY b ORDER BY b", (start, bucket, start) + params)
+                rows = [dict(r, ts=start + timedelta(seconds=float(r.pop('seconds')))) for r in cursor.fetchall()]
+                archived = rollup(archived, bucket, start)
+                source = 'rollup'
+            else:
+                cursor.execute(f"SELECT timestamp AS ts, temperature, humidity, light_intensity FROM sensor_readings WHERE {where} ORDER BY timestamp, id", params)
+                rows = cursor.fetchall()
+                source = 'raw'
     finally:
         if conn.is_connected(): conn.close()
+    if archived: rows = sorted(archived + rows, key=lambda r: r['ts'])
+    series = lttb.downsample_series([r['ts'].timestamp() for r in rows], {c: [r[c] for r in rows] for c in ('temperature', 'humidity', 'light_intensity')}, points)
+    body = {'client_id': client_id, 'start': start.isoformat(), 'end': end.isoformat(), 'readings': total, 'source': source, 'series': series}
+    return Response(json.dumps(body, separators=(',', ':'), ensure_ascii=False), mimetype='application/json')
 
 @app.route('/control', methods=['POST'])
 def control_device():
     data = request.get_json(); client_id, command = data.get('client_id'), data.get('command')
     if not all([client_id, command]): return jsonify({'status': 'error', 'message': 'Missing parameters'}), 400
-    command_topic = COMMAND_TOPIC_FORMAT.format(client_id=client_id); command_payload = json.dumps({"command": command, "timestamp": time.time()})
-    mqtt_client.publish(command_topic, command_payload, qos=1)
-    if command == 'open_fan': set_device_manual_status(client_id, fan_status=1)
-    elif command == 'close_fan': set_device_manual_status(client_id, fan_status=0)
-    elif command == 'open_light': set_device_manual_status(client_id, light_status=1)
-    elif command == 'close_light': set_device_manual_status(client_id, light_status=0)
+    error = send_device_command(client_id, command)
+    if error: return jsonify({'status': 'error', 'message': error}), 400 if error == 'Unknown command' else 503
     return jsonify({'status': 'success'})
 
 @app.route('/set_auto', methods=['POST'])
 def set_auto():
     data = request.get_json(); client_id = data.get('client_id')
     if not client_id: return jsonify({'status': 'error', 'message': 'Missing client_id'}), 400
-    set_device_auto_mode(client_id); return jsonify({'status': 'success'})
+    control_writer.submit(client_id, {'control_mode': 'auto'}); return jsonify({'status': 'success'})
+
+@app.route('/control/batch', methods=['POST'])
+def control_batch():
+    """{"command": "open_fan", "client_ids": [...]} 或 {"command": "open_fan", "selector": {...}}"""
+    command = (request.get_json(silent=True) or {}).get('command')
+    if command not in COMMAND_STATUS: return jsonify({'status': 'error', 'message': 'Unknown command'}), 400
+    field, value = COMMAND_STATUS[command]
+    return _batch_request('manual', {field: value}, command)
+
+@app.route('/set_auto/batch', methods=['POST'])
+def set_auto_batch():
+    """{"client_ids": [...]} 或 {"selector": {"control_mode": "manual"}}"""
+    return _batch_request('auto')
+
+@app.route('/api/groups')
+def list_groups():
+    """各站点/温室及其设备数"""
+    conn = get_db_connection()
+    if conn is None: return jsonify({'status': 'error', 'message': 'Database connection failed'}), 500
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT site, greenhouse, COUNT(*) AS devices FROM device_groups GROUP BY site, greenhouse ORDER BY site, greenhouse")
+            return jsonify({'groups': cursor.fetchall()})
+    finally:
+        if conn.is_connected(): conn.close()
+
+@app.route('/api/groups/assign', methods=['POST'])
+def assign_group():
+    """{"client_ids": [...], "site": "north", "greenhouse": "g1"}: 把设备分配到站点/温室"""
+    data = request.get_json(silent=True) or {}
+    client_ids, site, greenhouse = data.get('client_ids'), data.get('site'), data.get('greenhouse', DEFAULT_GREENHOUSE)
+    if not (isinstance(client_ids, list) and client_ids and all(isinstance(c, str) and c for c in client_ids)):
+        return jsonify({'status': 'error', 'message': 'client_ids must be a non-empty list of strings'}), 400
+    if not valid_name(site) or not valid_name(greenhouse):
+        return jsonify({'status': 'error', 'message': 'Invalid site or greenhouse'}), 400
+    conn = get_db_connection()
+    if conn is None: return jsonify({'status': 'error', 'message': 'Database connection failed'}), 500
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(ASSIGN_GROUP_SQL, [(c, site, greenhouse) for c in dict.fromkeys(client_ids)])
+        conn.commit()
+        return jsonify({'status': 'success', 'devices': len(set(client_ids))})
+    finally:
+        if conn.is_connected(): conn.close()
+
+def delta_frames(encoder, data):
+    """Redis 频道上的一条消息 (一条记录或一组记录) -> 增量帧列表，跳过不是读数记录的消息 (如错误消息)"""
+    payload = json.loads(data); frames = []
+    for record in payload if isinstance(payload, list) else [payload]:
+        try: frames.append(encoder.encode(record))
+        except (KeyError, TypeError, ValueError): pass
+    return frames
 
 @app.route('/stream')
 def stream():
+    """SSE 实时推送。?encoding=delta 时每个连接按设备增量编码 (codec.DeltaEncoder)，以 delta 事件发送紧凑数组"""
+    encoder = codec.DeltaEncoder() if request.args.get('encoding') == 'delta' else None
     def event_stream():
         r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True); pubsub = r.pubsub(); pubsub.subscribe(REDIS_CHANNEL)
-        print(f"✅ 新Web客户端已订阅Redis频道 '{REDIS_CHANNEL}'");
+        log.info("✅ 新Web客户端已订阅Redis频道 '%s'", REDIS_CHANNEL)
+        metrics.SSE_CLIENTS.inc()
         try:
             for message in pubsub.listen():
-                if message['type'] == 'message': yield f"data: {message['data']}\n\n"
-        finally: pubsub.close(); r.close(); print(f"❌ Web客户端断开连接，取消订阅。")
+                if message['type'] != 'message': continue
+                if encoder is None: yield f"data: {message['data']}\n\n"; continue
+                frames = delta_frames(encoder, message['data'])
+                if frames: yield f"event: delta\ndata: {json.dumps(frames, separators=(',', ':'), ensure_ascii=False)}\n\n"
+        finally: metrics.SSE_CLIENTS.dec(); pubsub.close(); r.close(); log.info("❌ Web客户端断开连接，取消订阅。")
     return Response(event_stream(), mimetype='text/event-stream')
 
+def handle_ws_request(data):
+    """WebSocket 上的控制请求 -> 确认消息。指令在MQTT发布后立即确认，写库由 control_writer 延迟完成
+    {"type": "control", "client_id": .., "command": "open_fan", "req": 1} / {"type": "set_auto", "client_id": .., "req": 2}"""
+    try: data = json.loads(data)
+    except ValueError: return {'type': 'ack', 'status': 'error', 'message': 'Invalid JSON'}
+    ack = {'type': 'ack', 'req': data.get('req'), 'status': 'success'}
+    client_id = data.get('client_id')
+    if not isinstance(client_id, str) or not client_id: return dict(ack, status='error', message='Missing client_id')
+    if data.get('type') == 'control': error = send_device_command(client_id, data.get('command'))
+    elif data.get('type') == 'set_auto': error = None; control_writer.submit(client_id, {'control_mode': 'auto'})
+    else: error = 'Unknown request type'
+    return dict(ack, status='error', message=error) if error else ack
+
+if sock is not None:
+    @sock.route('/ws')
+    def ws_channel(ws):
+        """一个连接同时承载实时数据 ({"type": "delta", "frames": [...]}, 同 /stream?encoding=delta) 和控制请求/确认"""
+        encoder, send_lock, closed = codec.DeltaEncoder(), threading.Lock(), threading.Event()
+        def send(message):
+            with send_lock: ws.send(json.dumps(message, separators=(',', ':'), ensure_ascii=False))
+        def forward(): # 后台线程: Redis 频道 -> WebSocket
+            r = redis.Redis(connection_pool=redis_pool); pubsub = r.pubsub(ignore_subscribe_messages=True); pubsub.subscribe(REDIS_CHANNEL)
+            try:
+                while not closed.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    frames = delta_frames(encoder, message['data']) if message else None
+                    if frames: send({'type': 'delta', 'frames': frames})
+            except ConnectionClosed: pass
+            except Exception as e: log.error("❌ WebSocket 推送失败: %s", e)
+            finally: closed.set(); pubsub.close()
+        threading.Thread(target=forward, name='ws-forward', daemon=True).start()
+        metrics.WS_CLIENTS.inc()
+        try:
+            while not closed.is_set():
+                data = ws.receive(timeout=1.0)
+                if data is not None: send(handle_ws_request(data))
+        except ConnectionClosed: pass
+        finally: closed.set(); metrics.WS_CLIENTS.dec()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render_metrics(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     create_table_if_not_exists() # 启动时确保表存在
-    if not os.path.exists('templates'): os.makedirs('templates')
-    with open('templates/index.html', 'w', encoding='utf-8') as f:
-        # 包含了ECharts图表功能的最终HTML模板
-        f.write('''
-<!DOCTYPE html>
-<html lang="zh">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>IoT Real-Time Dashboard with Charts</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <script src="https://cdn.jsdelivr.net/npm/echarts@5.5.0/dist/echarts.min.js"></script>
-    <style>
-        body { padding: 20px; background-color: #f8f9fa; }
-        .chart-container { width: 100%; height: 400px; background-color: #ffffff; border-radius: 8px; padding: 15px; margin-bottom: 25px; box-shadow: 0 4px 8px rgba(0,0,0,0.05); }
-        .table-responsive { margin-top: 20px; }
-        .temperature-high { color: #dc3545 !important; font-weight: bold; }
-        .temperature-low { color: #0d6efd !important; font-weight: bold; }
-        .light-low { color: #6f42c1 !important; font-weight: bold; }
-        .status-indicator { width: 15px; height: 15px; border-radius: 50%; display: inline-block; }
-        .status-on { background-color: #198754; } .status-off { background-color: #6c757d; }
-        .mode-manual { background-color: #ffc107; color: black; }
-        .mode-auto { background-color: #0dcaf0; color: black; }
-        .history-row td { color: #6c757d; opacity: 0.7; }
-        .new-row { background-color: #d1e7dd !important; transition: background-color 1s ease-out; }
-    </style>
-</head>
-<body>
-    <div class="container-fluid">
-        <h1 class="mb-4 text-center">IoT 实时数据监控面板</h1>
-        <div id="charts-area"></div>
-        <h2 class="mt-5 mb-3">实时数据表格</h2>
-        <div class="table-responsive">
-            <table class="table table-striped table-hover">
-                <thead class="table-dark"><tr><th>设备ID</th><th>温度 (°C)</th><th>湿度 (%)</th><th>光照 (lux)</th><th>风扇控制</th><th>补光灯控制</th><th>控制模式</th><th>时间戳</th></tr></thead>
-                <tbody id="data-table-body">
-                {% if readings %}{% for reading in readings %}<tr class="{% if not reading.is_latest %}history-row{% endif %}" data-client-id="{{ reading.client_id }}" data-record-id="{{ reading.id }}"><td>{{ reading.client_id }}</td><td class="temp-cell {{ reading.temp_class }}">{{ "%.2f"|format(reading.temperature) }}</td><td class="hum-cell">{{ "%.1f"|format(reading.humidity) }}</td><td class="light-cell {{ reading.light_class }}">{{ "%.1f"|format(reading.light_intensity) }}</td><td class="fan-control-cell">{% if reading.is_latest %}<div class="d-flex align-items-center"><span class="status-indicator me-2 {% if reading.fan_status %}status-on{% else %}status-off{% endif %}"></span><button class="btn btn-sm btn-outline-primary btn-control fan-btn" data-command="{{ 'close_fan' if reading.fan_status else 'open_fan' }}">{{ "关闭风扇" if reading.fan_status else "开启风扇" }}</button></div>{% else %}<span class="badge bg-secondary">{{ '开启' if reading.fan_status else '关闭' }}</span>{% endif %}</td><td class="light-control-cell">{% if reading.is_latest %}<div class="d-flex align-items-center"><span class="status-indicator me-2 {% if reading.light_status %}status-on{% else %}status-off{% endif %}"></span><button class="btn btn-sm btn-outline-primary btn-control light-btn" data-command="{{ 'close_light' if reading.light_status else 'open_light' }}">{{ "关闭补光灯" if reading.light_status else "开启补光灯" }}</button></div>{% else %}<span class="badge bg-secondary">{{ '开启' if reading.light_status else '关闭' }}</span>{% endif %}</td><td class="mode-cell"><span class="badge rounded-pill {{ 'mode-manual' if reading.control_mode == 'manual' else 'mode-auto' }}">{{ '手动' if reading.control_mode == 'manual' else '自动' }}</span>{% if reading.is_latest and reading.control_mode == 'manual' %}<button class="btn btn-sm btn-outline-success ms-2 auto-btn">恢复自动</button>{% endif %}</td><td class="timestamp-cell">{{ reading.timestamp_str }}</td></tr>{% endfor %}{% endif %}
-                </tbody>
-            </table>
-        </div>
-    </div>
-    <script>
-        const initialChartData = JSON.parse({{ chart_data | tojson | safe }});
-        const chartInstances = {};
-        document.addEventListener('DOMContentLoaded', function() {
-            const chartsArea = document.getElementById('charts-area');
-            for (const deviceId in initialChartData) {
-                const chartWrapper = document.createElement('div');
-                chartWrapper.innerHTML = `<h2>设备 ${deviceId} - 实时数据图表</h2>`;
-                const chartDom = document.createElement('div');
-                chartDom.id = `chart-${deviceId}`; chartDom.className = 'chart-container';
-                chartWrapper.appendChild(chartDom); chartsArea.appendChild(chartWrapper);
-                const myChart = echarts.init(chartDom);
-                const data = initialChartData[deviceId];
-                myChart.setOption({tooltip: { trigger: 'axis' },legend: { data: ['温度', '湿度', '光照强度'] },grid: { left: '3%', right: '4%', bottom: '3%', containLabel: true },xAxis: { type: 'category', boundaryGap: false, data: data.labels },yAxis: [ { type: 'value', name: '温度/湿度' }, { type: 'value', name: '光照', position: 'right' } ],series: [{ name: '温度', type: 'line', smooth: true, data: data.temperatures },{ name: '湿度', type: 'line', smooth: true, data: data.humidities },{ name: '光照强度', type: 'line', smooth: true, yAxisIndex: 1, data: data.lights }]});
-                chartInstances[deviceId] = myChart;
-            }
-            const eventSource = new EventSource("/stream");
-            eventSource.onmessage = function(event) {
-                const newData = JSON.parse(event.data);
-                if (newData.error) return;
-                console.log("新数据已接收:", newData);
-                updateTable(newData); updateChart(newData);
-            };
-            const tableBody = document.getElementById('data-table-body');
-            tableBody.addEventListener('click', function(event) {
-                const button = event.target.closest('button'); if (!button) return;
-                const row = button.closest('tr'); if (!row) return;
-                const clientId = row.dataset.clientId;
-                if (button.classList.contains('fan-btn') || button.classList.contains('light-btn')) {
-                    sendRequest('/control', { client_id: clientId, command: button.dataset.command });
-                } else if (button.classList.contains('auto-btn')) { sendRequest('/set_auto', { client_id: clientId }); }
-            });
-        });
-        function updateChart(data) {
-            let chart = chartInstances[data.client_id];
-            if (!chart) { /* 如果是新设备，则动态创建图表 */ return; }
-            const option = chart.getOption();
-            const [labels, temps, hums, lights] = [option.xAxis[0].data, option.series[0].data, option.series[1].data, option.series[2].data];
-            labels.push(new Date(data.timestamp).toLocaleTimeString()); temps.push(data.temperature); hums.push(data.humidity); lights.push(data.light_intensity);
-            if (labels.length > 30) { labels.shift(); temps.shift(); hums.shift(); lights.shift(); }
-            chart.setOption({xAxis: { data: labels },series: [{ data: temps }, { data: hums }, { data: lights }]});
-        }
-        function updateTable(data) {
-            const tableBody = document.getElementById('data-table-body');
-            let rowToUpdate = tableBody.querySelector(`tr[data-client-id="${data.client_id}"]:not(.history-row)`);
-            if(rowToUpdate) {
-                rowToUpdate.classList.add('history-row');
-                rowToUpdate.querySelector('.fan-control-cell').innerHTML = `<span class="badge bg-secondary">${rowToUpdate.querySelector('.fan-control-cell .status-indicator')?.classList.contains('status-on') ? '开启' : '关闭'}</span>`;
-                rowToUpdate.querySelector('.light-control-cell').innerHTML = `<span class="badge bg-secondary">${rowToUpdate.querySelector('.light-control-cell .status-indicator')?.classList.contains('status-on') ? '开启' : '关闭'}</span>`;
-                rowToUpdate.querySelector('.mode-cell button')?.remove();
-            }
-            const newRow = document.createElement('tr');
-            newRow.dataset.clientId = data.client_id; newRow.dataset.recordId = data.id; newRow.classList.add('new-row');
-            const tempClass = parseFloat(data.temperature) >= 30 ? 'temperature-high' : (parseFloat(data.temperature) <= 25 ? 'temperature-low' : '');
-            const lightClass = parseFloat(data.light_intensity) < 50 ? 'light-low' : '';
-            const fanCtrl = `<div class="d-flex align-items-center"><span class="status-indicator me-2 ${data.fan_status ? 'status-on' : 'status-off'}"></span><button class="btn btn-sm btn-outline-primary fan-btn" data-command="${data.fan_status ? 'close_fan' : 'open_fan'}">${data.fan_status ? '关闭风扇' : '开启风扇'}</button></div>`;
-            const lightCtrl = `<div class="d-flex align-items-center"><span class="status-indicator me-2 ${data.light_status ? 'status-on' : 'status-off'}"></span><button class="btn btn-sm btn-outline-primary light-btn" data-command="${data.light_status ? 'close_light' : 'open_light'}">${data.light_status ? '关闭补光灯' : '开启补光灯'}</button></div>`;
-            let modeHtml = `<span class="badge rounded-pill ${data.control_mode === 'manual' ? 'mode-manual' : 'mode-auto'}">${data.control_mode === 'manual' ? '手动' : '自动'}</span>`;
-            if (data.control_mode === 'manual') modeHtml += ` <button class="btn btn-sm btn-outline-success ms-2 auto-btn">恢复自动</button>`;
-            newRow.innerHTML = `<td>${data.client_id}</td><td class="temp-cell ${tempClass}">${parseFloat(data.temperature).toFixed(2)}</td><td class="hum-cell">${parseFloat(data.humidity).toFixed(1)}</td><td class="light-cell ${lightClass}">${parseFloat(data.light_intensity).toFixed(1)}</td><td class="fan-control-cell">${fanCtrl}</td><td class="light-control-cell">${lightCtrl}</td><td class="mode-cell">${modeHtml}</td><td class="timestamp-cell">${new Date(data.timestamp).toLocaleString()}</td>`;
-            tableBody.prepend(newRow);
-            setTimeout(() => newRow.classList.remove('new-row'), 1000);
-        }
-        function sendRequest(endpoint, body) {
-            fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) })
-            .then(res => res.json()).then(data => { if(data.status !== 'success' && data.message) alert('操作失败: ' + data.message); })
-            .catch(error => console.error('Error:', error));
-        }
-    </script>
-</body>
-</html>''')
-    
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file